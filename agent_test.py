@@ -1,8 +1,7 @@
 import os
 
-from langgraph.checkpoint.postgres import PostgresSaver
-
 from app.agents.bot_agent import GenericAgentBot
+from app.agents.checkpoint_store import open_postgres_saver, CheckpointRetention
 
 
 def query_weather(city: str) -> str:
@@ -33,8 +32,9 @@ if __name__ == '__main__':
     )
     system_prompt = """You are a helpful assistant. Be concise and accurate."""
 
-    with PostgresSaver.from_conn_string(postgres_conn_str) as saver:
+    with open_postgres_saver(postgres_conn_str) as saver:
         saver.setup()
+        CheckpointRetention.for_saver(saver, keep=5).start_background()
         agent = GenericAgentBot(
             system_prompt,
             'deepseek-chat',
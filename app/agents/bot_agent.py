@@ -1,3 +1,4 @@
+import logging
 from datetime import datetime, timezone
 from typing import Sequence, Optional, List, Dict, Literal
 
@@ -9,23 +10,45 @@ from langgraph.checkpoint.base import BaseCheckpointSaver
 from langgraph.checkpoint.memory import InMemorySaver
 from langgraph.graph.state import CompiledStateGraph
 
+from app.agents.compaction import ContextCompactionMiddleware
+from app.agents.fake_llm import FakeChatModel
+from app.agents.scheduler import LLMScheduler, SchedulerMiddleware, default_scheduler
+from app.agents.tool_executor import ToolExecutionMiddleware
+from app.agents.tracing import AgentTrace, TimedCheckpointSaver
 from app.schemas.agent_schema import ModelOutput, ModelContext, ToolType, ChatMessage, ReasoningStep, ToolCall
 
+_logger = logging.getLogger(__name__)
 
 class GenericAgentBot:
     def __init__(
             self,
             system_prompt: str,
             model_name: str,  # 改名以明确这是字符串
-            model_provider: Literal['deepseek', 'ollama'] = "ollama",  # 新增 provider
+            model_provider: Literal['deepseek', 'ollama', 'fake'] = "ollama",  # fake 为离线脚本模型，model_name 为脚本路径
             tools: Optional[Sequence[ToolType]] = None,
             checkpointer: Optional[BaseCheckpointSaver] = None,  # 使用基类类型注解
+            tool_executor: Optional[ToolExecutionMiddleware] = None,  # 工具执行策略（超时/缓存/耗时）
+            compaction: Optional[ContextCompactionMiddleware] = None,  # 上下文压缩策略
+            scheduler: Optional[LLMScheduler] = None,  # 模型调用调度器，默认进程内共享
     ):
         self.tools: List[ToolType] = list(tools) if tools is not None else []
-        self.checkpointer = checkpointer or InMemorySaver()
+        # 包装一层计时代理，checkpoint 读写耗时计入调用 trace
+        self.checkpointer = TimedCheckpointSaver(checkpointer or InMemorySaver())
+        self.tool_executor = tool_executor or ToolExecutionMiddleware()
 
         # 1. 修正：在此处初始化模型对象
-        self.llm = init_chat_model(model_name, model_provider=model_provider)
+        if model_provider == "fake":
+            self.llm = FakeChatModel.from_name(model_name)
+        else:
+            self.llm = init_chat_model(model_name, model_provider=model_provider)
+
+        # 未指定摘要模型时复用对话模型
+        self.compaction = compaction or ContextCompactionMiddleware()
+        if self.compaction.summary_model is None:
+            self.compaction.summary_model = self.llm
+        self.scheduler = scheduler or default_scheduler
+        if self.compaction.scheduler is None:
+            self.compaction.scheduler, self.compaction.provider = self.scheduler, model_provider
 
         # 2. 修正：create_agent 返回的本质是 Runnable (CompiledGraph)
         # 注意：这里假设 create_agent 是你封装好或者是 langgraph.prebuilt 的功能
@@ -36,57 +59,84 @@ class GenericAgentBot:
             context_schema=ModelContext,
             response_format=ToolStrategy(ModelOutput),
             checkpointer=self.checkpointer,
+            middleware=[
+                self.compaction,
+                SchedulerMiddleware(self.scheduler, model_provider),
+                self.tool_executor,
+            ],
         )
 
-    def invoke(
-            self,
-            message: str,
-            context: Optional[ModelContext] = None,
-            thread_id: str = "default",
-    ) -> ModelOutput:
+    def _build_input(self, message: str, context: Optional[ModelContext], thread_id: str):
         config = {"configurable": {"thread_id": thread_id}}
         if context is None:
             context = ModelContext(user_id=0)
 
-        from datetime import datetime, timezone
-        from langchain_core.messages import HumanMessage, AIMessage
-
         current_ts = datetime.now(timezone.utc).isoformat()
         human_msg = HumanMessage(
             content=message,
             additional_kwargs={"timestamp": current_ts}
         )
+        return {"messages": [human_msg]}, config, context
+
+    @staticmethod
+    def _parse_output(response: dict) -> ModelOutput:
+        messages = response.get("messages", [])
+        last_ai_msg = next((m for m in reversed(messages) if isinstance(m, AIMessage)), None)
+
+        if not last_ai_msg:
+            return ModelOutput(text="未收到回复", sections=[])
+        if last_ai_msg.tool_calls:
+            for tc in last_ai_msg.tool_calls:
+                if tc["name"] == "ModelOutput":
+                    try:
+                        return ModelOutput(**tc["args"])
+                    except Exception as e:
+                        _logger.warning("结构化输出解析失败: %s", e)
+        content = last_ai_msg.content if last_ai_msg.content else ""
+        if not content and last_ai_msg.tool_calls:
+            tool_names = ", ".join([tc["name"] for tc in last_ai_msg.tool_calls])
+            content = f"[正在调用工具: {tool_names}]"
+
+        return ModelOutput(text=str(content), sections=[])
 
+    def invoke(
+            self,
+            message: str,
+            context: Optional[ModelContext] = None,
+            thread_id: str = "default",
+    ) -> ModelOutput:
+        graph_input, config, context = self._build_input(message, context, thread_id)
+        trace = AgentTrace(thread_id, context.user_id)
+        config["callbacks"] = [trace]
+        try:
+            with trace:
+                # 2. 执行 Graph
+                response = self.graph.invoke(graph_input, config=config, context=context)
+            return self._parse_output(response)
+
+        except Exception as e:
+            _logger.exception("Agent 调用失败 (thread_id=%s, trace_id=%s)", thread_id, trace.trace_id)
+            return ModelOutput(text=f"系统错误: {str(e)}", sections=[])
+
+    async def ainvoke(
+            self,
+            message: str,
+            context: Optional[ModelContext] = None,
+            thread_id: str = "default",
+    ) -> ModelOutput:
+        """
+        异步执行，异步工具直接在事件循环上并发运行
+        """
+        graph_input, config, context = self._build_input(message, context, thread_id)
+        trace = AgentTrace(thread_id, context.user_id)
+        config["callbacks"] = [trace]
         try:
-            # 2. 执行 Graph
-            response = self.graph.invoke(
-                {"messages": [human_msg]},
-                config=config,
-                context=context,
-            )
-            messages = response.get("messages", [])
-            last_ai_msg = next((m for m in reversed(messages) if isinstance(m, AIMessage)), None)
-
-            if not last_ai_msg:
-                return ModelOutput(text="未收到回复", sections=[])
-            if last_ai_msg.tool_calls:
-                for tc in last_ai_msg.tool_calls:
-                    if tc["name"] == "ModelOutput":
-                        try:
-                            return ModelOutput(**tc["args"])
-                        except Exception as e:
-                            print(f"结构化输出解析失败: {e}")
-                            pass
-            content = last_ai_msg.content if last_ai_msg.content else ""
-            if not content and last_ai_msg.tool_calls:
-                tool_names = ", ".join([tc["name"] for tc in last_ai_msg.tool_calls])
-                content = f"[正在调用工具: {tool_names}]"
-
-            return ModelOutput(text=str(content), sections=[])
+            with trace:
+                response = await self.graph.ainvoke(graph_input, config=config, context=context)
+            return self._parse_output(response)
 
         except Exception as e:
-            import traceback
-            traceback.print_exc()
+            _logger.exception("Agent 调用失败 (thread_id=%s, trace_id=%s)", thread_id, trace.trace_id)
             return ModelOutput(text=f"系统错误: {str(e)}", sections=[])
 
     def get_messages(self, thread_id: str = "default") -> List[ChatMessage]:
@@ -197,8 +247,12 @@ class GenericAgentBot:
                 # 根据 tool_call_id 找到对应的步骤，更新 output
                 tc_id = msg.tool_call_id
                 if tc_id in temp_steps_buffer:
-                    temp_steps_buffer[tc_id].tool_output = msg.content
-                    temp_steps_buffer[tc_id].status = "completed"
+                    step = temp_steps_buffer[tc_id]
+                    step.tool_output = msg.content
+                    step.status = "failed" if msg.status == "error" else "completed"
+                    # ToolExecutionMiddleware 记录的实际开始时间与耗时
+                    step.timestamp = msg.additional_kwargs.get("timestamp") or step.timestamp
+                    step.latency_ms = msg.additional_kwargs.get("latency_ms")
 
         return final_messages
 
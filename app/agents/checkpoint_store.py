@@ -0,0 +1,287 @@
+"""
+LangGraph checkpoint 存储治理：紧凑序列化、按线程保留最近 N 个 checkpoint、后台批量清理、存储占用报告
+
+命令行：
+    python -m app.agents.checkpoint_store report "<conn_str>" [--thread-id 4] [--limit 20]
+    python -m app.agents.checkpoint_store prune "<conn_str>" --keep 5
+"""
+import inspect
+import logging
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Iterator, List, Optional, Tuple
+
+from langgraph.checkpoint.postgres import PostgresSaver
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+from psycopg import Connection
+from psycopg.rows import dict_row
+from psycopg_pool import ConnectionPool
+
+_logger = logging.getLogger(__name__)
+
+COMPRESSED_SUFFIX = "+zlib"
+
+# 结构化输出模型会被写入 checkpoint，显式加入 msgpack 白名单（仅支持该参数的 langgraph-checkpoint 版本）
+ALLOWED_MSGPACK_MODULES = [("app.schemas.agent_schema", "ModelOutput")]
+_SUPPORTS_MSGPACK_ALLOWLIST = "allowed_msgpack_modules" in inspect.signature(JsonPlusSerializer.__init__).parameters
+
+
+class CompactSerializer(JsonPlusSerializer):
+    """
+    在 JsonPlusSerializer（msgpack）基础上，对超过阈值的数据做 zlib 压缩，
+    类型名追加 +zlib 后缀，未压缩的旧数据仍可正常读取
+    """
+
+    def __init__(self, threshold: int = 1024, level: int = 6, **kwargs):
+        if _SUPPORTS_MSGPACK_ALLOWLIST:
+            kwargs.setdefault("allowed_msgpack_modules", ALLOWED_MSGPACK_MODULES)
+        super().__init__(**kwargs)
+        self.threshold = threshold
+        self.level = level
+
+    def dumps_typed(self, obj: Any) -> Tuple[str, bytes]:
+        type_, data = super().dumps_typed(obj)
+        if len(data) < self.threshold:
+            return type_, data
+        return type_ + COMPRESSED_SUFFIX, zlib.compress(data, self.level)
+
+    def loads_typed(self, data: Tuple[str, bytes]) -> Any:
+        type_, payload = data
+        if type_.endswith(COMPRESSED_SUFFIX):
+            return super().loads_typed((type_[:-len(COMPRESSED_SUFFIX)], zlib.decompress(payload)))
+        return super().loads_typed(data)
+
+
+@contextmanager
+def open_postgres_saver(conn_string: str, serde: Optional[JsonPlusSerializer] = None) -> Iterator[PostgresSaver]:
+    """
+    与 PostgresSaver.from_conn_string 相同的连接参数，额外支持指定序列化器（默认 CompactSerializer）
+    """
+    with Connection.connect(conn_string, autocommit=True, prepare_threshold=0, row_factory=dict_row) as conn:
+        yield PostgresSaver(conn, serde=serde or CompactSerializer())
+
+
+@dataclass
+class PruneResult:
+    thread_id: str
+    checkpoints: int = 0
+    writes: int = 0
+    blobs: int = 0
+
+
+@dataclass
+class ThreadStorage:
+    thread_id: str
+    checkpoints: int
+    checkpoint_bytes: int
+    blob_bytes: int
+    write_bytes: int
+
+    @property
+    def total_bytes(self) -> int:
+        return self.checkpoint_bytes + self.blob_bytes + self.write_bytes
+
+
+# 每个 (thread_id, checkpoint_ns) 只保留 checkpoint_id 最大（uuid6，按时间递增）的 keep 个
+DELETE_CHECKPOINTS_SQL = """
+    WITH doomed AS (
+        SELECT checkpoint_ns, checkpoint_id FROM (
+            SELECT checkpoint_ns, checkpoint_id,
+                   row_number() OVER (PARTITION BY checkpoint_ns ORDER BY checkpoint_id DESC) AS rn
+            FROM checkpoints WHERE thread_id = %(thread_id)s
+        ) ranked WHERE rn > %(keep)s
+    ), deleted_writes AS (
+        DELETE FROM checkpoint_writes w USING doomed d
+        WHERE w.thread_id = %(thread_id)s AND w.checkpoint_ns = d.checkpoint_ns AND w.checkpoint_id = d.checkpoint_id
+        RETURNING 1
+    ), deleted_checkpoints AS (
+        DELETE FROM checkpoints c USING doomed d
+        WHERE c.thread_id = %(thread_id)s AND c.checkpoint_ns = d.checkpoint_ns AND c.checkpoint_id = d.checkpoint_id
+        RETURNING 1
+    )
+    SELECT (SELECT count(*) FROM deleted_checkpoints) AS checkpoints,
+           (SELECT count(*) FROM deleted_writes) AS writes
+"""
+
+# channel version 是定长补零的递增字符串，只删除比所有保留 checkpoint 引用版本都旧的 blob，
+# 不会误删正在写入的新 checkpoint 的 blob
+DELETE_BLOBS_SQL = """
+    DELETE FROM checkpoint_blobs b
+    USING (
+        SELECT c.checkpoint_ns, v.key AS channel, min(v.value) AS min_version
+        FROM checkpoints c, jsonb_each_text(c.checkpoint -> 'channel_versions') v
+        WHERE c.thread_id = %(thread_id)s
+        GROUP BY c.checkpoint_ns, v.key
+    ) live
+    WHERE b.thread_id = %(thread_id)s
+      AND b.checkpoint_ns = live.checkpoint_ns
+      AND b.channel = live.channel
+      AND b.version < live.min_version
+"""
+
+CANDIDATE_THREADS_SQL = """
+    SELECT thread_id FROM checkpoints
+    WHERE thread_id > %(after)s
+    GROUP BY thread_id
+    HAVING count(*) > %(keep)s
+    ORDER BY thread_id
+    LIMIT %(limit)s
+"""
+
+STORAGE_SQL = """
+    SELECT thread_id,
+           sum(checkpoints)::bigint AS checkpoints,
+           sum(checkpoint_bytes)::bigint AS checkpoint_bytes,
+           sum(blob_bytes)::bigint AS blob_bytes,
+           sum(write_bytes)::bigint AS write_bytes
+    FROM (
+        SELECT thread_id, count(*) AS checkpoints,
+               sum(pg_column_size(checkpoint) + pg_column_size(metadata)) AS checkpoint_bytes,
+               0 AS blob_bytes, 0 AS write_bytes
+        FROM checkpoints {where} GROUP BY thread_id
+        UNION ALL
+        SELECT thread_id, 0, 0, sum(coalesce(pg_column_size(blob), 0)), 0
+        FROM checkpoint_blobs {where} GROUP BY thread_id
+        UNION ALL
+        SELECT thread_id, 0, 0, 0, sum(pg_column_size(blob))
+        FROM checkpoint_writes {where} GROUP BY thread_id
+    ) s
+    GROUP BY thread_id
+    ORDER BY sum(checkpoint_bytes) + sum(blob_bytes) + sum(write_bytes) DESC
+    LIMIT %(limit)s
+"""
+
+
+class CheckpointRetention:
+    """
+    checkpoint 保留策略：每个线程只保留最近 keep 个 checkpoint，并回收不再被引用的 blob
+    """
+
+    def __init__(self, conn: Any, keep: int = 5, batch_size: int = 100, batch_pause: float = 0.5,
+                 lock: Optional[threading.Lock] = None):
+        """
+        :param conn: psycopg Connection 或 ConnectionPool（与 PostgresSaver 相同）
+        :param keep: 每个线程保留的 checkpoint 数量，至少为 1
+        :param batch_size: 后台清理时每批处理的线程数
+        :param batch_pause: 批次之间的间隔（秒），降低对在线写入的影响
+        :param lock: 单连接时与其他使用者共享的锁（例如 PostgresSaver.lock），同一时刻只有一个线程使用该连接
+        """
+        assert keep >= 1, 'keep 至少为 1'
+        self.conn = conn
+        self.lock = lock or threading.Lock()
+        self.keep = keep
+        self.batch_size = batch_size
+        self.batch_pause = batch_pause
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @classmethod
+    def for_saver(cls, saver: PostgresSaver, **kwargs) -> "CheckpointRetention":
+        """
+        复用 PostgresSaver 的连接；单连接时通过 saver.lock 与 saver 串行使用
+        """
+        return cls(saver.conn, lock=saver.lock, **kwargs)
+
+    @contextmanager
+    def _cursor(self):
+        if isinstance(self.conn, ConnectionPool):
+            with self.conn.connection() as conn, conn.transaction(), conn.cursor(row_factory=dict_row) as cur:
+                yield cur
+        else:
+            with self.lock, self.conn.transaction(), self.conn.cursor(row_factory=dict_row) as cur:
+                yield cur
+
+    def prune_thread(self, thread_id: str) -> PruneResult:
+        result = PruneResult(thread_id=thread_id)
+        params = {"thread_id": thread_id, "keep": self.keep}
+        with self._cursor() as cur:
+            cur.execute(DELETE_CHECKPOINTS_SQL, params)
+            row = cur.fetchone()
+            result.checkpoints, result.writes = row["checkpoints"], row["writes"]
+            cur.execute(DELETE_BLOBS_SQL, params)
+            result.blobs = cur.rowcount
+        return result
+
+    def prune_all(self, max_batches: Optional[int] = None) -> List[PruneResult]:
+        """
+        分批清理所有超过保留数量的线程
+        :param max_batches: 最多处理的批次数，为空表示处理到底
+        """
+        results: List[PruneResult] = []
+        after, batches = "", 0
+        while not self._stop.is_set():
+            with self._cursor() as cur:
+                cur.execute(CANDIDATE_THREADS_SQL, {"after": after, "keep": self.keep, "limit": self.batch_size})
+                thread_ids = [row["thread_id"] for row in cur.fetchall()]
+            if not thread_ids:
+                break
+            for thread_id in thread_ids:
+                results.append(self.prune_thread(thread_id))
+            after = thread_ids[-1]
+            batches += 1
+            if max_batches is not None and batches >= max_batches:
+                break
+            time.sleep(self.batch_pause)
+        return results
+
+    def start_background(self, interval: float = 600.0):
+        """
+        启动后台清理线程
+        :param interval: 两轮清理之间的间隔（秒）
+        """
+        if self._thread and self._thread.is_alive():
+            return
+
+        def run():
+            while not self._stop.is_set():
+                try:
+                    results = self.prune_all()
+                    if results:
+                        _logger.info("checkpoint 清理完成: 线程 %d, checkpoint %d, blob %d",
+                                     len(results), sum(r.checkpoints for r in results), sum(r.blobs for r in results))
+                except Exception:
+                    _logger.exception("checkpoint 清理失败")
+                self._stop.wait(interval)
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=run, name="checkpoint-retention", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+
+    def thread_storage(self, thread_id: Optional[str] = None, limit: int = 20) -> List[ThreadStorage]:
+        """
+        统计每个线程的存储占用（按总字节数倒序）
+        """
+        where = "WHERE thread_id = %(thread_id)s" if thread_id else ""
+        with self._cursor() as cur:
+            cur.execute(STORAGE_SQL.format(where=where), {"thread_id": thread_id, "limit": limit})
+            return [ThreadStorage(**row) for row in cur.fetchall()]
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="checkpoint 存储治理")
+    parser.add_argument("command", choices=["report", "prune"])
+    parser.add_argument("conn_str", help="PostgreSQL 连接串，例如 host=localhost dbname=bot_agent user=postgres")
+    parser.add_argument("--thread-id", default=None)
+    parser.add_argument("--keep", type=int, default=5)
+    parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+
+    with Connection.connect(args.conn_str, autocommit=True) as connection:
+        retention = CheckpointRetention(connection, keep=args.keep)
+        if args.command == "prune":
+            pruned = [retention.prune_thread(args.thread_id)] if args.thread_id else retention.prune_all()
+            for r in pruned:
+                print(f"{r.thread_id}: checkpoints={r.checkpoints} writes={r.writes} blobs={r.blobs}")
+        for s in retention.thread_storage(args.thread_id, args.limit):
+            print(f"{s.thread_id}\tcheckpoints={s.checkpoints}\ttotal={s.total_bytes / 1024:.1f}KB\t"
+                  f"(checkpoint={s.checkpoint_bytes} blob={s.blob_bytes} write={s.write_bytes})")
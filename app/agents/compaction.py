@@ -0,0 +1,197 @@
+import logging
+from typing import Annotated, Any, Callable, Awaitable, Dict, List, Optional, Tuple
+
+from langchain.agents.middleware import AgentMiddleware, AgentState, ModelRequest, ModelResponse
+from langchain.agents.middleware.types import PrivateStateAttr
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import BaseMessage, HumanMessage, ToolMessage, AIMessage
+from langchain_core.messages.utils import count_tokens_approximately, get_buffer_string
+from langgraph.runtime import Runtime
+from typing_extensions import NotRequired
+
+from app.agents.scheduler import LLMScheduler, Priority
+
+_logger = logging.getLogger(__name__)
+
+SUMMARY_PROMPT = (
+    "请将下面的对话历史压缩为一段简洁的摘要，保留用户的目标、已确认的事实、工具调用得到的关键结果以及尚未完成的事项。"
+    "只输出摘要正文。\n\n"
+    "已有摘要：\n{summary}\n\n"
+    "新增对话：\n{history}"
+)
+
+
+class CompactionState(AgentState):
+    """
+    压缩进度保存在图状态中，随 checkpoint 持久化：进程内不保存按线程的数据，多个进程看到相同的摘要
+    """
+    # 已被摘要覆盖的原始消息数量（checkpoint 中的消息只追加，因此用下标即可）
+    compaction_covered: NotRequired[Annotated[int, PrivateStateAttr]]
+    compaction_summary: NotRequired[Annotated[str, PrivateStateAttr]]
+
+
+class ContextCompactionMiddleware(AgentMiddleware[CompactionState, Any]):
+    """
+    上下文压缩：只改写发送给模型的消息，checkpoint 中保留完整的原始历史，
+    因此 get_messages / get_full_messages 不受影响
+
+    - 按压缩后的上下文（摘要 + 未被摘要覆盖的消息）估算 token 数
+    - 超过 max_tokens 后，将较早的轮次滚动摘要为一条消息，仅保留最近 keep_last_turns 轮
+      （before_model 中生成摘要并写入图状态，wrap_model_call 中按状态改写消息）
+    - 超长的 ToolMessage 输出截断为 tool_output_max_chars
+    - 摘要调用与对话调用一样经过 LLMScheduler 排队
+    """
+    state_schema = CompactionState
+
+    def __init__(
+            self,
+            max_tokens: int = 8000,
+            keep_last_turns: int = 3,
+            tool_output_max_chars: int = 2000,
+            summary_model: Optional[BaseChatModel] = None,
+            scheduler: Optional[LLMScheduler] = None,
+            provider: str = "default",
+    ):
+        """
+        :param scheduler: 摘要调用使用的调度器，为空时直接调用模型
+        :param provider: 摘要模型的供应商，对应调度器中的并发限制
+        """
+        super().__init__()
+        self.max_tokens = max_tokens
+        self.keep_last_turns = keep_last_turns
+        self.tool_output_max_chars = tool_output_max_chars
+        self.summary_model = summary_model
+        self.scheduler = scheduler
+        self.provider = provider
+
+    def before_model(self, state: CompactionState, runtime: Runtime) -> Optional[Dict[str, Any]]:
+        messages, covered, summary = self._progress(state)
+        head = self._pending_summary(messages, covered, summary)
+        if head:
+            summary, covered = self._summarize(summary, head), covered + len(head)
+        return self._update(state, covered, summary)
+
+    async def abefore_model(self, state: CompactionState, runtime: Runtime) -> Optional[Dict[str, Any]]:
+        messages, covered, summary = self._progress(state)
+        head = self._pending_summary(messages, covered, summary)
+        if head:
+            summary, covered = await self._asummarize(summary, head, runtime), covered + len(head)
+        return self._update(state, covered, summary)
+
+    def wrap_model_call(self, request: ModelRequest, handler: Callable[[ModelRequest], ModelResponse]) -> ModelResponse:
+        return handler(self._apply(request))
+
+    async def awrap_model_call(
+            self,
+            request: ModelRequest,
+            handler: Callable[[ModelRequest], Awaitable[ModelResponse]],
+    ) -> ModelResponse:
+        return await handler(self._apply(request))
+
+    # -----------------------
+    # 内部方法
+    # -----------------------
+    @staticmethod
+    def _progress(state: CompactionState) -> Tuple[List[BaseMessage], int, str]:
+        messages = state["messages"]
+        covered, summary = state.get("compaction_covered", 0), state.get("compaction_summary", "")
+        if covered > len(messages):
+            # 线程历史被重置，摘要作废
+            covered, summary = 0, ""
+        return messages, covered, summary
+
+    @staticmethod
+    def _update(state: CompactionState, covered: int, summary: str) -> Optional[Dict[str, Any]]:
+        if covered == state.get("compaction_covered", 0) and summary == state.get("compaction_summary", ""):
+            return None
+        return {"compaction_covered": covered, "compaction_summary": summary}
+
+    def _pending_summary(self, messages: List[BaseMessage], covered: int, summary: str) -> List[BaseMessage]:
+        """
+        返回本次需要并入摘要的消息（从已覆盖位置到保留区起点）；
+        按实际发送给模型的内容（摘要 + 未覆盖的消息）估算 token 数，没有摘要模型时不压缩
+        """
+        if self.summary_model is None:
+            # 没有摘要模型时推进 covered 会直接丢掉这些轮次
+            return []
+        if count_tokens_approximately(self._compacted(messages, covered, summary)) <= self.max_tokens:
+            return []
+        cut = self._tail_start(messages)
+        if cut <= covered:
+            return []
+        return [self._trim_tool_output(m) for m in messages[covered:cut]]
+
+    def _tail_start(self, messages: List[BaseMessage]) -> int:
+        """
+        保留区从倒数第 keep_last_turns 条 HumanMessage 开始，保证 tool_call 与 ToolMessage 不被拆开
+        """
+        human_indexes = [i for i, m in enumerate(messages) if isinstance(m, HumanMessage)]
+        if len(human_indexes) <= self.keep_last_turns:
+            return 0
+        return human_indexes[-self.keep_last_turns]
+
+    def _compacted(self, messages: List[BaseMessage], covered: int, summary: str) -> List[BaseMessage]:
+        """
+        摘要消息 + 未被摘要覆盖的消息（超长工具输出已截断）
+        """
+        kept = [self._trim_tool_output(m) for m in messages[covered:]]
+        if summary:
+            kept.insert(0, HumanMessage(
+                content=f"以下是之前对话的摘要：\n{summary}",
+                additional_kwargs={"compaction_summary": True},
+            ))
+        return kept
+
+    def _apply(self, request: ModelRequest) -> ModelRequest:
+        messages = request.messages
+        covered, summary = request.state.get("compaction_covered", 0), request.state.get("compaction_summary", "")
+        if covered > len(messages):
+            covered, summary = 0, ""
+        kept = self._compacted(messages, covered, summary)
+        if _logger.isEnabledFor(logging.DEBUG):
+            _logger.debug("上下文压缩: %d -> %d tokens",
+                          count_tokens_approximately(messages), count_tokens_approximately(kept))
+        return request.override(messages=kept)
+
+    def _trim_tool_output(self, message: BaseMessage) -> BaseMessage:
+        if not isinstance(message, ToolMessage):
+            return message
+        content = message.content if isinstance(message.content, str) else str(message.content)
+        if len(content) <= self.tool_output_max_chars:
+            return message
+        omitted = len(content) - self.tool_output_max_chars
+        return message.model_copy(update={
+            "content": f"{content[:self.tool_output_max_chars]}\n...[已截断 {omitted} 个字符]"
+        })
+
+    def _summary_input(self, summary: str, messages: List[BaseMessage]) -> List[BaseMessage]:
+        prompt = SUMMARY_PROMPT.format(summary=summary or "（无）", history=get_buffer_string(messages))
+        return [HumanMessage(content=prompt)]
+
+    def _summarize(self, summary: str, messages: List[BaseMessage]) -> str:
+        if self.summary_model is None:
+            return summary
+        summary_input = self._summary_input(summary, messages)
+        if self.scheduler is None:
+            result: AIMessage = self.summary_model.invoke(summary_input)
+        else:
+            result = self.scheduler.submit_sync(self.provider, lambda: self.summary_model.invoke(summary_input))
+        return str(result.content)
+
+    async def _asummarize(self, summary: str, messages: List[BaseMessage], runtime: Runtime) -> str:
+        if self.summary_model is None:
+            return summary
+        summary_input = self._summary_input(summary, messages)
+        if self.scheduler is None:
+            result: AIMessage = await self.summary_model.ainvoke(summary_input)
+        else:
+            # 摘要阻塞当前轮次的回复，与对话调用使用相同的用户与优先级排队
+            context = runtime.context if runtime else None
+            result = await self.scheduler.submit(
+                self.provider,
+                lambda: self.summary_model.ainvoke(summary_input),
+                user_id=getattr(context, "user_id", 0),
+                priority=Priority[getattr(context, "priority", "interactive").upper()],
+                estimated_tokens=count_tokens_approximately(summary_input),
+            )
+        return str(result.content)
@@ -0,0 +1,215 @@
+"""
+确定性的离线聊天模型：按脚本回放模型输出（文本、业务工具调用、ModelOutput 结构化输出），
+可配置首 token 延迟与输出速度，用于在没有网络的环境下压测 Agent 自身的开销
+
+脚本格式（JSON）：
+    {"turns": [
+        [{"tool_calls": [{"name": "query_weather", "args": {"city": "西安"}}]},
+         {"tool_calls": [{"name": "ModelOutput", "args": {"text": "西安今天晴", "sections": []}}]}]
+    ]}
+
+- 第 n 轮用户消息使用 turns[n % len(turns)]，同一轮内第 k 次模型调用返回其中第 k 条（k 为最后一条用户消息之后的
+  AI 消息数），因此结果只取决于会话内容，与并发、调用顺序无关
+- 脚本用完后返回默认的 ModelOutput 回复，保证 Agent 能够结束
+- 未绑定工具的调用（上下文压缩的摘要）只返回文本
+- 脚本可以手写，也可以用 ScriptRecorder 录制真实模型的输出
+
+GenericAgentBot(system_prompt, "<脚本路径或 default>", "fake") 使用该模型
+
+环境变量：
+AGENT_FAKE_LATENCY_MS: 首 token 之前的延迟（毫秒），默认 0
+AGENT_FAKE_TOKENS_PER_SECOND: 输出速度，0 表示不模拟输出耗时，默认 0
+"""
+import asyncio
+import os
+import time
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Sequence, Union
+
+import orjson
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, BaseCallbackHandler, CallbackManagerForLLMRun
+from langchain_core.language_models import BaseChatModel
+from langchain_core.language_models.base import LanguageModelInput
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, HumanMessage
+from langchain_core.messages.utils import count_tokens_approximately
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult, LLMResult
+from langchain_core.runnables import Runnable
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+AGENT_FAKE_LATENCY_MS = int(os.getenv("AGENT_FAKE_LATENCY_MS", 0))
+AGENT_FAKE_TOKENS_PER_SECOND = float(os.getenv("AGENT_FAKE_TOKENS_PER_SECOND", 0))
+
+DEFAULT_REPLY = "好的，这是离线模型返回的固定回复。"
+
+
+def final_reply(text: str = DEFAULT_REPLY, sections: Optional[List[str]] = None) -> Dict[str, Any]:
+    """
+    以 ModelOutput 结构化输出结束本轮的脚本步骤
+    """
+    return {"tool_calls": [{"name": "ModelOutput", "args": {"text": text, "sections": sections or []}}]}
+
+
+def load_script(path: str) -> List[List[Dict[str, Any]]]:
+    with open(path, "rb") as f:
+        return orjson.loads(f.read())["turns"]
+
+
+def save_script(turns: List[List[Dict[str, Any]]], path: str):
+    with open(path, "wb") as f:
+        f.write(orjson.dumps({"turns": turns}, option=orjson.OPT_INDENT_2))
+
+
+def _position(messages: Sequence[BaseMessage]) -> tuple:
+    """
+    :return: (用户消息轮次, 本轮内已有的 AI 消息数)
+    """
+    turn, step = -1, 0
+    for message in messages:
+        if isinstance(message, HumanMessage):
+            turn += 1
+            step = 0
+        elif isinstance(message, AIMessage):
+            step += 1
+    return max(turn, 0), step
+
+
+def _tokens(text: str) -> List[str]:
+    # 与 count_tokens_approximately 一致，约 4 个字符一个 token
+    return [text[i:i + 4] for i in range(0, len(text), 4)]
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    按脚本回放输出的聊天模型，支持 bind_tools、同步/异步调用与流式输出
+    """
+    model_name: str = "default"
+    turns: List[List[Dict[str, Any]]] = []
+    latency_ms: int = AGENT_FAKE_LATENCY_MS
+    tokens_per_second: float = AGENT_FAKE_TOKENS_PER_SECOND
+
+    @classmethod
+    def from_name(cls, model_name: str) -> "FakeChatModel":
+        """
+        :param model_name: 脚本文件路径；不是文件时使用默认脚本（直接返回 ModelOutput）
+        """
+        turns = load_script(model_name) if os.path.isfile(model_name) else []
+        return cls(model_name=model_name, turns=turns)
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake"
+
+    def _get_ls_params(self, stop: Optional[List[str]] = None, **kwargs: Any):
+        params = super()._get_ls_params(stop=stop, **kwargs)
+        params["ls_provider"] = "fake"
+        return params
+
+    def bind_tools(self, tools: Sequence[Any], *, tool_choice: Optional[Union[str, dict]] = None,
+                   **kwargs: Any) -> Runnable[LanguageModelInput, AIMessage]:
+        # 与真实 provider 一样转换工具定义，使绑定开销计入压测
+        return self.bind(tools=[convert_to_openai_tool(t) for t in tools], tool_choice=tool_choice, **kwargs)
+
+    def _respond(self, messages: List[BaseMessage], tools: Optional[list]) -> AIMessage:
+        turn, step = _position(messages)
+        if not tools:
+            spec = {"content": DEFAULT_REPLY}
+        else:
+            script = self.turns[turn % len(self.turns)] if self.turns else []
+            spec = script[step] if step < len(script) else final_reply()
+        tool_calls = [{"name": tc["name"], "args": tc.get("args", {}), "id": f"call_{turn}_{step}_{i}",
+                       "type": "tool_call"} for i, tc in enumerate(spec.get("tool_calls", []))]
+        content = spec.get("content", "")
+        output_tokens = len(_tokens(content)) + sum(
+            count_tokens_approximately([AIMessage("", tool_calls=[tc])]) for tc in tool_calls)
+        input_tokens = count_tokens_approximately(messages)
+        return AIMessage(content=content, tool_calls=tool_calls, usage_metadata={
+            "input_tokens": input_tokens, "output_tokens": output_tokens,
+            "total_tokens": input_tokens + output_tokens})
+
+    def _generation_seconds(self, message: AIMessage) -> float:
+        seconds = self.latency_ms / 1000
+        if self.tokens_per_second:
+            seconds += message.usage_metadata["output_tokens"] / self.tokens_per_second
+        return seconds
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        message = self._respond(messages, kwargs.get("tools"))
+        time.sleep(self._generation_seconds(message))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Optional[AsyncCallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        message = self._respond(messages, kwargs.get("tools"))
+        await asyncio.sleep(self._generation_seconds(message))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _chunks(self, message: AIMessage) -> Iterator[AIMessageChunk]:
+        for token in _tokens(message.content):
+            yield AIMessageChunk(content=token)
+        yield AIMessageChunk(content="", usage_metadata=message.usage_metadata, tool_call_chunks=[
+            {"name": tc["name"], "args": orjson.dumps(tc["args"]).decode(), "id": tc["id"], "index": i}
+            for i, tc in enumerate(message.tool_calls)])
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        message = self._respond(messages, kwargs.get("tools"))
+        time.sleep(self.latency_ms / 1000)
+        for chunk in self._chunks(message):
+            if self.tokens_per_second and chunk.content:
+                time.sleep(1 / self.tokens_per_second)
+            if run_manager and chunk.content:
+                run_manager.on_llm_new_token(chunk.content)
+            yield ChatGenerationChunk(message=chunk)
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+                       **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        message = self._respond(messages, kwargs.get("tools"))
+        await asyncio.sleep(self.latency_ms / 1000)
+        for chunk in self._chunks(message):
+            if self.tokens_per_second and chunk.content:
+                await asyncio.sleep(1 / self.tokens_per_second)
+            if run_manager and chunk.content:
+                await run_manager.on_llm_new_token(chunk.content)
+            yield ChatGenerationChunk(message=chunk)
+
+
+class ScriptRecorder(BaseCallbackHandler):
+    """
+    录制真实模型的输出，保存为 FakeChatModel 的脚本：
+
+        recorder = ScriptRecorder()
+        agent.graph.invoke(..., config={"callbacks": [recorder], ...})
+        recorder.save("script.json")
+
+    只录制绑定了工具的调用（跳过上下文压缩的摘要），每条用户消息开始新的一轮
+    """
+    run_inline = True
+
+    def __init__(self):
+        self.turns: List[List[Dict[str, Any]]] = []
+        self._pending: Dict[Any, int] = {}
+
+    def on_chat_model_start(self, serialized: Dict[str, Any], messages: List[List[BaseMessage]], *, run_id: Any,
+                            invocation_params: Optional[Dict[str, Any]] = None, **kwargs: Any) -> Any:
+        if not (invocation_params or {}).get("tools"):
+            return
+        _, step = _position(messages[0])
+        if step == 0 or not self.turns:
+            self.turns.append([])
+        self._pending[run_id] = len(self.turns) - 1
+
+    def on_llm_end(self, response: LLMResult, *, run_id: Any, **kwargs: Any) -> Any:
+        index = self._pending.pop(run_id, None)
+        if index is None:
+            return
+        message = response.generations[0][0].message
+        spec: Dict[str, Any] = {}
+        if message.content:
+            spec["content"] = message.content
+        if message.tool_calls:
+            spec["tool_calls"] = [{"name": tc["name"], "args": tc["args"]} for tc in message.tool_calls]
+        self.turns[index].append(spec)
+
+    def save(self, path: str):
+        save_script(self.turns, path)
@@ -0,0 +1,318 @@
+import asyncio
+import hashlib
+import logging
+import os
+import random
+import threading
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from enum import IntEnum
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, TypeVar
+
+import orjson
+from langchain.agents.middleware import AgentMiddleware, ModelRequest, ModelResponse
+from langchain_core.messages.utils import count_tokens_approximately
+from langgraph.config import get_config
+
+from common.metrics import REGISTRY
+
+_logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+QUEUE_SECONDS = REGISTRY.histogram(
+    "agent_llm_queue_seconds", "LLM 请求在调度队列中的等待时间", ("provider", "priority"))
+QUEUE_DEPTH = REGISTRY.gauge("agent_llm_queue_depth", "调度队列中等待的 LLM 请求数", ("provider",))
+INFLIGHT = REGISTRY.gauge("agent_llm_inflight", "正在执行的 LLM 请求数", ("provider",))
+RETRIES = REGISTRY.counter("agent_llm_retries_total", "LLM 请求重试次数", ("provider",))
+COALESCED = REGISTRY.counter("agent_llm_coalesced_total", "被合并的重复 LLM 请求数", ("provider",))
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+RETRYABLE_ERRORS = {"RateLimitError", "APIConnectionError", "APITimeoutError", "InternalServerError"}
+
+
+class Priority(IntEnum):
+    INTERACTIVE = 0  # 在线聊天
+    BACKGROUND = 1  # 摘要、批处理等后台任务
+
+
+@dataclass
+class ProviderLimits:
+    max_concurrency: int = 4
+    tokens_per_minute: Optional[int] = None  # None 表示不限速
+    max_retries: int = 3
+    base_backoff: float = 0.5
+    max_backoff: float = 8.0
+    coalesce: bool = False  # 相同请求并发时只发送一次
+
+
+class _TokenBucket:
+    def __init__(self, tokens_per_minute: int):
+        self.capacity = float(tokens_per_minute)
+        self.tokens = float(tokens_per_minute)
+        self.rate = tokens_per_minute / 60.0
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, tokens: int):
+        # 单次请求超过桶容量时按容量计算，避免永远等待
+        tokens = min(float(tokens), self.capacity)
+        while True:
+            self._refill()
+            if self.tokens >= tokens:
+                self.tokens -= tokens
+                return
+            await asyncio.sleep((tokens - self.tokens) / self.rate)
+
+
+class _ProviderQueue:
+    """
+    单个 provider 的并发槽位：按优先级分层，同一优先级内按用户轮询（公平排队）
+    """
+
+    def __init__(self, name: str, limits: ProviderLimits):
+        self.name = name
+        self.limits = limits
+        self.active = 0
+        # 结构：{ priority: OrderedDict[user_id, deque[Future]] }
+        self.waiters: Dict[Priority, OrderedDict[Any, Deque[asyncio.Future]]] = {p: OrderedDict() for p in Priority}
+        self.bucket = _TokenBucket(limits.tokens_per_minute) if limits.tokens_per_minute else None
+        self.inflight: Dict[str, asyncio.Future] = {}
+        # 同步调用（GenericAgentBot.invoke）无法进入 asyncio 队列，只做并发限制
+        self.sync_slots = threading.BoundedSemaphore(limits.max_concurrency)
+
+    def depth(self) -> int:
+        return sum(len(q) for users in self.waiters.values() for q in users.values())
+
+    async def acquire(self, user_id: Any, priority: Priority):
+        if self.active < self.limits.max_concurrency and self.depth() == 0:
+            self.active += 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        self.waiters[priority].setdefault(user_id, deque()).append(future)
+        QUEUE_DEPTH.labels(self.name).set(self.depth())
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # 槽位已经移交给本请求，取消时需要归还
+                self.release()
+            else:
+                self._discard(user_id, priority, future)
+            raise
+
+    def release(self):
+        future = self._next_waiter()
+        if future is None:
+            self.active -= 1
+        else:
+            # 槽位直接移交，active 不变
+            future.set_result(None)
+        QUEUE_DEPTH.labels(self.name).set(self.depth())
+
+    def _next_waiter(self) -> Optional[asyncio.Future]:
+        for priority in Priority:
+            users = self.waiters[priority]
+            while users:
+                user_id, queue = next(iter(users.items()))
+                future = queue.popleft()
+                if queue:
+                    users.move_to_end(user_id)
+                else:
+                    del users[user_id]
+                if not future.done():
+                    return future
+        return None
+
+    def _discard(self, user_id: Any, priority: Priority, future: asyncio.Future):
+        queue = self.waiters[priority].get(user_id)
+        if queue and future in queue:
+            queue.remove(future)
+            if not queue:
+                del self.waiters[priority][user_id]
+        QUEUE_DEPTH.labels(self.name).set(self.depth())
+
+
+class LLMScheduler:
+    """
+    LLM 请求调度器：按 provider 限制并发与 token 速率，区分优先级，按用户公平排队，
+    对 429/5xx 进行带抖动的指数退避重试，并可合并相同的并发请求（Ollama）
+    """
+
+    def __init__(self, limits: Dict[str, ProviderLimits]):
+        self._queues = {name: _ProviderQueue(name, lim) for name, lim in limits.items()}
+
+    def _queue(self, provider: str) -> _ProviderQueue:
+        queue = self._queues.get(provider)
+        if queue is None:
+            queue = self._queues[provider] = _ProviderQueue(provider, ProviderLimits())
+        return queue
+
+    async def submit(
+            self,
+            provider: str,
+            fn: Callable[[], Awaitable[T]],
+            user_id: Any = 0,
+            priority: Priority = Priority.INTERACTIVE,
+            estimated_tokens: int = 0,
+            coalesce_key: Optional[str] = None,
+    ) -> T:
+        """
+        提交一次模型调用
+        :param provider: 模型供应商，例如 deepseek / ollama
+        :param fn: 实际执行调用的协程工厂，重试时会被再次调用
+        :param user_id: 用户ID，用于公平排队
+        :param priority: 优先级
+        :param estimated_tokens: 预估 token 数，用于速率限制
+        :param coalesce_key: 请求指纹，provider 开启合并时相同指纹共享结果
+        """
+        queue = self._queue(provider)
+        if queue.limits.coalesce and coalesce_key:
+            while (existing := queue.inflight.get(coalesce_key)) is not None:
+                COALESCED.labels(provider).inc()
+                try:
+                    return await asyncio.shield(existing)
+                except asyncio.CancelledError:
+                    if asyncio.current_task().cancelling() or not existing.cancelled():
+                        raise
+                    # 被取消的是发起请求的调用方而不是本请求：重新发起，或合并到其他等待者新发起的请求
+            future = asyncio.get_running_loop().create_future()
+            queue.inflight[coalesce_key] = future
+            try:
+                result = await self._run(queue, fn, user_id, priority, estimated_tokens)
+                future.set_result(result)
+                return result
+            except asyncio.CancelledError:
+                future.cancel()
+                raise
+            except Exception as e:
+                future.set_exception(e)
+                # 没有其他等待者时避免 "exception was never retrieved" 警告
+                future.exception()
+                raise
+            finally:
+                queue.inflight.pop(coalesce_key, None)
+        return await self._run(queue, fn, user_id, priority, estimated_tokens)
+
+    async def _run(self, queue: _ProviderQueue, fn, user_id, priority: Priority, estimated_tokens: int):
+        attempt = 0
+        while True:
+            enqueued = time.perf_counter()
+            # 先等待 token 配额再占用并发槽位，避免限速期间槽位空占
+            if queue.bucket and estimated_tokens:
+                await queue.bucket.acquire(estimated_tokens)
+            await queue.acquire(user_id, priority)
+            QUEUE_SECONDS.labels(queue.name, priority.name.lower()).observe(time.perf_counter() - enqueued)
+            INFLIGHT.labels(queue.name).inc()
+            try:
+                return await fn()
+            except Exception as e:
+                if attempt >= queue.limits.max_retries or not is_retryable(e):
+                    raise
+                delay = backoff_delay(queue.limits, attempt)
+                _logger.warning("LLM 请求失败，%.2fs 后重试 (%s, 第 %d 次): %s", delay, queue.name, attempt + 1, e)
+                RETRIES.labels(queue.name).inc()
+            finally:
+                INFLIGHT.labels(queue.name).dec()
+                queue.release()
+            # 退避期间不占用槽位
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    def submit_sync(self, provider: str, fn: Callable[[], T]) -> T:
+        """
+        同步调用路径：只做并发限制与重试
+        """
+        queue = self._queue(provider)
+        attempt = 0
+        while True:
+            enqueued = time.perf_counter()
+            with queue.sync_slots:
+                QUEUE_SECONDS.labels(queue.name, "sync").observe(time.perf_counter() - enqueued)
+                try:
+                    return fn()
+                except Exception as e:
+                    if attempt >= queue.limits.max_retries or not is_retryable(e):
+                        raise
+                    delay = backoff_delay(queue.limits, attempt)
+                    RETRIES.labels(queue.name).inc()
+            attempt += 1
+            time.sleep(delay)
+
+
+def is_retryable(exc: BaseException) -> bool:
+    if isinstance(exc, (asyncio.TimeoutError, TimeoutError, ConnectionError)):
+        return True
+    status_code = getattr(exc, "status_code", None) or getattr(getattr(exc, "response", None), "status_code", None)
+    if status_code in RETRYABLE_STATUS:
+        return True
+    return type(exc).__name__ in RETRYABLE_ERRORS
+
+
+def backoff_delay(limits: ProviderLimits, attempt: int) -> float:
+    # full jitter
+    return random.uniform(0, min(limits.max_backoff, limits.base_backoff * (2 ** attempt)))
+
+
+class SchedulerMiddleware(AgentMiddleware):
+    """
+    将 create_agent 中的模型调用接入 LLMScheduler
+    """
+
+    def __init__(self, scheduler: LLMScheduler, provider: str):
+        super().__init__()
+        self.scheduler = scheduler
+        self.provider = provider
+
+    def wrap_model_call(self, request: ModelRequest, handler: Callable[[ModelRequest], ModelResponse]) -> ModelResponse:
+        return self.scheduler.submit_sync(self.provider, lambda: handler(request))
+
+    async def awrap_model_call(
+            self,
+            request: ModelRequest,
+            handler: Callable[[ModelRequest], Awaitable[ModelResponse]],
+    ) -> ModelResponse:
+        context = request.runtime.context if request.runtime else None
+        priority = Priority[getattr(context, "priority", "interactive").upper()]
+        return await self.scheduler.submit(
+            self.provider,
+            lambda: handler(request),
+            user_id=getattr(context, "user_id", 0),
+            priority=priority,
+            estimated_tokens=count_tokens_approximately(request.messages),
+            coalesce_key=self._fingerprint(request),
+        )
+
+    @staticmethod
+    def _fingerprint(request: ModelRequest) -> str:
+        context = request.runtime.context if request.runtime else None
+        try:
+            thread_id = get_config().get("configurable", {}).get("thread_id")
+        except RuntimeError:
+            thread_id = None
+        payload = {
+            # 只合并同一用户、同一线程内的重复请求，不同用户的相同对话不会共享模型输出
+            "user": getattr(context, "user_id", None),
+            "thread": thread_id,
+            "system": request.system_prompt,
+            "messages": [(m.type, m.content) for m in request.messages],
+            "tools": sorted(getattr(t, "name", str(t)) for t in request.tools),
+        }
+        return hashlib.sha1(orjson.dumps(payload, default=str)).hexdigest()
+
+
+default_scheduler = LLMScheduler({
+    "deepseek": ProviderLimits(
+        max_concurrency=int(os.getenv("AGENT_DEEPSEEK_CONCURRENCY", 16)),
+        tokens_per_minute=int(os.getenv("AGENT_DEEPSEEK_TPM", 0)) or None,
+    ),
+    "ollama": ProviderLimits(
+        max_concurrency=int(os.getenv("AGENT_OLLAMA_CONCURRENCY", 2)),
+        coalesce=True,
+    ),
+})
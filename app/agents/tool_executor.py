@@ -0,0 +1,268 @@
+import asyncio
+import contextvars
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from datetime import datetime, timezone
+from typing import Callable, Awaitable, Dict, Iterable, Optional, Tuple
+
+import orjson
+from langchain.agents.middleware import AgentMiddleware
+from langchain.agents.middleware.types import ToolCallRequest
+from langchain_core.messages import ToolMessage
+from langgraph.types import Command
+
+from common.cache import LRUCache
+from common.metrics import REGISTRY
+
+_logger = logging.getLogger(__name__)
+
+ToolResult = ToolMessage | Command
+
+# 所有中间件实例共用一个线程池执行同步工具
+AGENT_TOOL_WORKERS = int(os.getenv("AGENT_TOOL_WORKERS", 8))
+# 超时后仍在线程池中运行的调用，每个工具最多保留的数量；达到上限后拒绝该工具的新调用，避免占满线程池
+AGENT_TOOL_MAX_ABANDONED = int(os.getenv("AGENT_TOOL_MAX_ABANDONED", 2))
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+# 结构：{ tool_name: 超时后仍在运行的调用数 }
+_abandoned: Dict[str, int] = {}
+
+_ABANDONED = REGISTRY.gauge("agent_tool_abandoned", "超时后仍占用线程池的同步工具调用数", ("tool",))
+_REJECTED = REGISTRY.counter("agent_tool_rejected_total", "因超时调用过多被拒绝的工具调用数", ("tool",))
+
+
+def get_tool_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=AGENT_TOOL_WORKERS, thread_name_prefix="agent-tool")
+        return _executor
+
+
+def shutdown_tool_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+
+
+def _abandon(name: str, future: Future):
+    with _executor_lock:
+        _abandoned[name] = _abandoned.get(name, 0) + 1
+    _ABANDONED.labels(name).inc()
+    future.add_done_callback(lambda _: _release_abandoned(name))
+
+
+def _release_abandoned(name: str):
+    with _executor_lock:
+        count = _abandoned.pop(name, 0) - 1
+        if count > 0:
+            _abandoned[name] = count
+    _ABANDONED.labels(name).dec()
+
+
+class ToolExecutionMiddleware(AgentMiddleware):
+    """
+    工具执行策略：超时、确定性工具缓存、耗时记录
+
+    create_agent 会把一条 AIMessage 里的每个 tool_call 作为独立的 Send 派发到 tools 节点，
+    LangGraph 在同一个 superstep 内并发执行它们；这里负责每个调用的执行策略：
+    - 同步工具（如 query_weather）放到共享线程池执行，可以按工具设置超时；
+      超时的调用仍占用线程，同一工具的超时调用达到 AGENT_TOOL_MAX_ABANDONED 后拒绝其新调用
+    - 异步工具使用 asyncio.wait_for 施加超时
+    - 确定性工具按 (thread_id, 工具名, 参数哈希) 在线程内做 LRU 缓存；
+      缓存的线程数有上限，超过 thread_cache_ttl 未写入的线程缓存过期
+    - 结果 ToolMessage 的 additional_kwargs 中写入 timestamp / latency_ms / cached，
+      供 GenericAgentBot.get_messages 映射到 ReasoningStep
+    """
+
+    def __init__(
+            self,
+            default_timeout: float = 30.0,
+            timeouts: Optional[Dict[str, float]] = None,
+            deterministic_tools: Iterable[str] = (),
+            cache_size: int = 256,
+            max_threads: int = 1024,
+            thread_cache_ttl: float = 3600.0,
+    ):
+        """
+        :param cache_size: 每个线程缓存的工具结果数
+        :param max_threads: 缓存的线程数上限，超过时淘汰最久未使用的线程
+        :param thread_cache_ttl: 线程缓存的过期时间（秒）
+        """
+        super().__init__()
+        self.default_timeout = default_timeout
+        self.timeouts: Dict[str, float] = dict(timeouts or {})
+        self.deterministic_tools = set(deterministic_tools)
+        self.cache_size = cache_size
+        # 结构：{ thread_id: OrderedDict[(tool_name, args_hash), ToolMessage] }
+        # 同步工具在多个线程中读写，访问时需要持有 _lock
+        self._cache: LRUCache[str, OrderedDict[Tuple[str, str], ToolMessage]] = LRUCache(max_threads, thread_cache_ttl)
+        self._lock = threading.Lock()
+
+    # -----------------------
+    # 同步执行
+    # -----------------------
+    def wrap_tool_call(self, request: ToolCallRequest, handler: Callable[[ToolCallRequest], ToolResult]) -> ToolResult:
+        cache_key = self._cache_key(request)
+        cached = self._cache_get(request, cache_key)
+        if cached is not None:
+            return cached
+
+        started_at = datetime.now(timezone.utc).isoformat()
+        start = time.perf_counter()
+        name = request.tool_call["name"]
+        with _executor_lock:
+            abandoned = _abandoned.get(name, 0)
+        if abandoned >= AGENT_TOOL_MAX_ABANDONED:
+            return self._rejected_message(request, abandoned, started_at)
+        # 复制 contextvars，保证 LangGraph 的运行上下文在线程池中依然可见
+        ctx = contextvars.copy_context()
+        future = get_tool_executor().submit(ctx.run, handler, request)
+        try:
+            result = future.result(timeout=self._timeout_for(request))
+        except FutureTimeoutError:
+            # 线程无法被强制终止，这里只是不再等待它的结果；调用结束前计入该工具的超时调用数
+            _abandon(name, future)
+            return self._timeout_message(request, started_at, start)
+        return self._finish(request, result, cache_key, started_at, start)
+
+    # -----------------------
+    # 异步执行
+    # -----------------------
+    async def awrap_tool_call(
+            self,
+            request: ToolCallRequest,
+            handler: Callable[[ToolCallRequest], Awaitable[ToolResult]],
+    ) -> ToolResult:
+        cache_key = self._cache_key(request)
+        cached = self._cache_get(request, cache_key)
+        if cached is not None:
+            return cached
+
+        started_at = datetime.now(timezone.utc).isoformat()
+        start = time.perf_counter()
+        try:
+            result = await asyncio.wait_for(handler(request), timeout=self._timeout_for(request))
+        except asyncio.TimeoutError:
+            return self._timeout_message(request, started_at, start)
+        return self._finish(request, result, cache_key, started_at, start)
+
+    def clear_cache(self, thread_id: Optional[str] = None):
+        """
+        清理缓存
+        :param thread_id: 会话ID，为空时清理全部
+        """
+        with self._lock:
+            if thread_id is None:
+                self._cache.clear()
+            else:
+                self._cache.delete(thread_id)
+
+    # -----------------------
+    # 内部方法
+    # -----------------------
+    def _timeout_for(self, request: ToolCallRequest) -> float:
+        return self.timeouts.get(request.tool_call["name"], self.default_timeout)
+
+    def _is_deterministic(self, request: ToolCallRequest) -> bool:
+        if request.tool_call["name"] in self.deterministic_tools:
+            return True
+        metadata = getattr(request.tool, "metadata", None) or {}
+        return bool(metadata.get("deterministic"))
+
+    def _cache_key(self, request: ToolCallRequest) -> Optional[Tuple[str, str, str]]:
+        if not self._is_deterministic(request):
+            return None
+        config = request.runtime.config if request.runtime else {}
+        thread_id = str(config.get("configurable", {}).get("thread_id", "default"))
+        args = orjson.dumps(request.tool_call.get("args", {}), option=orjson.OPT_SORT_KEYS, default=str)
+        return thread_id, request.tool_call["name"], hashlib.sha1(args).hexdigest()
+
+    def _cache_get(self, request: ToolCallRequest, cache_key) -> Optional[ToolMessage]:
+        if cache_key is None:
+            return None
+        thread_id, name, args_hash = cache_key
+        with self._lock:
+            thread_cache = self._cache.get(thread_id)
+            if not thread_cache or (name, args_hash) not in thread_cache:
+                return None
+            thread_cache.move_to_end((name, args_hash))
+            hit = thread_cache[(name, args_hash)]
+        return hit.model_copy(update={
+            "id": None,
+            "tool_call_id": request.tool_call["id"],
+            "additional_kwargs": {
+                **hit.additional_kwargs,
+                "timestamp": datetime.now(timezone.utc).isoformat(),
+                "latency_ms": 0.0,
+                "cached": True,
+            },
+        })
+
+    def _cache_put(self, cache_key, message: ToolMessage):
+        thread_id, name, args_hash = cache_key
+        with self._lock:
+            thread_cache = self._cache.get(thread_id) or OrderedDict()
+            thread_cache[(name, args_hash)] = message
+            thread_cache.move_to_end((name, args_hash))
+            while len(thread_cache) > self.cache_size:
+                thread_cache.popitem(last=False)
+            # 每次写入都重新计算过期时间
+            self._cache.set(thread_id, thread_cache)
+
+    def _finish(self, request: ToolCallRequest, result: ToolResult, cache_key, started_at: str,
+                start: float) -> ToolResult:
+        latency_ms = (time.perf_counter() - start) * 1000
+        if not isinstance(result, ToolMessage):
+            # Command 等结果原样返回
+            return result
+        result.additional_kwargs.update({
+            "timestamp": started_at,
+            "latency_ms": round(latency_ms, 3),
+            "cached": False,
+        })
+        if cache_key is not None and result.status != "error":
+            self._cache_put(cache_key, result)
+        return result
+
+    @staticmethod
+    def _rejected_message(request: ToolCallRequest, abandoned: int, started_at: str) -> ToolMessage:
+        name = request.tool_call["name"]
+        _REJECTED.labels(name).inc()
+        _logger.warning("工具 %s 有 %d 个超时调用仍在执行，拒绝新的调用", name, abandoned)
+        return ToolMessage(
+            content=f"工具 {name} 暂时不可用，请稍后重试",
+            tool_call_id=request.tool_call["id"],
+            name=name,
+            status="error",
+            additional_kwargs={
+                "timestamp": started_at,
+                "latency_ms": 0.0,
+                "cached": False,
+                "rejected": True,
+            },
+        )
+
+    def _timeout_message(self, request: ToolCallRequest, started_at: str, start: float) -> ToolMessage:
+        timeout = self._timeout_for(request)
+        _logger.warning("工具执行超时: %s (%.1fs)", request.tool_call["name"], timeout)
+        return ToolMessage(
+            content=f"工具 {request.tool_call['name']} 执行超时（{timeout}s）",
+            tool_call_id=request.tool_call["id"],
+            name=request.tool_call["name"],
+            status="error",
+            additional_kwargs={
+                "timestamp": started_at,
+                "latency_ms": round((time.perf_counter() - start) * 1000, 3),
+                "cached": False,
+                "timeout": True,
+            },
+        )
+
@@ -0,0 +1,301 @@
+import contextvars
+import logging
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Sequence
+from uuid import UUID
+
+import orjson
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+from langgraph.checkpoint.base import BaseCheckpointSaver, ChannelVersions, Checkpoint, CheckpointMetadata, \
+    CheckpointTuple
+
+from common.metrics import REGISTRY
+
+try:
+    from opentelemetry import trace as otel_trace
+except ImportError:  # opentelemetry 为可选依赖
+    otel_trace = None
+
+_logger = logging.getLogger(__name__)
+
+INVOCATION_SECONDS = REGISTRY.histogram("agent_invocation_seconds", "Agent 单次调用耗时", ("status",))
+MODEL_SECONDS = REGISTRY.histogram("agent_model_seconds", "模型调用耗时", ("provider", "model"))
+MODEL_TTFT_SECONDS = REGISTRY.histogram("agent_model_ttft_seconds", "模型首 token 耗时（流式）", ("provider", "model"))
+MODEL_TOKENS = REGISTRY.counter("agent_model_tokens_total", "模型 token 用量", ("provider", "model", "kind"))
+TOOL_SECONDS = REGISTRY.histogram("agent_tool_seconds", "工具执行耗时", ("tool", "status"))
+CHECKPOINT_SECONDS = REGISTRY.histogram(
+    "agent_checkpoint_seconds", "checkpoint 读写耗时", ("op",),
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0))
+
+# 当前线程/协程正在执行的调用，供 checkpoint 计时挂载 span
+_current_trace: contextvars.ContextVar[Optional["AgentTrace"]] = contextvars.ContextVar("agent_trace", default=None)
+
+
+@dataclass
+class Span:
+    name: str
+    kind: str  # invocation / model / tool / checkpoint
+    start: float  # time.time()
+    duration_ms: float = 0.0
+    status: str = "ok"
+    attributes: Dict[str, Any] = field(default_factory=dict)
+
+
+class AgentTrace(BaseCallbackHandler):
+    """
+    单次 GenericAgentBot 调用的追踪：通过 LangChain 回调记录模型耗时、首 token、token 用量、
+    工具耗时与异常，并汇总 TimedCheckpointSaver 的 checkpoint 读写耗时
+
+    结束时写入指标、输出一条结构化日志，安装了 opentelemetry 时同时导出为 span
+    """
+    run_inline = True
+
+    def __init__(self, thread_id: str, user_id: Any = None):
+        self.trace_id = uuid.uuid4().hex
+        self.thread_id = thread_id
+        self.user_id = user_id
+        self.spans: List[Span] = []
+        self._open: Dict[UUID, tuple] = {}
+        self._start = time.time()
+        self._perf = time.perf_counter()
+        self._token: Optional[contextvars.Token] = None
+
+    # -----------------------
+    # 生命周期
+    # -----------------------
+    def __enter__(self) -> "AgentTrace":
+        self._token = _current_trace.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _current_trace.reset(self._token)
+        self.finish("error" if exc_type else "ok", exc)
+        return False
+
+    def finish(self, status: str = "ok", error: Optional[BaseException] = None):
+        duration = time.perf_counter() - self._perf
+        INVOCATION_SECONDS.labels(status).observe(duration)
+        root = Span("agent.invoke", "invocation", self._start, round(duration * 1000, 3), status,
+                    {"thread_id": self.thread_id, "user_id": self.user_id})
+        if error is not None:
+            root.attributes["error"] = repr(error)
+        self.spans.insert(0, root)
+        _logger.info("agent trace %s", orjson.dumps({
+            "trace_id": self.trace_id,
+            "summary": self.summary(),
+            "spans": [s.__dict__ for s in self.spans],
+        }, default=str).decode())
+        _export_otel(self)
+
+    def summary(self) -> Dict[str, float]:
+        """
+        按类别汇总耗时，用于判断慢在模型、工具还是数据库
+        """
+        totals: Dict[str, float] = {"model_ms": 0.0, "tool_ms": 0.0, "checkpoint_ms": 0.0}
+        for span in self.spans:
+            key = f"{span.kind}_ms"
+            if key in totals:
+                totals[key] += span.duration_ms
+        return {k: round(v, 3) for k, v in totals.items()}
+
+    def add_span(self, span: Span):
+        self.spans.append(span)
+
+    # -----------------------
+    # 模型回调
+    # -----------------------
+    def on_chat_model_start(self, serialized: Dict[str, Any], messages: List[List[Any]], *, run_id: UUID,
+                            metadata: Optional[Dict[str, Any]] = None, **kwargs: Any) -> Any:
+        metadata = metadata or {}
+        attributes = {
+            "provider": metadata.get("ls_provider", "unknown"),
+            "model": metadata.get("ls_model_name", "unknown"),
+        }
+        self._open[run_id] = (time.time(), time.perf_counter(), attributes)
+
+    def on_llm_new_token(self, token: str, *, run_id: UUID, **kwargs: Any) -> Any:
+        opened = self._open.get(run_id)
+        if opened and "ttft_ms" not in opened[2]:
+            opened[2]["ttft_ms"] = round((time.perf_counter() - opened[1]) * 1000, 3)
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> Any:
+        opened = self._open.pop(run_id, None)
+        if opened is None:
+            return
+        start, perf, attributes = opened
+        duration = time.perf_counter() - perf
+        provider, model = attributes["provider"], attributes["model"]
+        prompt_tokens, completion_tokens = _token_usage(response)
+        attributes.update(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+
+        MODEL_SECONDS.labels(provider, model).observe(duration)
+        if "ttft_ms" in attributes:
+            MODEL_TTFT_SECONDS.labels(provider, model).observe(attributes["ttft_ms"] / 1000)
+        MODEL_TOKENS.labels(provider, model, "prompt").inc(prompt_tokens)
+        MODEL_TOKENS.labels(provider, model, "completion").inc(completion_tokens)
+        self.add_span(Span("model.call", "model", start, round(duration * 1000, 3), "ok", attributes))
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> Any:
+        opened = self._open.pop(run_id, None)
+        if opened is None:
+            return
+        start, perf, attributes = opened
+        duration = time.perf_counter() - perf
+        MODEL_SECONDS.labels(attributes["provider"], attributes["model"]).observe(duration)
+        attributes["error"] = repr(error)
+        self.add_span(Span("model.call", "model", start, round(duration * 1000, 3), "error", attributes))
+
+    # -----------------------
+    # 工具回调
+    # -----------------------
+    def on_tool_start(self, serialized: Dict[str, Any], input_str: str, *, run_id: UUID, **kwargs: Any) -> Any:
+        self._open[run_id] = (time.time(), time.perf_counter(), {"tool": (serialized or {}).get("name", "unknown")})
+
+    def on_tool_end(self, output: Any, *, run_id: UUID, **kwargs: Any) -> Any:
+        self._close_tool(run_id, "ok")
+
+    def on_tool_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> Any:
+        self._close_tool(run_id, "error", error)
+
+    def _close_tool(self, run_id: UUID, status: str, error: Optional[BaseException] = None):
+        opened = self._open.pop(run_id, None)
+        if opened is None:
+            return
+        start, perf, attributes = opened
+        duration = time.perf_counter() - perf
+        TOOL_SECONDS.labels(attributes["tool"], status).observe(duration)
+        if error is not None:
+            attributes["error"] = repr(error)
+        self.add_span(Span(f"tool.{attributes['tool']}", "tool", start, round(duration * 1000, 3), status, attributes))
+
+
+def _token_usage(response: LLMResult) -> tuple:
+    prompt_tokens = completion_tokens = 0
+    for generations in response.generations:
+        for generation in generations:
+            usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+            if usage:
+                prompt_tokens += usage.get("input_tokens", 0)
+                completion_tokens += usage.get("output_tokens", 0)
+    if not prompt_tokens and not completion_tokens and response.llm_output:
+        usage = response.llm_output.get("token_usage") or {}
+        prompt_tokens = usage.get("prompt_tokens", 0)
+        completion_tokens = usage.get("completion_tokens", 0)
+    return prompt_tokens, completion_tokens
+
+
+def _export_otel(trace: AgentTrace):
+    if otel_trace is None:
+        return
+    tracer = otel_trace.get_tracer(__name__)
+    root, *children = trace.spans
+    root_span = tracer.start_span(root.name, start_time=int(root.start * 1e9), attributes=_otel_attrs(root))
+    ctx = otel_trace.set_span_in_context(root_span)
+    for span in children:
+        child = tracer.start_span(span.name, context=ctx, start_time=int(span.start * 1e9),
+                                  attributes=_otel_attrs(span))
+        child.end(end_time=int((span.start + span.duration_ms / 1000) * 1e9))
+    root_span.end(end_time=int((root.start + root.duration_ms / 1000) * 1e9))
+
+
+def _otel_attrs(span: Span) -> Dict[str, Any]:
+    attrs = {k: v for k, v in span.attributes.items() if isinstance(v, (str, int, float, bool))}
+    attrs["status"] = span.status
+    return attrs
+
+
+class TimedCheckpointSaver(BaseCheckpointSaver):
+    """
+    checkpoint 计时代理：记录 get/list/put/put_writes 耗时，并挂载到当前调用的 trace
+    其余属性（conn、setup 等）透传给被代理的 saver
+    """
+
+    def __init__(self, saver: BaseCheckpointSaver):
+        super().__init__(serde=saver.serde)
+        self.saver = saver
+
+    def __getattr__(self, item):
+        if item == "saver":
+            raise AttributeError(item)
+        return getattr(self.saver, item)
+
+    @property
+    def config_specs(self):
+        return self.saver.config_specs
+
+    def _record(self, op: str, start: float, perf: float):
+        duration = time.perf_counter() - perf
+        CHECKPOINT_SECONDS.labels(op).observe(duration)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add_span(Span(f"checkpoint.{op}", "checkpoint", start, round(duration * 1000, 3)))
+
+    def get_tuple(self, config) -> Optional[CheckpointTuple]:
+        start, perf = time.time(), time.perf_counter()
+        try:
+            return self.saver.get_tuple(config)
+        finally:
+            self._record("get", start, perf)
+
+    def list(self, config, *, filter=None, before=None, limit=None) -> Iterator[CheckpointTuple]:
+        start, perf = time.time(), time.perf_counter()
+        try:
+            yield from self.saver.list(config, filter=filter, before=before, limit=limit)
+        finally:
+            self._record("list", start, perf)
+
+    def put(self, config, checkpoint: Checkpoint, metadata: CheckpointMetadata, new_versions: ChannelVersions):
+        start, perf = time.time(), time.perf_counter()
+        try:
+            return self.saver.put(config, checkpoint, metadata, new_versions)
+        finally:
+            self._record("put", start, perf)
+
+    def put_writes(self, config, writes: Sequence[tuple], task_id: str, task_path: str = "") -> None:
+        start, perf = time.time(), time.perf_counter()
+        try:
+            return self.saver.put_writes(config, writes, task_id, task_path)
+        finally:
+            self._record("put_writes", start, perf)
+
+    def delete_thread(self, thread_id: str) -> None:
+        return self.saver.delete_thread(thread_id)
+
+    async def aget_tuple(self, config) -> Optional[CheckpointTuple]:
+        start, perf = time.time(), time.perf_counter()
+        try:
+            return await self.saver.aget_tuple(config)
+        finally:
+            self._record("get", start, perf)
+
+    async def alist(self, config, *, filter=None, before=None, limit=None) -> AsyncIterator[CheckpointTuple]:
+        start, perf = time.time(), time.perf_counter()
+        try:
+            async for item in self.saver.alist(config, filter=filter, before=before, limit=limit):
+                yield item
+        finally:
+            self._record("list", start, perf)
+
+    async def aput(self, config, checkpoint: Checkpoint, metadata: CheckpointMetadata,
+                   new_versions: ChannelVersions):
+        start, perf = time.time(), time.perf_counter()
+        try:
+            return await self.saver.aput(config, checkpoint, metadata, new_versions)
+        finally:
+            self._record("put", start, perf)
+
+    async def aput_writes(self, config, writes: Sequence[tuple], task_id: str, task_path: str = "") -> None:
+        start, perf = time.time(), time.perf_counter()
+        try:
+            return await self.saver.aput_writes(config, writes, task_id, task_path)
+        finally:
+            self._record("put_writes", start, perf)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        return await self.saver.adelete_thread(thread_id)
+
+    def get_next_version(self, current, channel):
+        return self.saver.get_next_version(current, channel)
@@ -1,11 +1,20 @@
-from fastapi import Depends
+import os
+from typing import Optional
+
+import jwt
+from fastapi import Depends, WebSocket, WebSocketException, status
 from fastapi.security import OAuth2PasswordBearer
 
 from app.schemas import TokenUser
 from common import jwt_utils
+from common.exceptions import ServiceException
+from common.logging_config import user_id_ctx
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/users/oauth2/login")
 
+# 管理员用户 ID，逗号分隔；为空时任何用户都不能访问管理接口
+ADMIN_USER_IDS = {int(i) for i in os.getenv("ADMIN_USER_IDS", "").split(",") if i.strip()}
+
 
 def fake_decode_token(token) -> TokenUser:
     payload = jwt_utils.parse_token(token)
@@ -14,4 +23,29 @@ def fake_decode_token(token) -> TokenUser:
 
 async def get_current_user(token: str = Depends(oauth2_scheme)) -> TokenUser:
     user = fake_decode_token(token)
+    user_id_ctx.set(user.user_id)
+    return user
+
+
+async def get_admin_user(user: TokenUser = Depends(get_current_user)) -> TokenUser:
+    if user.user_id not in ADMIN_USER_IDS:
+        raise ServiceException("无权访问", status.HTTP_403_FORBIDDEN)
+    return user
+
+
+async def get_websocket_user(websocket: WebSocket, token: Optional[str] = None) -> TokenUser:
+    """
+    WebSocket 鉴权：浏览器无法设置请求头，token 可通过查询参数传递，也支持 Authorization 头
+    """
+    if token is None:
+        scheme, _, token = websocket.headers.get("authorization", "").partition(" ")
+        if scheme.lower() != "bearer":
+            token = None
+    if not token:
+        raise WebSocketException(status.WS_1008_POLICY_VIOLATION, "not authenticated")
+    try:
+        user = fake_decode_token(token)
+    except (jwt.PyJWTError, KeyError, ValueError):
+        raise WebSocketException(status.WS_1008_POLICY_VIOLATION, "invalid token")
+    user_id_ctx.set(user.user_id)
     return user
@@ -0,0 +1,29 @@
+"""
+会话、消息主键生成器（见 common.snowflake），应用启动时在 lifespan 中申请 worker id
+
+环境变量：
+SNOWFLAKE_WORKER_ID: 固定的 worker id（0~127），只用于单进程部署或没有 Redis 的开发环境；
+                     为空时通过 Redis 租约分配（多进程、多节点部署时必须为空）
+"""
+import os
+
+from app.core.redis_client import get_redis
+from common.snowflake import SnowflakeGenerator, WorkerIdLease
+
+SNOWFLAKE_WORKER_ID = os.getenv("SNOWFLAKE_WORKER_ID")
+
+id_generator = SnowflakeGenerator(int(SNOWFLAKE_WORKER_ID) if SNOWFLAKE_WORKER_ID else None)
+worker_lease = WorkerIdLease(id_generator, get_redis)
+
+
+def next_id() -> int:
+    return id_generator.next_id()
+
+
+async def start_id_generator():
+    if SNOWFLAKE_WORKER_ID is None:
+        await worker_lease.start()
+
+
+async def close_id_generator():
+    await worker_lease.close()
@@ -0,0 +1,74 @@
+import logging
+import os
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI
+
+from app.core.db import dispose_engine, get_engine
+from app.core.id_generator import close_id_generator, start_id_generator
+from app.core.redis_client import close_redis, get_redis
+from common.loop_monitor import loop_monitor
+from common.metrics import REGISTRY, start_metrics_server
+
+_logger = logging.getLogger(__name__)
+
+
+async def drain():
+    """
+    停止接受新连接之后、等待存量请求结束之前调用：主动关闭 WebSocket 长连接（1012），
+    否则优雅退出需要一直等到超时
+    """
+    from app.core.meeting_manager import meeting_manager
+    from app.core.socket_manager import manager
+
+    await manager.close_all(code=1012)
+    await meeting_manager.close_all(code=1012)
+
+
+@asynccontextmanager
+async def lifespan(_: FastAPI):
+    """
+    客户端在启动时创建（除 worker id 租约外均不建立网络连接），关闭时按依赖顺序释放：
+    先写完队列中的数据，再关闭 Redis 与数据库连接池
+    """
+    get_engine()
+    get_redis()
+    loop_monitor.start()
+    # serve.py 多进程部署时每个 worker 在单独的端口上提供指标，见 common/metrics.py
+    metrics_server = None
+    metrics_port = int(os.getenv("WORKER_METRICS_PORT", 0))
+    if metrics_port:
+        REGISTRY.set_const_labels(worker=os.getenv("WORKER_INDEX", "0"))
+        metrics_server = await start_metrics_server(os.getenv("METRICS_HOST", "0.0.0.0"), metrics_port)
+    # 申请 Snowflake worker id（Redis 租约），获得之前不能写入消息、创建会话
+    await start_id_generator()
+    # 创建未来的消息分区、归档冷分区（多进程时只有一个进程执行）
+    from app.services.chat_archive_service import partition_maintainer
+
+    partition_maintainer.start()
+    yield
+    if metrics_server is not None:
+        metrics_server.close()
+    await loop_monitor.stop()
+    await partition_maintainer.close()
+
+    # 业务模块在关闭时才导入，避免影响启动耗时
+    from app.core.meeting_manager import meeting_manager
+    from app.core.socket_manager import manager
+    from app.services.avatar_service import shutdown_avatar_workers
+    from app.services.chat_receipt_service import ephemeral_coalescer, read_cursor_writer
+    from app.services.login_log_service import login_audit
+    from app.services.user_service import user_info_cache
+
+    # 写入尚未落库的登录日志、已读位置，推送尚未发出的临时事件
+    await login_audit.close()
+    await read_cursor_writer.close()
+    await ephemeral_coalescer.close()
+    await shutdown_avatar_workers()
+    await user_info_cache.close()
+    await manager.close()
+    await meeting_manager.close()
+    await close_id_generator()
+    await close_redis()
+    await dispose_engine()
+    _logger.info("应用资源已释放")
@@ -0,0 +1,396 @@
+"""
+会议信令：房间成员保存在当前进程内存中，通过 Redis 同步到其他进程/节点
+
+- 每个房间对应一个 Redis 频道，只有本进程有该房间成员时才订阅
+- 成员列表保存在 Redis hash 中（带所在节点 ID），用于跨节点的房间人数限制与 meeting_state；
+  节点通过心跳 key 声明存活，宕机节点遗留的成员在下次有人加入时清理
+- SDP/ICE 等消息只序列化一次，本进程成员直接复用同一个文本帧，跨节点时原样转发
+- 每个连接的发送队列有界，消费过慢的连接会被断开，而不是无限堆积内存
+"""
+import asyncio
+import logging
+import os
+import time
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
+
+import orjson
+from fastapi import WebSocket
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+from app.core.redis_client import get_redis
+from common.metrics import REGISTRY
+
+_logger = logging.getLogger(__name__)
+
+MEET_MAX_ROOM_SIZE = int(os.getenv("MEET_MAX_ROOM_SIZE", 16))
+MEET_MAX_ROOMS = int(os.getenv("MEET_MAX_ROOMS", 5000))
+MEET_MAX_MESSAGE_BYTES = int(os.getenv("MEET_MAX_MESSAGE_BYTES", 64 * 1024))
+MEET_SEND_QUEUE_SIZE = int(os.getenv("MEET_SEND_QUEUE_SIZE", 256))
+# 节点心跳过期时间（秒）
+NODE_TTL = 30
+# Redis 出错后在这段时间内不再访问，只在本进程内转发（秒）
+REDIS_RETRY_INTERVAL = 5
+
+# 自定义关闭码
+CLOSE_ROOM_FULL = 4001
+CLOSE_TOO_MANY_ROOMS = 4002
+CLOSE_SLOW_CONSUMER = 4003
+
+_ROOMS = REGISTRY.gauge("meet_rooms", "本进程的会议房间数")
+_PARTICIPANTS = REGISTRY.gauge("meet_participants", "本进程的会议连接数")
+_SLOW_CONSUMERS = REGISTRY.counter("meet_slow_consumers_total", "因发送队列已满被断开的连接数")
+
+# KEYS[1]: 成员 hash；ARGV: 成员ID、成员 JSON、房间人数上限
+_JOIN_SCRIPT = """
+if redis.call('HEXISTS', KEYS[1], ARGV[1]) == 0 and redis.call('HLEN', KEYS[1]) >= tonumber(ARGV[3]) then
+    return 0
+end
+redis.call('HSET', KEYS[1], ARGV[1], ARGV[2])
+redis.call('EXPIRE', KEYS[1], 86400)
+return 1
+"""
+
+
+class MeetingJoinError(Exception):
+    def __init__(self, code: int, reason: str):
+        super().__init__(reason)
+        self.code = code
+        self.reason = reason
+
+
+def encode_event(event_type: str, data, sender: Optional[str] = None) -> str:
+    event = {"type": event_type, "data": data}
+    if sender is not None:
+        event["from"] = sender
+    return orjson.dumps(event).decode()
+
+
+@dataclass(eq=False)
+class Member:
+    id: str
+    room_id: str
+    websocket: WebSocket
+    participant: dict
+    queue: asyncio.Queue
+    writer: Optional[asyncio.Task] = None
+    closed: bool = False
+
+
+@dataclass(eq=False)
+class Room:
+    id: str
+    started_at: str
+    members: Dict[str, Member] = field(default_factory=dict)
+
+
+class MeetingManager:
+    def __init__(self, redis_factory: Callable[[], Redis] = get_redis, max_room_size: int = MEET_MAX_ROOM_SIZE,
+                 max_rooms: int = MEET_MAX_ROOMS, send_queue_size: int = MEET_SEND_QUEUE_SIZE):
+        self.redis_factory = redis_factory
+        self.max_room_size = max_room_size
+        self.max_rooms = max_rooms
+        self.send_queue_size = send_queue_size
+        self.node_id = uuid.uuid4().hex[:12]
+        self.rooms: Dict[str, Room] = {}
+        self._pubsub = None
+        self._listener: Optional[asyncio.Task] = None
+        self._heartbeat: Optional[asyncio.Task] = None
+        self._join_script = None
+        self._closing = False
+        self._redis_retry_at = 0.0
+        _ROOMS.set_function(lambda: len(self.rooms))
+        _PARTICIPANTS.set_function(lambda: sum(len(r.members) for r in self.rooms.values()))
+
+    @staticmethod
+    def _channel(room_id: str) -> str:
+        return f"meet:ch:{room_id}"
+
+    @staticmethod
+    def _members_key(room_id: str) -> str:
+        return f"meet:members:{room_id}"
+
+    def _node_key(self, node_id: Optional[str] = None) -> str:
+        return f"meet:node:{node_id or self.node_id}"
+
+    def _redis(self) -> Optional[Redis]:
+        """
+        Redis 出错后的一段时间内返回 None，避免每条消息都等待连接超时
+        """
+        if time.monotonic() < self._redis_retry_at:
+            return None
+        return self.redis_factory()
+
+    def _redis_failed(self, action: str, e: RedisError):
+        if time.monotonic() >= self._redis_retry_at:
+            _logger.warning("%s失败，%d 秒内会议消息只在本进程内转发: %s", action, REDIS_RETRY_INTERVAL, e)
+        self._redis_retry_at = time.monotonic() + REDIS_RETRY_INTERVAL
+
+    async def join(self, room_id: str, websocket: WebSocket, participant: dict) -> Member:
+        """
+        加入房间：检查人数上限，向新成员发送 meeting_state，向其他成员广播 participant_join
+        :raises MeetingJoinError: 房间已满或本进程房间数达到上限
+        """
+        room = self.rooms.get(room_id)
+        if room is None and len(self.rooms) >= self.max_rooms:
+            raise MeetingJoinError(CLOSE_TOO_MANY_ROOMS, "too many rooms")
+        if room is not None and len(room.members) >= self.max_room_size:
+            raise MeetingJoinError(CLOSE_ROOM_FULL, "room is full")
+
+        member = Member(id=participant["id"], room_id=room_id, websocket=websocket, participant=participant,
+                        queue=asyncio.Queue(self.send_queue_size))
+        others = await self._register_remote(room_id, member)
+        # 注册期间可能有其他连接创建了同一房间；Redis 不可用时按本进程的成员数检查，先检查再创建房间，
+        # 避免房间已满时留下没有成员的房间与订阅
+        room = self.rooms.get(room_id)
+        if others is None and room is not None and len(room.members) >= self.max_room_size:
+            raise MeetingJoinError(CLOSE_ROOM_FULL, "room is full")
+        if room is None:
+            room = self.rooms[room_id] = Room(room_id, datetime.now(timezone.utc).isoformat())
+            await self._subscribe(room_id)
+        if others is None:
+            others = [m.participant for m in room.members.values()]
+        room.members[member.id] = member
+        member.writer = asyncio.create_task(self._write(member))
+
+        self.send(member, encode_event("meeting_state", {
+            "id": room_id,
+            "topic": room_id,
+            "startedAt": room.started_at,
+            "participants": others,
+            "self": participant,
+        }))
+        await self.broadcast(member, encode_event("participant_join", participant, member.id))
+        return member
+
+    async def _register_remote(self, room_id: str, member: Member) -> Optional[List[dict]]:
+        """
+        在 Redis 中登记成员，返回房间内其他成员；Redis 不可用时返回 None，退化为单进程房间
+        """
+        redis = self._redis()
+        if redis is None:
+            return None
+        try:
+            self._ensure_heartbeat()
+            key = self._members_key(room_id)
+            raw = await redis.hgetall(key)
+            members = {pid: orjson.loads(value) for pid, value in raw.items()}
+            # 清理已下线节点遗留的成员
+            nodes = list({m.get("node") for m in members.values()})
+            alive = dict(zip(nodes, await redis.mget([self._node_key(n) for n in nodes]))) if nodes else {}
+            stale = [pid for pid, m in members.items() if m.get("node") != self.node_id and not alive.get(m.get("node"))]
+            if stale:
+                await redis.hdel(key, *stale)
+                for pid in stale:
+                    members.pop(pid)
+
+            if self._join_script is None:
+                self._join_script = redis.register_script(_JOIN_SCRIPT)
+            value = orjson.dumps({**member.participant, "node": self.node_id}).decode()
+            if not await self._join_script(keys=[key], args=[member.id, value, self.max_room_size], client=redis):
+                raise MeetingJoinError(CLOSE_ROOM_FULL, "room is full")
+        except RedisError as e:
+            self._redis_failed("登记会议成员", e)
+            return None
+        return [{k: v for k, v in m.items() if k != "node"} for pid, m in members.items() if pid != member.id]
+
+    async def leave(self, member: Member):
+        room = self.rooms.get(member.room_id)
+        if room is None or room.members.get(member.id) is not member:
+            return
+        del room.members[member.id]
+        if not room.members:
+            del self.rooms[room.id]
+            await self._unsubscribe(room.id)
+        await self._close_member(member)
+        await self.broadcast(member, encode_event("participant_leave", {"id": member.id}, member.id))
+        redis = self._redis()
+        if redis is not None:
+            try:
+                await redis.hdel(self._members_key(member.room_id), member.id)
+            except RedisError as e:
+                self._redis_failed("移除会议成员", e)
+
+    async def update_participant(self, member: Member, **changes):
+        """
+        更新成员状态（静音、摄像头、共享屏幕），以 participant_join 广播，前端按 id 合并
+        """
+        member.participant.update(changes)
+        redis = self._redis()
+        if redis is not None:
+            try:
+                value = orjson.dumps({**member.participant, "node": self.node_id}).decode()
+                await redis.hset(self._members_key(member.room_id), member.id, value)
+            except RedisError as e:
+                self._redis_failed("更新会议成员", e)
+        await self.broadcast(member, encode_event("participant_join", member.participant, member.id))
+
+    async def broadcast(self, sender: Member, frame: str, target: Optional[str] = None):
+        """
+        发送给房间内除 sender 外的成员；指定 target 时只发给该成员
+        """
+        delivered = self._deliver_local(sender.room_id, frame, sender.id, target)
+        redis = self._redis()
+        if redis is None or (target is not None and delivered):
+            return
+        try:
+            await redis.publish(self._channel(sender.room_id), f"{self.node_id}|{target or ''}|{frame}")
+        except RedisError as e:
+            self._redis_failed("跨节点转发会议消息", e)
+
+    def _deliver_local(self, room_id: str, frame: str, exclude: Optional[str], target: Optional[str]) -> bool:
+        room = self.rooms.get(room_id)
+        if room is None:
+            return False
+        if target:
+            member = room.members.get(target)
+            if member is None:
+                return False
+            self.send(member, frame)
+            return True
+        for member in list(room.members.values()):
+            if member.id != exclude:
+                self.send(member, frame)
+        return True
+
+    def send(self, member: Member, frame: str):
+        """
+        放入成员的发送队列，由该连接的写协程发送；队列已满说明客户端消费过慢，断开连接
+        """
+        if member.closed:
+            return
+        try:
+            member.queue.put_nowait(frame)
+        except asyncio.QueueFull:
+            _SLOW_CONSUMERS.inc()
+            _logger.warning("会议连接发送队列已满，断开: room=%s member=%s", member.room_id, member.id)
+            member.closed = True
+            asyncio.create_task(self._close_websocket(member, CLOSE_SLOW_CONSUMER, "slow consumer"))
+
+    @staticmethod
+    async def _write(member: Member):
+        try:
+            while True:
+                frame = await member.queue.get()
+                if frame is None:
+                    return
+                await member.websocket.send_text(frame)
+        except Exception:
+            # 连接已断开，由读循环负责 leave
+            member.closed = True
+
+    async def _close_member(self, member: Member):
+        member.closed = True
+        if member.writer is not None:
+            member.writer.cancel()
+            await asyncio.gather(member.writer, return_exceptions=True)
+
+    @staticmethod
+    async def _close_websocket(member: Member, code: int, reason: str):
+        try:
+            await member.websocket.close(code=code, reason=reason)
+        except Exception:
+            pass
+
+    async def _subscribe(self, room_id: str):
+        if self._pubsub is not None:
+            try:
+                await self._pubsub.subscribe(self._channel(room_id))
+            except RedisError as e:
+                self._redis_failed("订阅会议频道", e)
+                await self._reset_pubsub()
+        # 订阅连接尚未建立或已断开时，由 _listen 重新订阅全部房间
+        if self._listener is None or self._listener.done():
+            self._listener = asyncio.create_task(self._listen())
+
+    async def _unsubscribe(self, room_id: str):
+        if self._pubsub is None:
+            return
+        try:
+            await self._pubsub.unsubscribe(self._channel(room_id))
+        except RedisError as e:
+            self._redis_failed("取消订阅会议频道", e)
+            await self._reset_pubsub()
+
+    async def _resubscribe(self) -> bool:
+        redis = self._redis()
+        if redis is None:
+            return False
+        pubsub = redis.pubsub(ignore_subscribe_messages=True)
+        try:
+            await pubsub.subscribe(*(self._channel(room_id) for room_id in self.rooms))
+        except RedisError as e:
+            self._redis_failed("订阅会议频道", e)
+            await pubsub.aclose()
+            return False
+        self._pubsub = pubsub
+        return True
+
+    async def _reset_pubsub(self):
+        pubsub, self._pubsub = self._pubsub, None
+        if pubsub is not None:
+            try:
+                await pubsub.aclose()
+            except RedisError:
+                pass
+
+    async def _listen(self):
+        prefix = len("meet:ch:")
+        # 读取超时时 redis 客户端可能吞掉 CancelledError，因此同时检查 _closing
+        while self.rooms and not self._closing:
+            if self._pubsub is None and not await self._resubscribe():
+                await asyncio.sleep(1)
+                continue
+            try:
+                message = await self._pubsub.get_message(timeout=1.0)
+            except RedisError as e:
+                self._redis_failed("接收会议频道消息", e)
+                await self._reset_pubsub()
+                continue
+            if message is None or message["type"] != "message":
+                continue
+            node_id, target, frame = message["data"].split("|", 2)
+            if node_id == self.node_id:
+                continue
+            self._deliver_local(message["channel"][prefix:], frame, None, target or None)
+
+    def _ensure_heartbeat(self):
+        if self._heartbeat is None or self._heartbeat.done():
+            self._heartbeat = asyncio.create_task(self._beat())
+
+    async def _beat(self):
+        while True:
+            try:
+                await self.redis_factory().set(self._node_key(), int(time.time()), ex=NODE_TTL)
+            except RedisError as e:
+                self._redis_failed("会议节点心跳", e)
+            await asyncio.sleep(NODE_TTL / 3)
+
+    async def close_all(self, code: int = 1012, reason: str = "server restarting"):
+        members = [m for room in self.rooms.values() for m in room.members.values()]
+        await asyncio.gather(*(self._close_websocket(m, code, reason) for m in members))
+        if members:
+            _logger.info("已关闭 %d 个会议连接", len(members))
+
+    async def close(self):
+        self._closing = True
+        for task in (self._listener, self._heartbeat):
+            if task is not None:
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+        self._listener = self._heartbeat = None
+        await self._reset_pubsub()
+        try:
+            redis = self.redis_factory()
+            for room in self.rooms.values():
+                if room.members:
+                    await redis.hdel(self._members_key(room.id), *room.members)
+            await redis.delete(self._node_key())
+        except RedisError:
+            pass
+
+
+meeting_manager = MeetingManager()
@@ -0,0 +1,44 @@
+import os
+
+from fastapi import Body, Depends
+from fastapi.security import OAuth2PasswordRequestForm
+
+from app.core.redis_client import get_redis
+from app.schemas import UserLoginParams, UserRegisterParams
+from common.rate_limit import RateLimiter
+
+# 每分钟允许的次数，可通过环境变量调整
+login_ip_limiter = RateLimiter("login:ip", int(os.getenv("RATE_LIMIT_LOGIN_IP", 20)), 60, get_redis)
+login_account_limiter = RateLimiter("login:account", int(os.getenv("RATE_LIMIT_LOGIN_ACCOUNT", 5)), 60, get_redis)
+register_ip_limiter = RateLimiter("register:ip", int(os.getenv("RATE_LIMIT_REGISTER_IP", 5)), 60, get_redis)
+register_account_limiter = RateLimiter("register:account", int(os.getenv("RATE_LIMIT_REGISTER_ACCOUNT", 3)), 60,
+                                       get_redis)
+
+# IP 维度：由中间件在解析请求体之前检查
+IP_RATE_LIMIT_RULES = {
+    ("POST", "/users/login"): login_ip_limiter,
+    ("POST", "/users/oauth2/login"): login_ip_limiter,
+    ("POST", "/users/register"): register_ip_limiter,
+}
+
+
+def _account_key(account: str) -> str:
+    return account.strip().lower()
+
+
+async def limited_login_params(data: UserLoginParams = Body()) -> UserLoginParams:
+    """
+    账号维度限流，在查询用户和校验密码（Argon2）之前执行
+    """
+    await login_account_limiter.check(_account_key(data.username))
+    return data
+
+
+async def limited_oauth2_form(form_data: OAuth2PasswordRequestForm = Depends()) -> OAuth2PasswordRequestForm:
+    await login_account_limiter.check(_account_key(form_data.username))
+    return form_data
+
+
+async def limited_register_params(params: UserRegisterParams = Body()) -> UserRegisterParams:
+    await register_account_limiter.check(_account_key(params.email))
+    return params
@@ -0,0 +1,25 @@
+import os
+from typing import Optional
+
+import redis.asyncio as redis
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://:helloredis@192.168.2.28:6379/0")
+
+_client: Optional[redis.Redis] = None
+
+
+def get_redis() -> redis.Redis:
+    """
+    进程内共享的 Redis 客户端（首次使用时创建，连接池惰性建立连接）
+    """
+    global _client
+    if _client is None:
+        _client = redis.from_url(REDIS_URL, encoding="utf-8", decode_responses=True)
+    return _client
+
+
+async def close_redis():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
@@ -1,49 +1,181 @@
 import asyncio
 import json
-from typing import Dict
+import logging
+from typing import Dict, Optional, Set
 
 import redis.asyncio as redis
 from fastapi import WebSocket
+from redis.exceptions import RedisError
+
+from app.core.redis_client import REDIS_URL
+from common.metrics import REGISTRY
+from common.ws_compression import WS_MAX_FRAME_BYTES
+
+_logger = logging.getLogger(__name__)
+
+_MESSAGES = REGISTRY.counter("websocket_messages_total", "WebSocket 消息数", ["direction"])
+# received: 客户端发来；published: 发布到 Redis；delivered: 推送给本进程的连接
+_RECEIVED = _MESSAGES.labels("received")
+_PUBLISHED = _MESSAGES.labels("published")
+_DELIVERED = _MESSAGES.labels("delivered")
+_ONLINE = REGISTRY.gauge("websocket_online_users", "本进程在线用户数")
+_OVERSIZE = REGISTRY.counter("websocket_oversize_frames_total", "超过最大帧大小而未发送的消息数")
 
 
 class ConnectionManager:
-    def __init__(self, redis_url: str="redis://:helloredis@192.168.2.28:6379/0"):
-        # 存放激活的连接: key=user_id, value=WebSocket
-        self.active_connections: Dict[str, WebSocket] = {}
-        # Redis 用于跨进程通信
-        self.redis = redis.from_url(redis_url, encoding="utf-8", decode_responses=True)
-        self.pubsub = self.redis.pubsub()
-
-    async def connect(self, websocket: WebSocket, user_id: str):
+    def __init__(self, redis_url: str = REDIS_URL):
+        # 存放激活的连接: key=user_id, value=该用户在本进程的全部 WebSocket（多端同时在线）
+        self.active_connections: Dict[str, Set[WebSocket]] = {}
+        self.redis_url = redis_url
+        self._redis: Optional[redis.Redis] = None
+        self._pubsub = None
+        # 每个进程只有一个监听任务，按频道分发给本进程的连接
+        self._listener: Optional[asyncio.Task] = None
+        self._closing = False
+        _ONLINE.set_function(lambda: len(self.active_connections))
+
+    @property
+    def redis(self) -> redis.Redis:
+        """
+        Redis 用于跨进程通信，首次使用时创建
+        """
+        if self._redis is None:
+            self._redis = redis.from_url(self.redis_url, encoding="utf-8", decode_responses=True)
+        return self._redis
+
+    @staticmethod
+    def _channel(user_id) -> str:
+        return f"user:{user_id}"
+
+    async def close(self):
+        self._closing = True
+        if self._listener is not None:
+            self._listener.cancel()
+            await asyncio.gather(self._listener, return_exceptions=True)
+            self._listener = None
+        await self._reset_pubsub()
+        if self._redis is not None:
+            await self._redis.aclose()
+            self._redis = None
+
+    async def close_all(self, code: int = 1012, reason: str = "server restarting"):
+        """
+        关闭本进程的全部连接，默认使用 1012（服务重启），客户端收到后应重连到其他实例
+        """
+        connections = [ws for sockets in self.active_connections.values() for ws in sockets]
+        results = await asyncio.gather(*(ws.close(code=code, reason=reason) for ws in connections),
+                                       return_exceptions=True)
+        failed = sum(isinstance(r, Exception) for r in results)
+        _logger.info("已关闭 %d 个 WebSocket 连接（失败 %d）", len(connections) - failed, failed)
+
+    async def connect(self, websocket: WebSocket, user_id):
         await websocket.accept()
-        self.active_connections[user_id] = websocket
-        # 每个人上线时，订阅自己的频道 (user:{user_id})
-        await self.subscribe_to_channel(user_id)
+        sockets = self.active_connections.setdefault(str(user_id), set())
+        sockets.add(websocket)
+        # 用户在本进程的第一个连接上线时，订阅自己的频道 (user:{user_id})
+        if len(sockets) == 1:
+            await self.subscribe_to_channel(user_id)
+
+    @staticmethod
+    async def receive_text(websocket: WebSocket) -> str:
+        data = await websocket.receive_text()
+        _RECEIVED.inc()
+        return data
 
-    async def disconnect(self, user_id: str):
-        if user_id in self.active_connections:
-            del self.active_connections[user_id]
-            # 实际项目中可能需要取消订阅，或者保留订阅以处理离线推送
+    async def disconnect(self, user_id, websocket: WebSocket):
+        """
+        移除连接；用户在本进程已没有连接时取消订阅其频道
+        """
+        sockets = self.active_connections.get(str(user_id))
+        if sockets is None:
+            return
+        sockets.discard(websocket)
+        if not sockets:
+            del self.active_connections[str(user_id)]
+            await self._unsubscribe(user_id)
 
-    async def subscribe_to_channel(self, user_id: str):
+    async def subscribe_to_channel(self, user_id):
         """
         订阅 Redis 频道，监听发给该用户的消息
         """
-        await self.pubsub.subscribe(f"user:{user_id}")
-        # 启动后台任务监听 Redis 消息
-        asyncio.create_task(self.redis_listener(user_id))
+        if self._pubsub is not None:
+            try:
+                await self._pubsub.subscribe(self._channel(user_id))
+            except RedisError as e:
+                _logger.warning("订阅用户频道失败: %s", e)
+                await self._reset_pubsub()
+        # 订阅连接尚未建立或已断开时，由 redis_listener 重新订阅全部在线用户
+        if self._listener is None or self._listener.done():
+            self._listener = asyncio.create_task(self.redis_listener())
+
+    async def _unsubscribe(self, user_id):
+        if self._pubsub is None:
+            return
+        try:
+            await self._pubsub.unsubscribe(self._channel(user_id))
+        except RedisError as e:
+            _logger.warning("取消订阅用户频道失败: %s", e)
+            await self._reset_pubsub()
+
+    async def _resubscribe(self) -> bool:
+        pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+        try:
+            await pubsub.subscribe(*(self._channel(user_id) for user_id in self.active_connections))
+        except RedisError as e:
+            _logger.warning("订阅用户频道失败: %s", e)
+            await pubsub.aclose()
+            return False
+        self._pubsub = pubsub
+        return True
+
+    async def _reset_pubsub(self):
+        pubsub, self._pubsub = self._pubsub, None
+        if pubsub is not None:
+            try:
+                await pubsub.aclose()
+            except RedisError:
+                pass
+
+    async def redis_listener(self):
+        """
+        监听 Redis 消息，按频道推送到本进程中该用户的全部 WebSocket
+        """
+        prefix = len("user:")
+        # 读取超时时 redis 客户端可能吞掉 CancelledError，因此同时检查 _closing
+        while self.active_connections and not self._closing:
+            if self._pubsub is None and not await self._resubscribe():
+                await asyncio.sleep(1)
+                continue
+            try:
+                message = await self._pubsub.get_message(timeout=1.0)
+            except RedisError as e:
+                _logger.warning("接收用户频道消息失败: %s", e)
+                await self._reset_pubsub()
+                continue
+            if message is None or message["type"] != "message":
+                continue
+            sockets = self.active_connections.get(message["channel"][prefix:])
+            if not sockets:
+                continue
+            # 频道中已经是编码好的帧，原样转发；单个连接发送失败由其读循环负责 disconnect
+            results = await asyncio.gather(*(ws.send_text(message["data"]) for ws in list(sockets)),
+                                           return_exceptions=True)
+            _DELIVERED.inc(sum(not isinstance(r, Exception) for r in results))
+
+    async def publish(self, user_id, payload: dict):
+        await self.publish_text(user_id, json.dumps(payload))
 
-    async def redis_listener(self, user_id: str):
+    async def publish_text(self, user_id, text: str):
         """
-        监听 Redis 消息并推送到 WebSocket
+        推送给用户：发布到该用户的频道，由其所在进程转发到 WebSocket；超过 WS_MAX_FRAME_BYTES 的消息不发送
         """
-        async for message in self.pubsub.listen():
-            if message["type"] == "message":
-                data = json.loads(message["data"])
-                # 如果用户当前连接在本进程，通过 WebSocket 发送
-                if user_id in self.active_connections:
-                    ws = self.active_connections[user_id]
-                    await ws.send_text(json.dumps(data))
+        # 字符数 * 3 为 UTF-8 字节数上限，绝大多数消息不需要编码就能判断
+        if len(text) * 3 > WS_MAX_FRAME_BYTES and len(text.encode()) > WS_MAX_FRAME_BYTES:
+            _OVERSIZE.inc()
+            _logger.warning("消息超过最大帧大小，未发送: user=%s size=%d", user_id, len(text.encode()))
+            return
+        await self.redis.publish(self._channel(user_id), text)
+        _PUBLISHED.inc()
 
     async def send_personal_message(self, message: str, sender_id: str, receiver_id: str):
         """
@@ -55,7 +187,7 @@ class ConnectionManager:
             "type": "private"
         }
         # 发布到接收者的频道
-        await self.redis.publish(f"user:{receiver_id}", json.dumps(payload))
+        await self.publish(receiver_id, payload)
 
         # 可选：同时也推给自己（多端同步）
         # await self.redis.publish(f"user:{sender_id}", json.dumps(payload))
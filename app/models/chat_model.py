@@ -1,27 +1,93 @@
-from sqlalchemy import Column, String, BigInteger, ForeignKey
-from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy import Column, String, BigInteger, ForeignKey, Index, DateTime, func
+from sqlalchemy.dialects.postgresql import JSONB, TSVECTOR
+from sqlalchemy.orm import deferred
 
 from app.core.db import Base
+from app.core.id_generator import next_id
 
 
 class ChatConversation(Base):
     __tablename__ = 'chat_conversation'
 
+    # 进程内生成的 Snowflake ID（见 common.snowflake），不使用数据库序列
+    id = Column(BigInteger, primary_key=True, autoincrement=False, default=next_id)
     name = Column(String)
     user_id = Column(BigInteger, ForeignKey("t_user.id"))
 
 
 class ChatConversationMember(Base):
     __tablename__ = 'chat_conversation_member'
+    __table_args__ = (
+        Index("ix_chat_conversation_member_conversation_user", "conversation_id", "user_id"),
+        Index("ix_chat_conversation_member_user", "user_id", "conversation_id"),
+    )
+
     conversation_id = Column(BigInteger, ForeignKey("chat_conversation.id"))
     user_id = Column(BigInteger, ForeignKey("t_user.id"))
     features = Column(JSONB)
+    # 已读到的最新消息ID，只增不减
+    last_read_message_id = Column(BigInteger)
 
 
 class ChatMessage(Base):
+    """
+    聊天消息，按 created_at 按月分区（UTC 月初为边界，分区由 chat_archive_service.ensure_partitions 预先创建），
+    冷分区导出为 Parquet 后从表中移除，登记在 chat_message_archive
+    """
     __tablename__ = 'chat_message'
+    __table_args__ = (
+        Index("ix_chat_message_conversation_time", "conversation_id", "created_at", "id"),
+        Index("ix_chat_message_search_vector", "search_vector", postgresql_using="gin"),
+        Index("ix_chat_message_content_trgm", "content", postgresql_using="gin",
+              postgresql_ops={"content": "gin_trgm_ops"}),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
 
+    # 进程内生成的 Snowflake ID，按时间排序；写入前即可确定，created_at 取自 ID 中的时间
+    id = Column(BigInteger, primary_key=True, autoincrement=False, default=next_id)
     conversation_id = Column(BigInteger, ForeignKey("chat_conversation.id"))
     user_id = Column(BigInteger, ForeignKey("t_user.id"))
     content = Column(String, nullable=False)
+    # 客户端生成的 clientMessageId，按 (会话, 发送者) 去重见 ChatMessageKey
     msg_id = Column(String, nullable=False)
+    # text: content 为文本；image: content 为 payload 的 JSON
+    kind = Column(String(16), nullable=False, server_default="text")
+    # 全文搜索向量，由触发器 chat_message_search_vector_trigger 在写入时计算（见迁移 a5c9e2f71b48）
+    search_vector = deferred(Column(TSVECTOR))
+    # 分区表的主键必须包含分区键
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), primary_key=True)
+
+
+class ChatMessageKey(Base):
+    """
+    消息幂等键：分区表上的唯一索引必须包含分区键，(conversation_id, user_id, msg_id) 的唯一约束放在这张表中，
+    与消息在同一条语句中写入；超过保留期的记录由 chat_archive_service 清理
+    """
+    __tablename__ = 'chat_message_key'
+    __table_args__ = (
+        Index("ix_chat_message_key_created_at", "created_at"),
+    )
+
+    id = None
+    updated_at = None
+    conversation_id = Column(BigInteger, primary_key=True)
+    # clientMessageId 只在同一发送者内唯一
+    user_id = Column(BigInteger, primary_key=True)
+    msg_id = Column(String, primary_key=True)
+    message_id = Column(BigInteger, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+
+class ChatMessageArchive(Base):
+    """
+    已归档的消息分区：[range_start, range_end) 内的消息位于 location 指向的 Parquet 文件
+    """
+    __tablename__ = 'chat_message_archive'
+
+    partition_name = Column(String, nullable=False, unique=True)
+    range_start = Column(DateTime(timezone=True), nullable=False)
+    range_end = Column(DateTime(timezone=True), nullable=False)
+    # 本地路径或 s3://bucket/key
+    location = Column(String, nullable=False)
+    row_count = Column(BigInteger, nullable=False)
+    size_bytes = Column(BigInteger, nullable=False)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, BigInteger, ForeignKey, func, DateTime
+from sqlalchemy import Column, String, BigInteger, ForeignKey, func, DateTime, Index
 
 from app.core.db import Base
 
@@ -12,6 +12,12 @@ class User(Base):
     password = Column(String(255))
     avatar_url = Column(String(255))
 
+    __table_args__ = (
+        # pg_trgm GIN 索引，支撑前缀/子串 ILIKE 与相似度匹配
+        Index("ix_t_user_name_trgm", "name", postgresql_using="gin", postgresql_ops={"name": "gin_trgm_ops"}),
+        Index("ix_t_user_email_trgm", "email", postgresql_using="gin", postgresql_ops={"email": "gin_trgm_ops"}),
+    )
+
 
 class UserAccount(Base):
     __tablename__ = "user_account"
@@ -20,8 +26,17 @@ class UserAccount(Base):
 
 
 class UserLoginLog(Base):
+    """
+    登录日志，按 login_time 按月分区（分区由 login_log_service.ensure_partitions 预先创建）
+    """
     __tablename__ = "user_login_log"
 
     user_id = Column(BigInteger, ForeignKey("t_user.id"))
     ip_addr = Column(String(39))
-    login_time = Column(DateTime, server_default=func.now())
+    # 分区表的主键必须包含分区键
+    login_time = Column(DateTime, server_default=func.now(), primary_key=True)
+
+    __table_args__ = (
+        Index("ix_user_login_log_user_time", "user_id", "login_time"),
+        {"postgresql_partition_by": "RANGE (login_time)"},
+    )
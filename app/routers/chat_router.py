@@ -1,12 +1,16 @@
-from typing import List
+from typing import List, Optional
 
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Depends, Body
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Depends, Body, Query
 
-from app.core.depends import get_current_user
+from app.core.depends import get_current_user, get_websocket_user
 from app.core.socket_manager import manager
-from app.schemas import TokenUser
-from app.services.chat_service import conversation_list, create_conversation
-from schemas import UserInfo
+from app.schemas import TokenUser, UserInfo, SendFrame, TypingFrame, ReadReceiptFrame, PingFrame, PongFrame, \
+    ErrorFrame, FrameError, decode_frame, encode_frame, ChatSearchPage, ChatHistoryPage
+from app.services.chat_receipt_service import send_typing, send_read_receipt
+from app.services.chat_search_service import search_messages, CHAT_SEARCH_DEFAULT_LIMIT, CHAT_SEARCH_MAX_LIMIT
+from app.services.chat_service import conversation_list, create_conversation, ingest_message, list_messages, \
+    CHAT_HISTORY_DEFAULT_LIMIT, CHAT_HISTORY_MAX_LIMIT
+from common.exceptions import ServiceException
 
 router = APIRouter(tags=["即时通信"])
 
@@ -34,24 +38,61 @@ async def create_conversation_route(token_user: TokenUser = Depends(get_current_
     return await create_conversation(token_user.user_id, with_users)
 
 
+@router.get("/chat/conversations/{conversation_id}/messages", summary='历史消息')
+async def list_messages_route(conversation_id: int,
+                              cursor: Optional[str] = Query(default=None, description="上一页返回的 next_cursor"),
+                              limit: int = Query(default=CHAT_HISTORY_DEFAULT_LIMIT, ge=1, le=CHAT_HISTORY_MAX_LIMIT),
+                              token_user: TokenUser = Depends(get_current_user)) -> ChatHistoryPage:
+    return await list_messages(token_user.user_id, conversation_id, cursor, limit)
+
+
+@router.get("/chat/search", summary='搜索聊天记录')
+async def search_messages_route(q: str = Query(..., min_length=1, max_length=64),
+                                conversation_id: Optional[int] = Query(default=None, description="只搜索该会话"),
+                                cursor: Optional[str] = Query(default=None, description="上一页返回的 next_cursor"),
+                                limit: int = Query(default=CHAT_SEARCH_DEFAULT_LIMIT, ge=1, le=CHAT_SEARCH_MAX_LIMIT),
+                                token_user: TokenUser = Depends(get_current_user)) -> ChatSearchPage:
+    return await search_messages(token_user.user_id, q, conversation_id, cursor, limit)
+
+
 @router.websocket("/websocket/chat")
-async def websocket_endpoint(websocket: WebSocket, token_user: TokenUser = Depends(get_current_user)):
-    await manager.connect(websocket, token_user.user_id)
+async def websocket_endpoint(websocket: WebSocket, token_user: TokenUser = Depends(get_websocket_user)):
+    """
+    即时通信，帧格式见 app.schemas.chat_schema
+    """
+    user_id = token_user.user_id
+    await manager.connect(websocket, user_id)
     try:
         while True:
-            data = await websocket.receive_text()
-            # 假设客户端发来的格式: {"to": "user_b", "msg": "hello"}
-            import json
-            msg_data = json.loads(data)
-            target_user = msg_data.get("to")
-            content = msg_data.get("msg")
-
-            # 1. 保存消息到数据库 (持久化)
-            # await save_message_to_db(user_id, target_user, content)
+            data = await manager.receive_text(websocket)
+            try:
+                frame = decode_frame(data)
+            except FrameError as e:
+                await websocket.send_text(encode_frame(ErrorFrame(message=str(e))))
+                continue
 
-            # 2. 发送消息
-            await manager.send_personal_message(content, token_user.user_id, target_user)
+            try:
+                if isinstance(frame, SendFrame):
+                    # 去重后写入，ack 返回服务端消息ID
+                    reply = await ingest_message(user_id, frame.message)
+                elif isinstance(frame, TypingFrame):
+                    reply = await send_typing(user_id, frame.conversation_id, frame.typing)
+                elif isinstance(frame, ReadReceiptFrame):
+                    reply = await send_read_receipt(user_id, frame.conversation_id, frame.message_id)
+                elif isinstance(frame, PingFrame):
+                    reply = PongFrame(ts=frame.ts)
+                else:
+                    reply = await manager.send_personal_message(frame.msg, user_id, frame.to)
+            except ServiceException as e:
+                reply = ErrorFrame(message=e.detail,
+                                   client_message_id=frame.message.client_message_id
+                                   if isinstance(frame, SendFrame) else None)
+            if reply is not None:
+                await websocket.send_text(encode_frame(reply))
 
     except WebSocketDisconnect:
-        await manager.disconnect(token_user.user_id)
+        pass
+    finally:
+        # 其他异常（如数据库错误）断开连接时同样需要移除，否则连接与频道订阅一直留在本进程
+        await manager.disconnect(user_id, websocket)
         # 可以广播用户下线状态
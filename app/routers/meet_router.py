@@ -0,0 +1,124 @@
+import asyncio
+import logging
+import os
+import uuid
+from typing import Optional
+
+import jwt
+import orjson
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Path, Query
+
+from app.core.depends import fake_decode_token
+from app.core.meeting_manager import meeting_manager, MeetingJoinError, Member, MEET_MAX_MESSAGE_BYTES, encode_event
+from app.services.user_service import UserService
+from common.metrics import REGISTRY
+
+_logger = logging.getLogger(__name__)
+
+router = APIRouter(tags=["视频会议"])
+
+# 前端未携带 token 时是否允许以访客身份加入；访客能收到房间内其他成员的 SDP/ICE，默认关闭
+MEET_ALLOW_GUEST = os.getenv("MEET_ALLOW_GUEST", "false") == "true"
+# 建立连接后等待 join 消息的时间（秒）
+JOIN_TIMEOUT = 10
+
+# 原样转发给房间其他成员的消息类型
+_RELAY_TYPES = {"signal", "whiteboard_event", "chat_message"}
+_KNOWN_TYPES = _RELAY_TYPES | {"mute", "camera", "screen_share", "ping"}
+
+_MESSAGES = REGISTRY.counter("meet_messages_total", "收到的会议信令消息数", ["type"])
+
+
+async def _identify(token: Optional[str]) -> Optional[dict]:
+    """
+    :return: 成员信息；token 无效或不允许访客时返回 None
+    """
+    participant = {"id": uuid.uuid4().hex[:12], "userId": None, "name": None, "muted": False,
+                   "videoEnabled": True, "isPresenter": False}
+    if token:
+        try:
+            user_id = fake_decode_token(token).user_id
+        except (jwt.PyJWTError, KeyError, ValueError):
+            return None
+        user = await UserService.get_user(user_id)
+        participant["userId"] = user_id
+        participant["name"] = user.name if user else f"user - {user_id}"
+    elif MEET_ALLOW_GUEST:
+        participant["name"] = f"访客 {participant['id'][:4]}"
+    else:
+        return None
+    return participant
+
+
+def _payload(msg: dict) -> dict:
+    """
+    payload 不是对象时按空对象处理，不因客户端的错误格式断开连接
+    """
+    payload = msg.get("payload")
+    return payload if isinstance(payload, dict) else {}
+
+
+async def _handle(member: Member, msg: dict):
+    msg_type = msg.get("type")
+    _MESSAGES.labels(msg_type if msg_type in _KNOWN_TYPES else "other").inc()
+    if msg_type in _RELAY_TYPES:
+        # signal 可以通过 to 指定接收方（成员 ID），否则广播给房间内其他成员
+        target = msg.get("to") if msg_type == "signal" else None
+        await meeting_manager.broadcast(member, encode_event(msg_type, msg.get("data"), member.id),
+                                        target if isinstance(target, str) else None)
+    elif msg_type == "mute":
+        await meeting_manager.update_participant(member, muted=bool(_payload(msg).get("muted")))
+    elif msg_type == "camera":
+        await meeting_manager.update_participant(member,
+                                                 videoEnabled=bool(_payload(msg).get("enabled")))
+    elif msg_type == "screen_share":
+        status = _payload(msg).get("status")
+        await meeting_manager.update_participant(member, isPresenter=status == "sharing")
+        await meeting_manager.broadcast(member, encode_event("screen_share", {"status": status}, member.id))
+    elif msg_type == "ping":
+        meeting_manager.send(member, encode_event("pong", None))
+
+
+@router.websocket("/ws/meet/{meeting_id}")
+async def meeting_endpoint(websocket: WebSocket, meeting_id: str = Path(max_length=64),
+                           token: Optional[str] = Query(None)):
+    """
+    会议信令：客户端连接后先发送 {"type": "join"}，之后的 SDP/ICE、白板、聊天消息转发给房间内其他成员
+    """
+    participant = await _identify(token)
+    if participant is None:
+        await websocket.close(code=1008)
+        return
+    await websocket.accept()
+    try:
+        first = orjson.loads(await asyncio.wait_for(websocket.receive_text(), JOIN_TIMEOUT))
+        if first.get("type") != "join":
+            await websocket.close(code=1002, reason="join required")
+            return
+        member = await meeting_manager.join(meeting_id, websocket, participant)
+    except MeetingJoinError as e:
+        await websocket.send_text(encode_event("error", {"code": e.code, "message": e.reason}))
+        await websocket.close(code=e.code, reason=e.reason)
+        return
+    except (asyncio.TimeoutError, orjson.JSONDecodeError, AttributeError):
+        await websocket.close(code=1002)
+        return
+    except WebSocketDisconnect:
+        return
+
+    try:
+        while True:
+            text = await websocket.receive_text()
+            if len(text) > MEET_MAX_MESSAGE_BYTES:
+                await websocket.close(code=1009, reason="message too big")
+                break
+            try:
+                msg = orjson.loads(text)
+            except orjson.JSONDecodeError:
+                continue
+            if isinstance(msg, dict):
+                await _handle(member, msg)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        await meeting_manager.leave(member)
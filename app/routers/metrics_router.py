@@ -0,0 +1,54 @@
+import asyncio
+import os
+import threading
+from typing import Literal
+
+from fastapi import APIRouter, Depends, Query
+from starlette.responses import PlainTextResponse
+
+from app.core.depends import get_admin_user
+from common.exceptions import ServiceException
+from common.loop_monitor import loop_monitor
+from common.metrics import REGISTRY
+from common.profiler import ProfileBusy, SamplingProfiler
+
+# 采样分析接口默认关闭，需要排查时通过 PROFILER_ENABLED=true 开启
+PROFILER_ENABLED = os.getenv("PROFILER_ENABLED", "false") == "true"
+
+router = APIRouter(tags=["监控"])
+
+
+@router.get("/metrics", summary="Prometheus 指标", response_class=PlainTextResponse)
+async def metrics_endpoint() -> PlainTextResponse:
+    """
+    只包含处理本次请求的 worker 的指标；多进程部署时应抓取各 worker 的指标端口（serve.py --metrics-port）
+    """
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@router.get("/debug/loop-stalls", summary="最近的事件循环阻塞及其调用栈", dependencies=[Depends(get_admin_user)])
+async def loop_stalls() -> list:
+    return loop_monitor.recent_stalls()
+
+
+@router.get("/debug/profile", summary="对当前 worker 采样分析", dependencies=[Depends(get_admin_user)])
+async def profile(
+        seconds: float = Query(10, gt=0, le=60, description="采样时长（秒）"),
+        interval_ms: float = Query(5, ge=1, le=100, description="采样间隔（毫秒）"),
+        all_threads: bool = Query(False, description="是否采样所有线程，默认只采样事件循环线程"),
+        output: Literal["json", "collapsed"] = Query("json", description="collapsed 为折叠栈文本，可生成火焰图"),
+):
+    """
+    多进程部署时只分析处理本次请求的 worker（结果中的 pid）
+    """
+    if not PROFILER_ENABLED:
+        raise ServiceException("未启用采样分析", 404)
+    # 在事件循环线程中取得线程 ID，采样在线程池中进行，不阻塞事件循环
+    profiler = SamplingProfiler(interval_ms / 1000, None if all_threads else [threading.get_ident()])
+    try:
+        await asyncio.to_thread(profiler.run, seconds)
+    except ProfileBusy as e:
+        raise ServiceException(str(e), 409)
+    if output == "collapsed":
+        return PlainTextResponse(profiler.collapsed())
+    return profiler.summary()
@@ -1,13 +1,17 @@
 import logging
-from typing import List, Optional
+from typing import Optional
 
-from fastapi import HTTPException, Body, UploadFile, status, File, Depends, Request, APIRouter, Query
+from fastapi import Depends, Request, APIRouter, Query
 from fastapi.security import OAuth2PasswordRequestForm
 from pydantic import BaseModel
 
 from app.core.depends import get_current_user
-from app.schemas import UserRegisterParams, UserInfo, TokenDTO, TokenUser
-from app.services.user_service import UserService
+from app.core.rate_limits import limited_login_params, limited_oauth2_form, limited_register_params
+from app.schemas import UserRegisterParams, UserInfo, TokenDTO, TokenUser, UserSearchPage, LoginRecordPage, \
+    UserLoginParams
+from app.services.avatar_service import AvatarService
+from app.services.login_log_service import LoginLogService, LOGIN_LOG_DEFAULT_LIMIT, LOGIN_LOG_MAX_LIMIT
+from app.services.user_service import UserService, SEARCH_DEFAULT_LIMIT, SEARCH_MAX_LIMIT
 
 _logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/users", tags=["用户服务"])
@@ -18,27 +22,36 @@ class RegisterUserResult(BaseModel):
 
 
 @router.post("/register", summary="用户注册")
-async def user_register_endpoint(params: UserRegisterParams = Body()) -> RegisterUserResult:
+async def user_register_endpoint(params: UserRegisterParams = Depends(limited_register_params)) -> RegisterUserResult:
     result = await UserService.register(params)
     return RegisterUserResult(id=result)
 
 
-ALLOWED_IMAGE_TYPES = {"image/jpeg", "image/png", "image/gif", "image/webp"}
+class AvatarUploadResult(BaseModel):
+    url: str
+    processing: bool = True
 
 
-# 支持的图片类型
-@router.post("/avatar/upload", summary="头像上传")
-async def upload_avatar_endpoint(file: UploadFile = File(...),
-                                 current_user: TokenUser = Depends(get_current_user)) -> bool:
-    if file.content_type not in ALLOWED_IMAGE_TYPES:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"不支持的文件类型: {file.content_type}，请上传图片（jpg/png/gif/webp）"
-        )
+AVATAR_UPLOAD_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {"multipart/form-data": {"schema": {
+            "type": "object",
+            "required": ["file"],
+            "properties": {"file": {"type": "string", "format": "binary"}},
+        }}},
+    }
+}
 
-    _logger.info("上传头像: %s (%s)", file.filename, file.content_type)
 
-    return True
+@router.post("/avatar/upload", summary="头像上传", openapi_extra=AVATAR_UPLOAD_BODY)
+async def upload_avatar_endpoint(request: Request,
+                                 current_user: TokenUser = Depends(get_current_user)) -> AvatarUploadResult:
+    """
+    请求体直接流式写入对象存储（不使用 UploadFile，避免整体缓冲），缩略图生成完成后更新头像地址
+    """
+    url = await AvatarService.upload(request, current_user.user_id)
+    return AvatarUploadResult(url=url)
 
 
 @router.get("/me", summary="我的信息")
@@ -46,23 +59,28 @@ async def read_users_me_endpoint(current_user: TokenUser = Depends(get_current_u
     return await UserService.get_user(user_id=current_user.user_id)
 
 
+@router.get("/me/logins", summary="我的登录记录")
+async def my_logins_endpoint(cursor: Optional[str] = Query(default=None, description="上一页返回的 next_cursor"),
+                             limit: int = Query(default=LOGIN_LOG_DEFAULT_LIMIT, ge=1, le=LOGIN_LOG_MAX_LIMIT),
+                             current_user: TokenUser = Depends(get_current_user)) -> LoginRecordPage:
+    return await LoginLogService.list_logins(current_user.user_id, cursor, limit)
+
+
 @router.post("/oauth2/login", summary="OAuth2登录")
-async def oauth2_login_endpoint(request: Request, form_data: OAuth2PasswordRequestForm = Depends()) -> TokenDTO:
+async def oauth2_login_endpoint(request: Request,
+                                form_data: OAuth2PasswordRequestForm = Depends(limited_oauth2_form)) -> TokenDTO:
     token = await UserService.login(form_data.username, form_data.password, request)
     return token
 
 
-class UserLoginParams(BaseModel):
-    username: str
-    password: str
-
-
 @router.post("/login", summary="用户登录")
-async def login_endpoint(request: Request, data: UserLoginParams = Body()) -> TokenDTO:
+async def login_endpoint(request: Request, data: UserLoginParams = Depends(limited_login_params)) -> TokenDTO:
     token = await UserService.login(data.username, data.password, request)
     return token
 
 
 @router.get("/search", summary="搜索用户")
-async def search_user_route(keyword: Optional[str] = Query(default=None)) -> List[UserInfo]:
-    return await UserService.list_users()
+async def search_user_route(keyword: Optional[str] = Query(default=None, max_length=64),
+                            cursor: Optional[int] = Query(default=None, description="上一页返回的 next_cursor"),
+                            limit: int = Query(default=SEARCH_DEFAULT_LIMIT, ge=1, le=SEARCH_MAX_LIMIT)) -> UserSearchPage:
+    return await UserService.search_users(keyword, cursor, limit)
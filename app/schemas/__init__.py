@@ -1 +1,2 @@
-from .user_schema import *
\ No newline at end of file
+from .user_schema import *
+from .chat_schema import *
\ No newline at end of file
@@ -1,11 +1,14 @@
-from typing import Any, Callable, Optional, Union, List, Dict
+from typing import Any, Callable, Optional, Union, List, Dict, Literal, TYPE_CHECKING
 
-from langchain_core.tools import BaseTool
 from pydantic import BaseModel, Field
 
+if TYPE_CHECKING:
+    from langchain_core.tools import BaseTool
+
 
 class ModelContext(BaseModel):
     user_id: int = Field(..., description="用户ID")
+    priority: Literal["interactive", "background"] = Field("interactive", description="调度优先级")
 
 
 class ModelOutput(BaseModel):
@@ -40,7 +43,8 @@ class ModelOutput(BaseModel):
         }
 
 
-ToolType = Union[BaseTool, Callable, dict[str, Any]]
+# 仅用于类型注解，避免导入 schema 时加载 langchain
+ToolType = Union["BaseTool", Callable, dict[str, Any]]
 
 
 class ToolCall(BaseModel):
@@ -57,6 +61,7 @@ class ReasoningStep(BaseModel):
     tool_output: Optional[str] = None  # 工具出参，例如 "24度，晴"
     status: str = "completed"  # pending / completed / failed
     timestamp: Optional[str] = Field(None)
+    latency_ms: Optional[float] = Field(None)  # 工具执行耗时（毫秒），缓存命中时为 0
 
 
 class ChatMessage(BaseModel):
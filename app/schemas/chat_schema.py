@@ -0,0 +1,197 @@
+"""
+即时通信 WebSocket 帧协议（v1）
+
+每一帧都是一个 JSON 对象，type 字段区分帧类型，v 为协议版本（缺省为 1）：
+
+客户端 -> 服务端
+    send     发送消息，message 为 ChatMessageEnvelope（text / image）
+    typing   正在输入
+    read     已读回执，messageId 为已读到的最新消息ID
+    ping     心跳
+    direct   点对点消息（不落库）
+
+服务端 -> 客户端
+    ack / message / typing / read / pong / error
+
+另含历史消息、消息搜索等 HTTP 接口的响应模型
+"""
+import datetime
+from typing import Annotated, List, Literal, Optional, Union
+
+from pydantic import BaseModel, ConfigDict, Field, TypeAdapter, ValidationError
+from pydantic.alias_generators import to_camel
+
+PROTOCOL_VERSION = 1
+# 超过该长度的帧不解析，直接拒绝
+MAX_FRAME_BYTES = 64 * 1024
+MAX_TEXT_LENGTH = 4000
+# 数据库主键为 BIGINT，超出范围的ID在解析阶段拒绝
+BigIntId = Annotated[int, Field(ge=1, lt=2 ** 63)]
+
+
+class _Model(BaseModel):
+    model_config = ConfigDict(alias_generator=to_camel, populate_by_name=True)
+
+
+class ImageInfo(_Model):
+    url: str = Field(..., min_length=1, max_length=2048)
+    width: Optional[int] = None
+    height: Optional[int] = None
+    size_bytes: Optional[int] = None
+    preview_base64: Optional[str] = Field(None, max_length=16 * 1024)
+
+
+class TextPayload(_Model):
+    text: str = Field(..., min_length=1, max_length=MAX_TEXT_LENGTH)
+
+
+class ImagePayload(_Model):
+    image: ImageInfo
+    caption: Optional[str] = Field(None, max_length=MAX_TEXT_LENGTH)
+
+
+class _EnvelopeBase(_Model):
+    conversation_id: BigIntId
+    client_message_id: str = Field(..., min_length=1, max_length=64, description="客户端生成的唯一ID，用于幂等")
+    metadata: Optional[dict] = None
+    timestamp: int = Field(..., description="发送时间戳，毫秒")
+
+
+class TextMessageEnvelope(_EnvelopeBase):
+    kind: Literal["text"]
+    payload: TextPayload
+
+
+class ImageMessageEnvelope(_EnvelopeBase):
+    kind: Literal["image"]
+    payload: ImagePayload
+
+
+# 字段与前端 ChatMessageEnvelope（frontend_web/src/types/chat.ts）一致
+ChatMessageEnvelope = Annotated[Union[TextMessageEnvelope, ImageMessageEnvelope], Field(discriminator="kind")]
+
+
+class _Frame(_Model):
+    v: Literal[1] = PROTOCOL_VERSION
+
+
+class SendFrame(_Frame):
+    type: Literal["send"]
+    message: ChatMessageEnvelope
+
+
+class TypingFrame(_Frame):
+    type: Literal["typing"]
+    conversation_id: BigIntId
+    typing: bool = True
+
+
+class ReadReceiptFrame(_Frame):
+    type: Literal["read"]
+    conversation_id: BigIntId
+    message_id: BigIntId
+
+
+class PingFrame(_Frame):
+    type: Literal["ping"]
+    ts: Optional[int] = None
+
+
+class DirectFrame(_Frame):
+    type: Literal["direct"]
+    to: int
+    msg: str = Field(..., max_length=MAX_TEXT_LENGTH)
+
+
+ClientFrame = Annotated[Union[SendFrame, TypingFrame, ReadReceiptFrame, PingFrame, DirectFrame],
+                        Field(discriminator="type")]
+
+
+class AckFrame(_Frame):
+    type: Literal["ack"] = "ack"
+    conversation_id: int
+    client_message_id: str
+    message_id: int
+    duplicate: bool = False
+
+
+class MessageFrame(_Frame):
+    type: Literal["message"] = "message"
+    id: int
+    sender_id: int
+    message: ChatMessageEnvelope
+
+
+class TypingEventFrame(_Frame):
+    type: Literal["typing"] = "typing"
+    conversation_id: int
+    user_ids: List[int]
+
+
+class ReadEventFrame(_Frame):
+    type: Literal["read"] = "read"
+    conversation_id: int
+    # {user_id: 已读到的消息ID}
+    cursors: dict[int, int]
+
+
+class PongFrame(_Frame):
+    type: Literal["pong"] = "pong"
+    ts: Optional[int] = None
+
+
+class ErrorFrame(_Frame):
+    type: Literal["error"] = "error"
+    message: str
+    client_message_id: Optional[str] = None
+
+
+class FrameError(ValueError):
+    """
+    无法解析的帧
+    """
+
+
+_client_frame = TypeAdapter(ClientFrame)
+
+
+def decode_frame(data: Union[str, bytes]) -> ClientFrame:
+    """
+    解析客户端帧：先检查长度，再由 pydantic-core 一次完成 JSON 解析与校验（不构造中间 dict）
+    :raises FrameError: 帧过大、不是合法 JSON、类型未知或字段校验失败
+    """
+    if len(data) > MAX_FRAME_BYTES:
+        raise FrameError("frame too large")
+    try:
+        return _client_frame.validate_json(data)
+    except ValidationError as e:
+        error = e.errors(include_url=False, include_context=False, include_input=False)[0]
+        raise FrameError(f"{'.'.join(map(str, error['loc']))}: {error['msg']}" if error["loc"] else error["msg"])
+
+
+def encode_frame(frame: _Frame) -> str:
+    return frame.model_dump_json(by_alias=True, exclude_none=True)
+
+
+class ChatHistoryMessage(BaseModel):
+    id: int
+    conversation_id: int
+    sender_id: int
+    kind: str
+    # 图片消息为 payload 的 JSON
+    content: str
+    created_at: Optional[datetime.datetime]
+
+
+class ChatHistoryPage(BaseModel):
+    items: List[ChatHistoryMessage]
+    next_cursor: Optional[str] = Field(None, description="下一页游标，为空表示没有更多数据")
+
+
+class ChatSearchHit(ChatHistoryMessage):
+    rank: float
+
+
+class ChatSearchPage(BaseModel):
+    items: List[ChatSearchHit]
+    next_cursor: Optional[str] = Field(None, description="下一页游标，为空表示没有更多数据")
@@ -1,5 +1,5 @@
 import datetime
-from typing import Optional
+from typing import Optional, List
 
 from pydantic import BaseModel, Field, EmailStr
 
@@ -15,6 +15,27 @@ class UserInfo(BaseModel):
     avatar_url: Optional[str]
 
 
+class UserSearchPage(BaseModel):
+    items: List[UserInfo]
+    next_cursor: Optional[int] = Field(None, description="下一页游标，为空表示没有更多数据")
+
+
+class LoginRecord(BaseModel):
+    id: int
+    ip_addr: Optional[str]
+    login_time: datetime.datetime
+
+
+class LoginRecordPage(BaseModel):
+    items: List[LoginRecord]
+    next_cursor: Optional[str] = Field(None, description="下一页游标，为空表示没有更多数据")
+
+
+class UserLoginParams(BaseModel):
+    username: str
+    password: str
+
+
 class UserLogin(BaseModel):
     username: str = Field(..., min_length=2)
     password: str = Field(..., min_length=4)
@@ -0,0 +1,231 @@
+import asyncio
+import io
+import logging
+import multiprocessing
+import os
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from typing import AsyncIterator, Dict, Optional, Set
+
+from fastapi import Request, status
+from python_multipart import MultipartParser
+from python_multipart.multipart import parse_options_header
+
+from app.services import storage_service
+from app.services.user_service import UserService
+from common.exceptions import ServiceException
+from common.logging_config import init_logging
+
+_logger = logging.getLogger(__name__)
+
+AVATAR_MAX_BYTES = int(os.getenv("AVATAR_MAX_BYTES", 5 * 1024 * 1024))
+AVATAR_PROCESS_WORKERS = int(os.getenv("AVATAR_PROCESS_WORKERS", 2))
+# 缩略图边长（正方形裁剪），最大的一张作为头像地址
+THUMBNAIL_SIZES = (64, 128, 256)
+
+# 支持的图片类型及对应的扩展名
+IMAGE_EXTENSIONS = {"image/jpeg": ".jpg", "image/png": ".png", "image/gif": ".gif", "image/webp": ".webp"}
+ALLOWED_IMAGE_TYPES = set(IMAGE_EXTENSIONS)
+
+_pool: Optional[ProcessPoolExecutor] = None
+# 持有后台任务的引用，避免被垃圾回收
+_tasks: Set[asyncio.Task] = set()
+
+
+class MultipartFileStream:
+    """
+    增量解析 multipart/form-data 请求体，只取出指定字段的文件内容，不在内存或磁盘中缓冲整个文件
+
+        stream = MultipartFileStream(request, "file")
+        await stream.open()          # 读到文件字段的头部为止
+        async for chunk in stream:   # 文件内容
+            ...
+    """
+
+    def __init__(self, request: Request, field_name: str = "file"):
+        content_type, params = parse_options_header(request.headers.get("content-type", ""))
+        boundary = params.get(b"boundary")
+        if content_type != b"multipart/form-data" or not boundary:
+            raise ServiceException("请求体必须为 multipart/form-data")
+        self.field_name = field_name
+        self.filename: Optional[str] = None
+        self.content_type: Optional[str] = None
+        self._body = request.stream().__aiter__()
+        self._headers: Dict[str, str] = {}
+        self._header_field = b""
+        self._header_value = b""
+        self._in_target = False
+        self._found = False
+        self._finished = False
+        self._chunks = []
+        self._parser = MultipartParser(boundary, {
+            "on_part_begin": self._on_part_begin,
+            "on_header_field": self._on_header_field,
+            "on_header_value": self._on_header_value,
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+            "on_part_data": self._on_part_data,
+            "on_part_end": self._on_part_end,
+        })
+
+    def _on_part_begin(self):
+        self._headers = {}
+
+    def _on_header_field(self, data: bytes, start: int, end: int):
+        self._header_field += data[start:end]
+
+    def _on_header_value(self, data: bytes, start: int, end: int):
+        self._header_value += data[start:end]
+
+    def _on_header_end(self):
+        self._headers[self._header_field.decode("latin-1").lower()] = self._header_value.decode("utf-8", "replace")
+        self._header_field = b""
+        self._header_value = b""
+
+    def _on_headers_finished(self):
+        _, params = parse_options_header(self._headers.get("content-disposition", ""))
+        name = params.get(b"name", b"").decode("utf-8", "replace")
+        if not self._found and name == self.field_name:
+            self._found = self._in_target = True
+            self.filename = params.get(b"filename", b"").decode("utf-8", "replace")
+            self.content_type = self._headers.get("content-type", "application/octet-stream")
+
+    def _on_part_data(self, data: bytes, start: int, end: int):
+        if self._in_target:
+            self._chunks.append(data[start:end])
+
+    def _on_part_end(self):
+        if self._in_target:
+            self._in_target = False
+            self._finished = True
+
+    async def _feed(self) -> bool:
+        try:
+            chunk = await self._body.__anext__()
+        except StopAsyncIteration:
+            return False
+        self._parser.write(chunk)
+        return True
+
+    async def open(self):
+        while not self._found:
+            if not await self._feed():
+                raise ServiceException(f"缺少文件字段: {self.field_name}")
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        while True:
+            if self._chunks:
+                chunks, self._chunks = self._chunks, []
+                for chunk in chunks:
+                    yield chunk
+            if self._finished:
+                return
+            if not await self._feed():
+                raise ServiceException("文件内容不完整")
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # 父进程有日志、看门狗等后台线程，fork 出的子进程会继承没有消费者的日志队列，
+        # 使用 spawn 启动全新的解释器，并在子进程中重新初始化日志
+        _pool = ProcessPoolExecutor(max_workers=AVATAR_PROCESS_WORKERS,
+                                    mp_context=multiprocessing.get_context("spawn"), initializer=init_logging)
+    return _pool
+
+
+def generate_avatar_variants(object_name: str) -> Dict[str, str]:
+    """
+    在子进程中执行：下载原图，生成正方形缩略图和 WebP 版本并上传
+    :return: {"64": url, "128": url, "256": url, "webp": url}
+    """
+    from PIL import Image, ImageOps
+
+    client = storage_service.get_storage()
+    response = client.get_object(storage_service.STORAGE_BUCKET, object_name)
+    try:
+        original = response.read()
+    finally:
+        response.close()
+        response.release_conn()
+
+    image = Image.open(io.BytesIO(original))
+    # 拒绝像素数异常的图片（解压炸弹），只读取第一帧
+    if image.width * image.height > 40_000_000:
+        raise ValueError(f"图片尺寸过大: {image.width}x{image.height}")
+    image = ImageOps.exif_transpose(image).convert("RGBA" if image.mode in ("RGBA", "LA", "P") else "RGB")
+
+    base = object_name.rsplit(".", 1)[0]
+    variants: Dict[str, Image.Image] = {"webp": image}
+    for size in THUMBNAIL_SIZES:
+        variants[str(size)] = ImageOps.fit(image, (size, size), Image.Resampling.LANCZOS)
+
+    urls = {}
+    for key, variant in variants.items():
+        buffer = io.BytesIO()
+        variant.save(buffer, format="WEBP", quality=85, method=4)
+        name = f"{base}_{key}.webp"
+        client.put_object(storage_service.STORAGE_BUCKET, name, io.BytesIO(buffer.getvalue()),
+                          length=buffer.tell(), content_type="image/webp")
+        urls[key] = storage_service.object_url(name)
+    return urls
+
+
+async def _process_avatar(user_id: int, object_name: str, original_url: str):
+    try:
+        variants = await asyncio.get_running_loop().run_in_executor(
+            _get_pool(), generate_avatar_variants, object_name)
+    except Exception:
+        # 无法解码的文件（不是图片、尺寸过大）不能作为公开头像，保留原头像并删除已上传的文件
+        _logger.exception("头像处理失败，保留原头像: user_id=%s object=%s", user_id, object_name)
+        try:
+            await storage_service.delete_object(object_name)
+        except Exception:
+            _logger.exception("删除头像原图失败: object=%s", object_name)
+        return
+    avatar_url = variants.get(str(THUMBNAIL_SIZES[-1]), original_url)
+    await UserService.update_avatar(user_id, avatar_url)
+    _logger.info("头像已更新: user_id=%s url=%s", user_id, avatar_url)
+
+
+class AvatarService:
+    @staticmethod
+    async def upload(request: Request, user_id: int) -> str:
+        """
+        流式上传头像原图，缩略图在进程池中异步生成，完成后更新 avatar_url；
+        原图无法解码时不更新头像，并删除原图
+        :return: 原图地址
+        """
+        content_length = request.headers.get("content-length")
+        # multipart 头部开销有限，明显超过上限的请求直接拒绝，不读取请求体
+        if content_length and content_length.isdigit() and int(content_length) > AVATAR_MAX_BYTES + 64 * 1024:
+            raise storage_service.UploadTooLarge(AVATAR_MAX_BYTES)
+
+        stream = MultipartFileStream(request, "file")
+        await stream.open()
+        if stream.content_type not in ALLOWED_IMAGE_TYPES:
+            raise ServiceException(
+                f"不支持的文件类型: {stream.content_type}，请上传图片（jpg/png/gif/webp）",
+                status.HTTP_400_BAD_REQUEST,
+            )
+        _logger.info("上传头像: %s (%s)", stream.filename, stream.content_type)
+
+        object_name = f"avatars/{user_id}/{uuid.uuid4().hex}{IMAGE_EXTENSIONS[stream.content_type]}"
+        url = await storage_service.upload_stream(stream, object_name, stream.content_type, AVATAR_MAX_BYTES)
+
+        task = asyncio.create_task(_process_avatar(user_id, object_name, url))
+        _tasks.add(task)
+        task.add_done_callback(_tasks.discard)
+        return url
+
+
+async def shutdown_avatar_workers():
+    """
+    等待进行中的头像处理任务并关闭进程池
+    """
+    global _pool
+    if _tasks:
+        await asyncio.gather(*_tasks, return_exceptions=True)
+    if _pool is not None:
+        _pool.shutdown(wait=True)
+        _pool = None
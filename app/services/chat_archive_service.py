@@ -0,0 +1,388 @@
+"""
+聊天消息分区维护与冷数据归档
+
+- chat_message 按 created_at 按月分区（UTC 月初为边界），预先创建当月及未来 CHAT_PARTITION_MONTHS_AHEAD 个月的分区
+- 早于 CHAT_ARCHIVE_AFTER_MONTHS 个月的分区导出为 Parquet（zstd 压缩，按 conversation_id, created_at, id 排序，
+  读取单个会话时可按行组的统计信息跳过其他会话），写入归档目录或对象存储并登记到 chat_message_archive，
+  再从分区表中分离并删除。已归档的消息不再参与全文搜索
+- 历史消息读到数据库中最早的一条之后，由 list_archived_messages 继续从归档中读取
+- chat_message_key 中超过 CHAT_MESSAGE_KEY_RETENTION_DAYS 天的幂等键被清理，此后同一 clientMessageId 重发会写入新消息
+
+多进程部署时通过 advisory lock 保证同一时间只有一个进程执行维护任务。
+归档依赖 pyarrow（可选依赖 archive：uv sync --extra archive），未安装时只维护分区、不归档，也无法读取已归档的消息
+
+环境变量：
+CHAT_PARTITION_MONTHS_AHEAD: 预先创建的未来分区月数，默认 3
+CHAT_ARCHIVE_AFTER_MONTHS: 归档早于该月数的分区，0 表示不归档，默认 12
+CHAT_ARCHIVE_STORE: local / s3，默认 local；s3 时写入 STORAGE_BUCKET 下的 chat-archive/ 目录
+CHAT_ARCHIVE_DIR: local 时的归档目录，s3 时为下载缓存目录，默认 data/chat_archive
+CHAT_MESSAGE_KEY_RETENTION_DAYS: 幂等键保留天数，0 表示不清理，默认 30
+"""
+import asyncio
+import bisect
+import logging
+import os
+import shutil
+import tempfile
+import time
+from datetime import date, datetime, timedelta, timezone
+from typing import List, Optional, Tuple
+
+from sqlalchemy import select, text, delete, insert
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from app.core.db import async_session, get_engine
+from app.models import ChatMessageArchive, ChatMessageKey
+from app.schemas import ChatHistoryMessage
+from app.services import storage_service
+from common.cache import LRUCache
+from common.metrics import REGISTRY
+
+_logger = logging.getLogger(__name__)
+
+CHAT_PARTITION_MONTHS_AHEAD = int(os.getenv("CHAT_PARTITION_MONTHS_AHEAD", 3))
+CHAT_ARCHIVE_AFTER_MONTHS = int(os.getenv("CHAT_ARCHIVE_AFTER_MONTHS", 12))
+CHAT_ARCHIVE_STORE = os.getenv("CHAT_ARCHIVE_STORE", "local")
+CHAT_ARCHIVE_DIR = os.getenv("CHAT_ARCHIVE_DIR", "data/chat_archive")
+CHAT_MESSAGE_KEY_RETENTION_DAYS = int(os.getenv("CHAT_MESSAGE_KEY_RETENTION_DAYS", 30))
+# 对象存储中的归档目录
+ARCHIVE_PREFIX = "chat-archive/"
+# Parquet 行组大小，也是从数据库游标中每次读取的行数
+ARCHIVE_ROW_GROUP_SIZE = 50_000
+# 分离分区需要短暂锁住整张 chat_message，等待超过该时间时放弃，下个周期重试，避免在锁队列中阻塞消息读写
+DETACH_LOCK_TIMEOUT = "5s"
+# pg_try_advisory_lock 的键，同一数据库中的维护任务互斥
+_MAINTENANCE_LOCK_KEY = 0x63686174_61726368
+
+_COLUMNS = ("created_at", "id", "conversation_id", "user_id", "kind", "content", "msg_id", "updated_at")
+
+_ARCHIVED_PARTITIONS = REGISTRY.counter("chat_archive_partitions_total", "已归档的消息分区数")
+_ARCHIVED_ROWS = REGISTRY.counter("chat_archive_rows_total", "已归档的消息条数")
+_ARCHIVE_READ_SECONDS = REGISTRY.histogram("chat_archive_read_seconds", "从归档文件读取单个会话消息的耗时（秒）")
+
+# (归档位置, 会话ID) -> 按 (created_at, id) 升序排列的消息，历史消息翻页时反复读取同一个会话
+_conversation_cache = LRUCache(maxsize=256, ttl=300)
+
+
+def _add_months(day: date, months: int) -> date:
+    month = day.month - 1 + months
+    return date(day.year + month // 12, month % 12 + 1, 1)
+
+
+def _utc(day: date) -> datetime:
+    return datetime(day.year, day.month, day.day, tzinfo=timezone.utc)
+
+
+def _current_month() -> date:
+    return datetime.now(timezone.utc).date().replace(day=1)
+
+
+async def ensure_partitions(months_ahead: int = CHAT_PARTITION_MONTHS_AHEAD):
+    """
+    创建当月及未来 months_ahead 个月的分区，已存在时跳过
+    """
+    start = _current_month()
+    async with async_session() as session:
+        for i in range(months_ahead + 1):
+            lower = _add_months(start, i)
+            upper = _add_months(start, i + 1)
+            await session.execute(text(
+                f"CREATE TABLE IF NOT EXISTS chat_message_p{lower:%Y%m} PARTITION OF chat_message "
+                f"FOR VALUES FROM ('{lower.isoformat()} 00:00:00+00') TO ('{upper.isoformat()} 00:00:00+00')"
+            ))
+        await session.commit()
+
+
+async def purge_message_keys(retention_days: int = CHAT_MESSAGE_KEY_RETENTION_DAYS) -> int:
+    """
+    删除超过保留期的幂等键
+    :return: 删除的条数
+    """
+    if retention_days <= 0:
+        return 0
+    async with async_session() as session:
+        result = await session.execute(delete(ChatMessageKey).where(
+            ChatMessageKey.created_at < datetime.now(timezone.utc) - timedelta(days=retention_days)))
+        await session.commit()
+    return result.rowcount
+
+
+class LocalArchiveStore:
+    """
+    归档文件写入本地目录（可以是挂载的共享存储）
+    """
+
+    def __init__(self, directory: str = CHAT_ARCHIVE_DIR):
+        self.directory = directory
+
+    def put(self, path: str, name: str) -> str:
+        """
+        :return: 归档位置（绝对路径）
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        target = os.path.abspath(os.path.join(self.directory, name))
+        shutil.move(path, target)
+        return target
+
+
+class S3ArchiveStore:
+    """
+    归档文件上传到对象存储（MinIO / S3）
+    """
+
+    def __init__(self, prefix: str = ARCHIVE_PREFIX):
+        self.prefix = prefix
+
+    def put(self, path: str, name: str) -> str:
+        """
+        :return: 归档位置（s3://bucket/key）
+        """
+        object_name = self.prefix + name
+        storage_service.get_storage().fput_object(storage_service.STORAGE_BUCKET, object_name, path,
+                                                  content_type="application/vnd.apache.parquet")
+        os.remove(path)
+        return f"s3://{storage_service.STORAGE_BUCKET}/{object_name}"
+
+
+def get_archive_store():
+    return S3ArchiveStore() if CHAT_ARCHIVE_STORE == "s3" else LocalArchiveStore()
+
+
+def _local_path(location: str) -> str:
+    """
+    对象存储中的归档先下载到 CHAT_ARCHIVE_DIR 下的缓存目录，之后直接读取本地文件（阻塞，在线程中调用）
+    """
+    if not location.startswith("s3://"):
+        return location
+    bucket, object_name = location[len("s3://"):].split("/", 1)
+    path = os.path.join(CHAT_ARCHIVE_DIR, "cache", bucket, object_name)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # 先下载到临时文件，并发下载或中途失败时不会读到不完整的文件
+        fd, tmp = tempfile.mkstemp(suffix=".parquet", dir=os.path.dirname(path))
+        os.close(fd)
+        try:
+            storage_service.get_storage().fget_object(bucket, object_name, tmp)
+            os.replace(tmp, path)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+    return path
+
+
+def _archive_schema(pa):
+    timestamp = pa.timestamp("us", tz="UTC")
+    return pa.schema([("created_at", timestamp), ("id", pa.int64()), ("conversation_id", pa.int64()),
+                      ("user_id", pa.int64()), ("kind", pa.string()), ("content", pa.string()),
+                      ("msg_id", pa.string()), ("updated_at", timestamp)])
+
+
+async def _export_partition(conn: AsyncConnection, partition: str, path: str) -> int:
+    """
+    按批读取分区写入 Parquet，每批为一个行组
+    :return: 写入的行数
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = _archive_schema(pa)
+    writer = pq.ParquetWriter(path, schema, compression="zstd")
+    rows = 0
+    try:
+        # 显式的 SQL 游标：流式结果的 portal 要到事务结束才释放，之后无法在同一事务中删除分区
+        await conn.execute(text(f"DECLARE chat_archive_cursor NO SCROLL CURSOR FOR "
+                                f"SELECT {', '.join(_COLUMNS)} FROM {partition} "
+                                f"ORDER BY conversation_id, created_at, id"))
+        while batch := (await conn.execute(text(f"FETCH {ARCHIVE_ROW_GROUP_SIZE} FROM chat_archive_cursor"))).all():
+            columns = list(zip(*batch))
+            record_batch = pa.record_batch([pa.array(c, type=f.type) for c, f in zip(columns, schema)], schema=schema)
+            await asyncio.to_thread(writer.write_batch, record_batch)
+            rows += len(batch)
+        await conn.execute(text("CLOSE chat_archive_cursor"))
+    finally:
+        await asyncio.to_thread(writer.close)
+    return rows
+
+
+async def archive_partition(conn: AsyncConnection, partition: str, lower: date, upper: date) -> int:
+    """
+    导出一个分区并从分区表中移除，全部步骤在同一个事务中：导出期间分区只读，
+    任一步骤失败时分区保持原样（已上传的文件在下次归档时被覆盖）
+    :return: 归档的消息条数
+    """
+    fd, path = tempfile.mkstemp(suffix=".parquet")
+    os.close(fd)
+    try:
+        await conn.execute(text(f"LOCK TABLE {partition} IN SHARE MODE"))
+        expected = (await conn.execute(text(f"SELECT count(*) FROM {partition}"))).scalar()
+        if expected:
+            rows = await _export_partition(conn, partition, path)
+            import pyarrow.parquet as pq
+
+            written = (await asyncio.to_thread(pq.read_metadata, path)).num_rows
+            if rows != expected or written != expected:
+                raise RuntimeError(f"{partition} 导出行数不一致：分区 {expected}，导出 {rows}，文件 {written}")
+            size = os.path.getsize(path)
+            location = await asyncio.to_thread(get_archive_store().put, path, f"{partition}.parquet")
+            await conn.execute(insert(ChatMessageArchive).values(
+                partition_name=partition, range_start=_utc(lower), range_end=_utc(upper), location=location,
+                row_count=expected, size_bytes=size))
+        # 空分区直接删除，不登记
+        await conn.execute(text(f"SET LOCAL lock_timeout = '{DETACH_LOCK_TIMEOUT}'"))
+        await conn.execute(text(f"ALTER TABLE chat_message DETACH PARTITION {partition}"))
+        await conn.execute(text(f"DROP TABLE {partition}"))
+        await conn.commit()
+    except BaseException:
+        await conn.rollback()
+        raise
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+    _ARCHIVED_PARTITIONS.inc()
+    _ARCHIVED_ROWS.inc(expected)
+    return expected
+
+
+async def archive_cold_partitions(conn: AsyncConnection, after_months: int = CHAT_ARCHIVE_AFTER_MONTHS) -> List[str]:
+    """
+    归档结束时间早于 after_months 个月前的全部月分区，从最早的开始
+    :return: 已归档的分区名
+    """
+    if after_months <= 0:
+        return []
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        _logger.warning("未安装 pyarrow，跳过消息分区归档")
+        return []
+
+    cutoff = _add_months(_current_month(), -after_months)
+    partitions = (await conn.execute(text("""
+        SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'chat_message'::regclass AND c.relname ~ '^chat_message_p[0-9]{6}$'
+        ORDER BY c.relname
+    """))).scalars().all()
+    await conn.commit()
+    archived = []
+    for partition in partitions:
+        lower = datetime.strptime(partition[-6:], "%Y%m").date()
+        upper = _add_months(lower, 1)
+        if upper > cutoff:
+            break
+        began = time.perf_counter()
+        rows = await archive_partition(conn, partition, lower, upper)
+        _logger.info("消息分区 %s 已归档：%d 条，耗时 %.1fs", partition, rows, time.perf_counter() - began)
+        archived.append(partition)
+    return archived
+
+
+def _read_conversation(location: str, conversation_id: int) -> Tuple[list, list]:
+    """
+    读取归档文件中一个会话的全部消息（阻塞，在线程中调用）
+    :return: (按 (created_at, id) 升序排列的键, 对应的消息)
+    """
+    import pyarrow.parquet as pq
+
+    table = pq.read_table(_local_path(location), columns=list(_COLUMNS[:6]),
+                          filters=[("conversation_id", "=", conversation_id)])
+    # (created_at, id, conversation_id, user_id, kind, content)
+    rows = sorted(zip(*(table.column(name).to_pylist() for name in _COLUMNS[:6])))
+    return [(r[0], r[1]) for r in rows], rows
+
+
+async def list_archived_messages(conversation_id: int, before: Optional[Tuple[datetime, int]],
+                                 limit: int) -> List[ChatHistoryMessage]:
+    """
+    从归档中按时间倒序读取会话消息
+    :param conversation_id: 会话ID
+    :param before: 只返回 (created_at, id) 小于该值的消息，为空时从最新的归档开始
+    :param limit: 最多返回的条数
+    """
+    stmt = select(ChatMessageArchive.location).order_by(ChatMessageArchive.range_start.desc())
+    if before is not None:
+        stmt = stmt.where(ChatMessageArchive.range_start <= before[0])
+    async with async_session() as session:
+        locations = (await session.execute(stmt)).scalars().all()
+    if not locations:
+        return []
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        _logger.warning("未安装 pyarrow，无法读取已归档的消息")
+        return []
+
+    items: List[ChatHistoryMessage] = []
+    for location in locations:
+        cached = _conversation_cache.get((location, conversation_id))
+        if cached is None:
+            start = time.perf_counter()
+            cached = await asyncio.to_thread(_read_conversation, location, conversation_id)
+            _ARCHIVE_READ_SECONDS.observe(time.perf_counter() - start)
+            _conversation_cache.set((location, conversation_id), cached)
+        keys, rows = cached
+        end = bisect.bisect_left(keys, before) if before is not None else len(keys)
+        page = rows[max(0, end - (limit - len(items))):end]
+        for created_at, message_id, cid, user_id, kind, content in reversed(page):
+            items.append(ChatHistoryMessage(id=message_id, conversation_id=cid, sender_id=user_id, kind=kind,
+                                            content=content, created_at=created_at))
+        if len(items) >= limit:
+            break
+    return items
+
+
+class ChatPartitionMaintainer:
+    """
+    后台维护任务：启动时执行一次，之后每隔 interval 秒执行一次，依次创建未来分区、归档冷分区、清理幂等键
+    """
+
+    def __init__(self, interval: float = 6 * 3600):
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self):
+        while True:
+            try:
+                await self.run_once()
+            except Exception:
+                _logger.exception("消息分区维护失败")
+            await asyncio.sleep(self.interval)
+
+    @staticmethod
+    async def run_once() -> bool:
+        """
+        :return: 其他进程正在执行时返回 False
+        """
+        # 会话级 advisory lock 需要在同一个连接上加锁和解锁，不能使用每次提交后归还连接的 AsyncSession
+        async with get_engine().connect() as conn:
+            if not (await conn.execute(text("SELECT pg_try_advisory_lock(:key)"),
+                                       {"key": _MAINTENANCE_LOCK_KEY})).scalar():
+                return False
+            await conn.commit()
+            try:
+                try:
+                    await ensure_partitions()
+                except SQLAlchemyError:
+                    # 兜底分区中已有对应月份的数据时无法创建该月分区，不影响归档
+                    _logger.exception("创建消息分区失败")
+                await archive_cold_partitions(conn)
+                purged = await purge_message_keys()
+                if purged:
+                    _logger.info("已清理 %d 条过期的消息幂等键", purged)
+            finally:
+                await conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": _MAINTENANCE_LOCK_KEY})
+                await conn.commit()
+        return True
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+
+partition_maintainer = ChatPartitionMaintainer()
@@ -0,0 +1,210 @@
+"""
+正在输入、已读回执等高频临时事件
+
+- 按会话在短时间窗口（默认 250ms）内合并：窗口内同一会话的多次输入/已读只推送一帧
+- 已读位置在内存中按 (会话, 用户) 取最大值，后台任务批量写入 ChatConversationMember.last_read_message_id，
+  数据库中只增不减；写入时截断到会话最新一条消息，客户端上报的超大ID不会让已读位置永久领先
+"""
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional, Set, Tuple
+
+from redis.exceptions import RedisError
+from sqlalchemy import text
+from sqlalchemy.exc import DataError, SQLAlchemyError
+
+from app.core.db import async_session
+from app.core.id_generator import id_generator
+from app.schemas import TypingEventFrame, ReadEventFrame, encode_frame
+from app.services.chat_service import check_member, publish_to_conversation
+from common.metrics import REGISTRY
+
+_logger = logging.getLogger(__name__)
+
+_EVENTS = REGISTRY.counter("chat_ephemeral_events_total", "收到的临时事件数", ["kind"])
+_FRAMES = REGISTRY.counter("chat_ephemeral_frames_total", "合并后推送的临时事件帧数", ["kind"])
+_CURSOR_FLUSHED = REGISTRY.counter("chat_read_cursor_flushed_total", "写入数据库的已读位置数")
+_CURSOR_PENDING = REGISTRY.gauge("chat_read_cursor_pending", "等待写入的已读位置数")
+
+# 已读位置不超过会话最新一条消息（会话消息已全部归档时不截断），只更新比数据库中更大的已读位置
+_UPDATE_CURSORS = text("""
+WITH v AS (
+    SELECT u.conversation_id, u.user_id, LEAST(u.message_id, (
+        SELECT c.id FROM chat_message AS c WHERE c.conversation_id = u.conversation_id
+        ORDER BY c.created_at DESC, c.id DESC LIMIT 1
+    )) AS message_id
+    FROM unnest(CAST(:conversation_ids AS BIGINT[]), CAST(:user_ids AS BIGINT[]), CAST(:message_ids AS BIGINT[]))
+        AS u(conversation_id, user_id, message_id)
+)
+UPDATE chat_conversation_member AS m
+SET last_read_message_id = v.message_id
+FROM v
+WHERE m.conversation_id = v.conversation_id AND m.user_id = v.user_id
+  AND (m.last_read_message_id IS NULL OR m.last_read_message_id < v.message_id)
+""")
+
+
+class _Pending:
+    __slots__ = ("typing", "cursors")
+
+    def __init__(self):
+        self.typing: Set[int] = set()
+        self.cursors: Dict[int, int] = {}
+
+
+class EphemeralCoalescer:
+    """
+    按会话合并临时事件：会话的第一个事件到达时开始计时，窗口结束时把期间的全部事件合并为
+    一个 typing 帧和一个 read 帧推送给会话成员
+    """
+
+    def __init__(self, window: float = 0.25):
+        self.window = window
+        self._pending: Dict[int, _Pending] = {}
+        self._timers: Dict[int, asyncio.TimerHandle] = {}
+        self._tasks: Set[asyncio.Task] = set()
+
+    def typing(self, conversation_id: int, user_id: int):
+        _EVENTS.labels("typing").inc()
+        self._state(conversation_id).typing.add(user_id)
+
+    def read(self, conversation_id: int, user_id: int, message_id: int):
+        _EVENTS.labels("read").inc()
+        cursors = self._state(conversation_id).cursors
+        if message_id > cursors.get(user_id, 0):
+            cursors[user_id] = message_id
+
+    def _state(self, conversation_id: int) -> _Pending:
+        state = self._pending.get(conversation_id)
+        if state is None:
+            state = self._pending[conversation_id] = _Pending()
+            self._timers[conversation_id] = asyncio.get_running_loop().call_later(
+                self.window, self._fire, conversation_id)
+        return state
+
+    def _fire(self, conversation_id: int):
+        self._timers.pop(conversation_id, None)
+        task = asyncio.create_task(self.flush(conversation_id))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def flush(self, conversation_id: int):
+        state = self._pending.pop(conversation_id, None)
+        if state is None:
+            return
+        try:
+            if state.typing:
+                frame = TypingEventFrame(conversation_id=conversation_id, user_ids=sorted(state.typing))
+                await publish_to_conversation(conversation_id, encode_frame(frame))
+                _FRAMES.labels("typing").inc()
+            if state.cursors:
+                frame = ReadEventFrame(conversation_id=conversation_id, cursors=state.cursors)
+                await publish_to_conversation(conversation_id, encode_frame(frame))
+                _FRAMES.labels("read").inc()
+        except (RedisError, SQLAlchemyError) as e:
+            # 临时事件丢失不影响正确性，已读位置仍会写入数据库
+            _logger.warning("推送临时事件失败: %s", e)
+
+    async def close(self):
+        for timer in self._timers.values():
+            timer.cancel()
+        self._timers.clear()
+        await asyncio.gather(*(self.flush(c) for c in list(self._pending)), *self._tasks, return_exceptions=True)
+
+
+class ReadCursorWriter:
+    """
+    已读位置批量写入：同一 (会话, 用户) 在写入间隔内只保留最大的消息ID，每次写入为一条 UPDATE
+
+    进程退出前需要调用 close()，否则尚未写入的已读位置会丢失（客户端下次已读时会再次上报）
+    """
+
+    def __init__(self, flush_interval: float = 1.0):
+        """
+        :param flush_interval: 写入间隔（秒）
+        """
+        self.flush_interval = flush_interval
+        self._pending: Dict[Tuple[int, int], int] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._closing = False
+        _CURSOR_PENDING.set_function(lambda: len(self._pending))
+
+    def record(self, conversation_id: int, user_id: int, message_id: int):
+        key = (conversation_id, user_id)
+        if message_id > self._pending.get(key, 0):
+            self._pending[key] = message_id
+        self._ensure_task()
+
+    def _ensure_task(self):
+        if self._closing or (self._task is not None and not self._task.done()):
+            return
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self):
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            await self.flush()
+
+    async def flush(self):
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, {}
+        try:
+            async with async_session() as session:
+                await session.execute(_UPDATE_CURSORS, {
+                    "conversation_ids": [c for c, _ in batch],
+                    "user_ids": [u for _, u in batch],
+                    "message_ids": list(batch.values()),
+                })
+                await session.commit()
+            _CURSOR_FLUSHED.inc(len(batch))
+        except DataError:
+            # 数据本身不合法，重试也会失败；丢弃这一批，客户端下次已读时会再次上报
+            _logger.exception("已读位置数据不合法，丢弃 %d 条", len(batch))
+        except SQLAlchemyError:
+            _logger.exception("已读位置写入失败，%d 条等待下次写入", len(batch))
+            # 与写入期间新收到的已读位置合并，取最大值
+            for key, message_id in batch.items():
+                if message_id > self._pending.get(key, 0):
+                    self._pending[key] = message_id
+
+    async def close(self):
+        """
+        停止后台任务并写入剩余的已读位置
+        """
+        self._closing = True
+        if self._task is not None:
+            self._wakeup.set()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+
+ephemeral_coalescer = EphemeralCoalescer()
+read_cursor_writer = ReadCursorWriter()
+
+
+async def send_typing(user_id: int, conversation_id: int, typing: bool = True):
+    """
+    正在输入，合并后推送给会话成员（客户端忽略自己的ID）
+    """
+    await check_member(user_id, conversation_id)
+    if typing:
+        ephemeral_coalescer.typing(conversation_id, user_id)
+
+
+async def send_read_receipt(user_id: int, conversation_id: int, message_id: int):
+    """
+    已读回执：合并后推送给会话成员，并批量写入已读位置
+    """
+    await check_member(user_id, conversation_id)
+    # Snowflake ID 含分配时间，晚于当前时间的消息还不存在；推送前先截断，落库时再截断到会话最新一条消息
+    message_id = min(message_id, id_generator.min_id(datetime.now(timezone.utc) + timedelta(milliseconds=1)) - 1)
+    ephemeral_coalescer.read(conversation_id, user_id, message_id)
+    read_cursor_writer.record(conversation_id, user_id, message_id)
@@ -1,11 +1,44 @@
-from typing import List
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Callable, List, Optional, Tuple
 
-from sqlalchemy import select
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+from sqlalchemy import select, text, tuple_
 
 from app.core.db import async_session
-from app.models import ChatConversation, ChatConversationMember
-from app.services.user_service import get_user
+from app.core.id_generator import id_generator, next_id
+from app.core.redis_client import get_redis
+from app.core.socket_manager import manager
+from app.models import ChatConversation, ChatConversationMember, ChatMessage, ChatMessageKey
+from app.schemas import ChatMessageEnvelope, AckFrame, MessageFrame, encode_frame, ChatHistoryMessage, \
+    ChatHistoryPage
+from app.services.chat_archive_service import list_archived_messages
+from app.services.user_service import get_users
+from common.cache import LRUCache
 from common.exceptions import ServiceException
+from common.metrics import REGISTRY
+
+_logger = logging.getLogger(__name__)
+
+# 进程内记住最近处理过的 clientMessageId（秒）
+DEDUP_LOCAL_TTL = 600
+# Redis 中记住已处理的 clientMessageId（秒），覆盖客户端断线重连后的重发
+DEDUP_REDIS_TTL = 24 * 3600
+# Redis 中“处理中”标记的过期时间（秒），处理进程崩溃时不会永久占用
+DEDUP_PENDING_TTL = 60
+# 其他连接正在处理同一条消息时，等待其写入完成的最长时间（秒）与轮询间隔
+DEDUP_PENDING_WAIT = 5.0
+DEDUP_PENDING_POLL = 0.05
+_PENDING = "0"
+
+CHAT_HISTORY_DEFAULT_LIMIT = 20
+CHAT_HISTORY_MAX_LIMIT = 100
+
+_DUPLICATES = REGISTRY.counter("chat_message_duplicates_total", "被去重的重复消息数", ["tier"])
+_SAVED = REGISTRY.counter("chat_message_saved_total", "写入数据库的消息数")
 
 
 async def conversation_list(user_id: int) -> List[dict]:
@@ -50,10 +83,10 @@ async def create_conversation(user_id: int, with_users: List[int]) -> int:
         )
         session.add(ccm)
 
-        # 4. 添加其他用户
+        # 4. 添加其他用户（批量读取，缓存未命中的用户一次查询）
+        userinfos = await get_users(with_users)
         for with_user_id in with_users:
-            userinfo = await get_user(with_user_id)
-            if not userinfo:
+            if with_user_id not in userinfos:
                 raise ServiceException(f"user id {with_user_id} not found")
 
             wccm = ChatConversationMember(
@@ -67,3 +100,252 @@ async def create_conversation(user_id: int, with_users: List[int]) -> int:
         await session.commit()
 
         return conversation.id
+
+
+class MessageDeduplicator:
+    """
+    消息去重：进程内 LRU（重复帧只需一次字典查找）-> Redis（跨进程、重连）-> 数据库幂等键兜底
+    """
+
+    def __init__(self, redis_factory: Callable[[], Redis] = get_redis, maxsize: int = 100_000,
+                 local_ttl: float = DEDUP_LOCAL_TTL, redis_ttl: int = DEDUP_REDIS_TTL):
+        self.redis_factory = redis_factory
+        self.redis_ttl = redis_ttl
+        self.local = LRUCache(maxsize=maxsize, ttl=local_ttl)
+
+    @staticmethod
+    def key(conversation_id, user_id, client_message_id) -> str:
+        # clientMessageId 由客户端生成，只在同一发送者内唯一
+        return f"{conversation_id}:{user_id}:{client_message_id}"
+
+    def seen(self, key: str) -> Optional[int]:
+        """
+        :return: 已处理过的消息ID，未见过时为 None
+        """
+        return self.local.get(key)
+
+    async def claim(self, key: str, wait: float = DEDUP_PENDING_WAIT) -> Optional[int]:
+        """
+        在 Redis 中标记为处理中；其他连接正在处理同一条消息时，轮询等待其写入完成
+        :return: None 表示由当前调用处理；否则为已有的消息ID
+        :raises ServiceException: 等待 wait 秒后仍在处理中，客户端稍后重发即可
+        """
+        deadline = time.monotonic() + wait
+        try:
+            redis = self.redis_factory()
+            while True:
+                if await redis.set(f"chat:dedup:{key}", _PENDING, nx=True, ex=DEDUP_PENDING_TTL):
+                    return None
+                value = await redis.get(f"chat:dedup:{key}")
+                if value is not None and int(value):
+                    return int(value)
+                # 处理中；标记被释放（value 为空）时下一轮重新抢占
+                if time.monotonic() >= deadline:
+                    raise ServiceException("消息正在处理中，请稍后重试")
+                await asyncio.sleep(DEDUP_PENDING_POLL)
+        except RedisError as e:
+            # 由数据库幂等键兜底
+            _logger.warning("消息去重访问 Redis 失败: %s", e)
+            return None
+
+    async def remember(self, key: str, message_id: int):
+        self.local.set(key, message_id)
+        try:
+            await self.redis_factory().set(f"chat:dedup:{key}", message_id, ex=self.redis_ttl)
+        except RedisError as e:
+            _logger.warning("消息去重写入 Redis 失败: %s", e)
+
+    async def release(self, key: str):
+        """
+        处理失败时移除“处理中”标记，允许客户端重试
+        """
+        try:
+            redis = self.redis_factory()
+            if await redis.get(f"chat:dedup:{key}") == _PENDING:
+                await redis.delete(f"chat:dedup:{key}")
+        except RedisError as e:
+            _logger.warning("消息去重访问 Redis 失败: %s", e)
+
+
+message_dedup = MessageDeduplicator()
+# 会话成员列表，用于投递消息
+_members_cache = LRUCache(maxsize=10_000, ttl=60)
+
+
+# 消息与幂等键在同一条语句中写入：不是会话成员或 (conversation_id, user_id, msg_id) 已存在时两张表都不写入。
+# created_at 决定消息所在的分区
+_INSERT_MESSAGE = text("""
+    WITH k AS (
+        INSERT INTO chat_message_key (conversation_id, user_id, msg_id, message_id, created_at)
+        SELECT CAST(:conversation_id AS BIGINT), CAST(:user_id AS BIGINT), CAST(:msg_id AS VARCHAR),
+               CAST(:message_id AS BIGINT), CAST(:created_at AS TIMESTAMPTZ)
+        WHERE EXISTS (SELECT 1 FROM chat_conversation_member
+                      WHERE conversation_id = :conversation_id AND user_id = :user_id)
+        ON CONFLICT (conversation_id, user_id, msg_id) DO NOTHING
+        RETURNING message_id, created_at
+    )
+    INSERT INTO chat_message (id, created_at, conversation_id, user_id, content, msg_id, kind)
+    SELECT message_id, created_at, CAST(:conversation_id AS BIGINT), CAST(:user_id AS BIGINT),
+           CAST(:content AS VARCHAR), CAST(:msg_id AS VARCHAR), CAST(:kind AS VARCHAR) FROM k
+    RETURNING id
+""")
+
+
+async def save_message(user_id: int, envelope: ChatMessageEnvelope) -> Tuple[Optional[int], bool]:
+    """
+    写入消息，同一发送者的 (conversation_id, msg_id) 冲突时不写入
+    :param user_id: 发送者ID，必须是会话成员
+    :param envelope: 消息信封
+    :return: (消息ID, 是否重复)，不是会话成员时消息ID为 None
+    """
+    if envelope.kind == "text":
+        content = envelope.payload.text
+    else:
+        content = envelope.payload.model_dump_json(by_alias=True, exclude_none=True)
+    # 消息ID在写入前分配，与 created_at 使用同一时间，(created_at, id) 与 id 的顺序一致
+    message_id = next_id()
+    async with async_session() as session:
+        message_id = (await session.execute(_INSERT_MESSAGE, {
+            "conversation_id": envelope.conversation_id, "user_id": user_id, "content": content,
+            "msg_id": envelope.client_message_id, "kind": envelope.kind, "message_id": message_id,
+            "created_at": id_generator.timestamp(message_id),
+        })).scalar_one_or_none()
+        if message_id is not None:
+            await session.commit()
+            return message_id, False
+        message_id = (await session.execute(
+            select(ChatMessageKey.message_id).where(ChatMessageKey.conversation_id == envelope.conversation_id,
+                                                    ChatMessageKey.user_id == user_id,
+                                                    ChatMessageKey.msg_id == envelope.client_message_id)
+        )).scalar_one_or_none()
+        return message_id, message_id is not None
+
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def _encode_history_cursor(created_at: datetime, message_id: int) -> str:
+    # 游标只包含数字与下划线，放在查询字符串中无需转义（ISO 时间中的 + 会被解码为空格）
+    return f"{(created_at - _EPOCH) // timedelta(microseconds=1)}_{message_id}"
+
+
+def _decode_history_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        micros, message_id = cursor.split("_")
+        return _EPOCH + timedelta(microseconds=int(micros)), int(message_id)
+    except (ValueError, OverflowError):
+        raise ServiceException("无效的分页游标")
+
+
+async def list_messages(user_id: int, conversation_id: int, cursor: Optional[str] = None,
+                        limit: int = CHAT_HISTORY_DEFAULT_LIMIT) -> ChatHistoryPage:
+    """
+    按时间倒序查询会话的历史消息，(created_at, id) keyset 分页，走 (conversation_id, created_at, id) 索引；
+    数据库中的消息读完后继续读取已归档的分区（见 chat_archive_service）
+    :param user_id: 当前用户ID，必须是会话成员
+    :param conversation_id: 会话ID
+    :param cursor: 上一页返回的 next_cursor
+    :param limit: 每页数量，最大 CHAT_HISTORY_MAX_LIMIT
+    """
+    limit = max(1, min(limit, CHAT_HISTORY_MAX_LIMIT))
+    await check_member(user_id, conversation_id)
+    stmt = select(ChatMessage.id, ChatMessage.conversation_id, ChatMessage.user_id, ChatMessage.kind,
+                  ChatMessage.content, ChatMessage.created_at).where(ChatMessage.conversation_id == conversation_id)
+    before = None
+    if cursor:
+        before = _decode_history_cursor(cursor)
+        # created_at 上的范围条件同时用于分区裁剪
+        stmt = stmt.where(ChatMessage.created_at <= before[0],
+                          tuple_(ChatMessage.created_at, ChatMessage.id) < before)
+    stmt = stmt.order_by(ChatMessage.created_at.desc(), ChatMessage.id.desc()).limit(limit + 1)
+
+    async with async_session() as session:
+        rows = (await session.execute(stmt)).all()
+    items = [ChatHistoryMessage(id=r.id, conversation_id=r.conversation_id, sender_id=r.user_id, kind=r.kind,
+                                content=r.content, created_at=r.created_at) for r in rows]
+    if len(items) <= limit:
+        if items:
+            before = (items[-1].created_at, items[-1].id)
+        items += await list_archived_messages(conversation_id, before, limit + 1 - len(items))
+    next_cursor = _encode_history_cursor(items[limit - 1].created_at, items[limit - 1].id) \
+        if len(items) > limit else None
+    return ChatHistoryPage(items=items[:limit], next_cursor=next_cursor)
+
+
+async def conversation_members(conversation_id: int) -> Tuple[int, ...]:
+    members = _members_cache.get(conversation_id)
+    if members is None:
+        async with async_session() as session:
+            query = await session.execute(select(ChatConversationMember.user_id)
+                                          .where(ChatConversationMember.conversation_id == conversation_id))
+            members = tuple(query.scalars().all())
+        _members_cache.set(conversation_id, members)
+    return members
+
+
+async def ingest_message(user_id: int, envelope: ChatMessageEnvelope) -> AckFrame:
+    """
+    处理客户端发送的消息：去重、写入、投递给会话成员
+    :param user_id: 发送者ID
+    :param envelope: 客户端发送的消息信封
+    :return: 返回给发送方的 ack，包含服务端消息ID；重复消息返回已有的消息ID，不再写入和投递
+    :raises ServiceException: 不是会话成员，或同一条消息仍在其他连接上处理
+    """
+    # 先检查成员关系，非成员不会拿到任何已有的消息ID
+    await check_member(user_id, envelope.conversation_id)
+    key = message_dedup.key(envelope.conversation_id, user_id, envelope.client_message_id)
+    message_id = message_dedup.seen(key)
+    if message_id is not None:
+        _DUPLICATES.labels("local").inc()
+        return _ack(envelope, message_id, True)
+
+    message_id = await message_dedup.claim(key)
+    if message_id is not None:
+        _DUPLICATES.labels("redis").inc()
+        message_dedup.local.set(key, message_id)
+        return _ack(envelope, message_id, True)
+
+    try:
+        message_id, duplicate = await save_message(user_id, envelope)
+    except Exception:
+        await message_dedup.release(key)
+        raise
+    if message_id is None:
+        await message_dedup.release(key)
+        raise ServiceException(f"not a member of conversation {envelope.conversation_id}")
+    await message_dedup.remember(key, message_id)
+    if duplicate:
+        _DUPLICATES.labels("db").inc()
+        return _ack(envelope, message_id, True)
+
+    _SAVED.inc()
+    event = MessageFrame(id=message_id, sender_id=user_id, message=envelope)
+    try:
+        await publish_to_conversation(envelope.conversation_id, encode_frame(event))
+    except RedisError as e:
+        # 消息已落库，客户端可通过历史消息拉取
+        _logger.warning("消息投递失败: %s", e)
+    return _ack(envelope, message_id, False)
+
+
+def _ack(envelope: ChatMessageEnvelope, message_id: int, duplicate: bool) -> AckFrame:
+    return AckFrame(conversation_id=envelope.conversation_id, client_message_id=envelope.client_message_id,
+                    message_id=message_id, duplicate=duplicate)
+
+
+async def publish_to_conversation(conversation_id: int, frame: str, exclude: Optional[int] = None):
+    """
+    把已编码的帧推送给会话的全部成员
+    :param exclude: 不推送的用户ID（通常为发送者）
+    """
+    for member_id in await conversation_members(conversation_id):
+        if member_id != exclude:
+            await manager.publish_text(member_id, frame)
+
+
+async def check_member(user_id: int, conversation_id: int):
+    """
+    :raises ServiceException: 不是会话成员
+    """
+    if user_id not in await conversation_members(conversation_id):
+        raise ServiceException(f"not a member of conversation {conversation_id}")
@@ -0,0 +1,189 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from datetime import date, datetime
+from typing import Deque, List, Optional, Tuple
+
+from sqlalchemy import insert, text, tuple_
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.future import select
+
+from app.core.db import async_session
+from app.models.user_model import UserLoginLog
+from app.schemas.user_schema import LoginRecord, LoginRecordPage
+from common.exceptions import ServiceException
+from common.metrics import REGISTRY
+
+_logger = logging.getLogger(__name__)
+
+LOGIN_LOG_DEFAULT_LIMIT = 20
+LOGIN_LOG_MAX_LIMIT = 100
+# 预先创建的未来分区月数
+PARTITION_MONTHS_AHEAD = 3
+
+_FLUSHED = REGISTRY.counter("user_login_log_flushed_total", "已写入数据库的登录日志条数")
+_DROPPED = REGISTRY.counter("user_login_log_dropped_total", "队列溢出或写入失败而丢弃的登录日志条数")
+_PENDING = REGISTRY.gauge("user_login_log_pending", "等待写入的登录日志条数")
+
+
+def _add_months(day: date, months: int) -> date:
+    month = day.month - 1 + months
+    return date(day.year + month // 12, month % 12 + 1, 1)
+
+
+async def ensure_partitions(months_ahead: int = PARTITION_MONTHS_AHEAD):
+    """
+    创建当月及未来 months_ahead 个月的分区，已存在时跳过
+    """
+    start = date.today().replace(day=1)
+    async with async_session() as session:
+        for i in range(months_ahead + 1):
+            lower = _add_months(start, i)
+            upper = _add_months(start, i + 1)
+            await session.execute(text(
+                f"CREATE TABLE IF NOT EXISTS user_login_log_p{lower:%Y%m} PARTITION OF user_login_log "
+                f"FOR VALUES FROM ('{lower.isoformat()}') TO ('{upper.isoformat()}')"
+            ))
+        await session.commit()
+
+
+class LoginAuditLogger:
+    """
+    登录日志异步批量写入：登录请求只把事件放入内存队列，后台任务按时间间隔或数量阈值
+    合并为一条多行 INSERT 写入
+
+    进程退出前需要调用 close()，否则队列中尚未写入的日志会丢失
+    """
+
+    def __init__(self, flush_interval: float = 1.0, batch_size: int = 500, max_pending: int = 100_000,
+                 partition_check_interval: float = 12 * 3600):
+        """
+        :param flush_interval: 最长写入间隔（秒）
+        :param batch_size: 队列达到该数量时立即写入，也是单条 INSERT 的最大行数
+        :param max_pending: 队列上限，数据库长时间不可用时丢弃最早的日志
+        :param partition_check_interval: 检查并创建未来分区的间隔（秒）
+        """
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.partition_check_interval = partition_check_interval
+        self._queue: Deque[dict] = deque(maxlen=max_pending)
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+        self._next_partition_check = 0.0
+        _PENDING.set_function(lambda: len(self._queue))
+
+    def record(self, user_id: int, ip_addr: Optional[str], login_time: Optional[datetime] = None):
+        """
+        记录一次登录，不阻塞、不访问数据库
+        """
+        if len(self._queue) == self._queue.maxlen:
+            _DROPPED.inc()
+        self._queue.append({"user_id": user_id, "ip_addr": ip_addr, "login_time": login_time or datetime.now()})
+        self._ensure_task()
+        if self._wakeup is not None and len(self._queue) >= self.batch_size:
+            self._wakeup.set()
+
+    def _ensure_task(self):
+        if self._closing or (self._task is not None and not self._task.done()):
+            return
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self):
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def _maybe_ensure_partitions(self):
+        if time.monotonic() < self._next_partition_check:
+            return
+        self._next_partition_check = time.monotonic() + self.partition_check_interval
+        try:
+            await ensure_partitions()
+        except SQLAlchemyError:
+            _logger.exception("创建登录日志分区失败")
+
+    async def flush(self):
+        """
+        写入队列中的全部日志，每批最多 batch_size 行
+        """
+        if not self._queue:
+            return
+        await self._maybe_ensure_partitions()
+        while self._queue:
+            batch: List[dict] = []
+            while self._queue and len(batch) < self.batch_size:
+                batch.append(self._queue.popleft())
+            try:
+                async with async_session() as session:
+                    await session.execute(insert(UserLoginLog).values(batch))
+                    await session.commit()
+                _FLUSHED.inc(len(batch))
+            except SQLAlchemyError:
+                _logger.exception("登录日志写入失败，%d 条放回队列", len(batch))
+                # 放回队首等待下次写入，超出队列上限的部分被丢弃
+                overflow = len(self._queue) + len(batch) - self._queue.maxlen
+                if overflow > 0:
+                    _DROPPED.inc(overflow)
+                self._queue.extendleft(reversed(batch[max(0, overflow):]))
+                return
+
+    async def close(self):
+        """
+        停止后台任务并写入剩余日志
+        """
+        self._closing = True
+        if self._task is not None:
+            self._wakeup.set()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+
+login_audit = LoginAuditLogger()
+
+
+def _encode_cursor(login_time: datetime, log_id: int) -> str:
+    return f"{login_time.isoformat()}_{log_id}"
+
+
+def _decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        login_time, log_id = cursor.rsplit("_", 1)
+        return datetime.fromisoformat(login_time), int(log_id)
+    except ValueError:
+        raise ServiceException("无效的分页游标")
+
+
+class LoginLogService:
+    @staticmethod
+    async def list_logins(user_id: int, cursor: Optional[str] = None,
+                          limit: int = LOGIN_LOG_DEFAULT_LIMIT) -> LoginRecordPage:
+        """
+        按登录时间倒序查询登录记录，(login_time, id) keyset 分页，走 (user_id, login_time) 索引
+        :param cursor: 上一页返回的 next_cursor
+        """
+        limit = max(1, min(limit, LOGIN_LOG_MAX_LIMIT))
+        stmt = select(UserLoginLog.id, UserLoginLog.ip_addr, UserLoginLog.login_time).where(
+            UserLoginLog.user_id == user_id)
+        if cursor:
+            login_time, log_id = _decode_cursor(cursor)
+            # login_time 上的范围条件同时用于分区裁剪
+            stmt = stmt.where(UserLoginLog.login_time <= login_time,
+                              tuple_(UserLoginLog.login_time, UserLoginLog.id) < (login_time, log_id))
+        stmt = stmt.order_by(UserLoginLog.login_time.desc(), UserLoginLog.id.desc()).limit(limit + 1)
+
+        async with async_session() as session:
+            rows = (await session.execute(stmt)).all()
+        items = [LoginRecord(id=r.id, ip_addr=r.ip_addr, login_time=r.login_time) for r in rows[:limit]]
+        next_cursor = _encode_cursor(items[-1].login_time, items[-1].id) if len(rows) > limit else None
+        return LoginRecordPage(items=items, next_cursor=next_cursor)
+
+
+list_logins = LoginLogService.list_logins
@@ -0,0 +1,159 @@
+import asyncio
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Optional
+
+from common.exceptions import ServiceException
+
+STORAGE_ENDPOINT = os.getenv("STORAGE_ENDPOINT", "localhost:9000")
+STORAGE_ACCESS_KEY = os.getenv("STORAGE_ACCESS_KEY", "minioadmin")
+STORAGE_SECRET_KEY = os.getenv("STORAGE_SECRET_KEY", "minioadmin")
+STORAGE_SECURE = os.getenv("STORAGE_SECURE", "false").lower() == "true"
+STORAGE_BUCKET = os.getenv("STORAGE_BUCKET", "fastapi-app")
+# 对外访问地址，默认与 endpoint 相同
+STORAGE_PUBLIC_URL = os.getenv(
+    "STORAGE_PUBLIC_URL", f"{'https' if STORAGE_SECURE else 'http'}://{STORAGE_ENDPOINT}"
+).rstrip("/")
+
+# S3 分片上传的最小分片为 5MB，内存中最多同时存在一个分片
+PART_SIZE = 5 * 1024 * 1024
+# 同时进行的上传数：每个上传在整个请求期间占用一个线程，使用独立的线程池，不占用默认线程池（to_thread、DNS 解析）
+STORAGE_UPLOAD_WORKERS = int(os.getenv("STORAGE_UPLOAD_WORKERS", 16))
+
+_client = None
+_upload_executor: Optional[ThreadPoolExecutor] = None
+# 上传名额，在上传线程退出时归还；没有名额时拒绝新的上传，而不是在线程池中排队
+_upload_slots = threading.BoundedSemaphore(STORAGE_UPLOAD_WORKERS)
+
+
+def get_storage():
+    """
+    S3 兼容对象存储客户端（MinIO），首次使用时创建
+    """
+    global _client
+    if _client is None:
+        from minio import Minio
+
+        _client = Minio(STORAGE_ENDPOINT, access_key=STORAGE_ACCESS_KEY, secret_key=STORAGE_SECRET_KEY,
+                        secure=STORAGE_SECURE)
+        if not _client.bucket_exists(STORAGE_BUCKET):
+            _client.make_bucket(STORAGE_BUCKET)
+    return _client
+
+
+def object_url(object_name: str) -> str:
+    return f"{STORAGE_PUBLIC_URL}/{STORAGE_BUCKET}/{object_name}"
+
+
+async def delete_object(object_name: str):
+    client = await asyncio.to_thread(get_storage)
+    await asyncio.to_thread(client.remove_object, STORAGE_BUCKET, object_name)
+
+
+def _get_upload_executor() -> ThreadPoolExecutor:
+    global _upload_executor
+    if _upload_executor is None:
+        _upload_executor = ThreadPoolExecutor(max_workers=STORAGE_UPLOAD_WORKERS, thread_name_prefix="storage-upload")
+    return _upload_executor
+
+
+def _put_object(client, object_name: str, reader: "_ChunkReader", content_type: str):
+    try:
+        return client.put_object(STORAGE_BUCKET, object_name, reader, length=-1, content_type=content_type,
+                                 part_size=PART_SIZE)
+    finally:
+        _upload_slots.release()
+
+
+class UploadTooLarge(ServiceException):
+    def __init__(self, max_bytes: int):
+        super().__init__(f"文件大小超过限制（{max_bytes // 1024 // 1024}MB）", 413)
+
+
+class UploadBusy(ServiceException):
+    def __init__(self):
+        super().__init__("上传繁忙，请稍后重试", 503)
+
+
+class _ChunkReader:
+    """
+    给 MinIO SDK 使用的阻塞式文件对象：在线程中读取事件循环推送过来的数据块，
+    队列有界，上游读取速度受下游上传速度约束
+    """
+    _EOF = object()
+
+    def __init__(self, max_chunks: int = 16, poll_interval: float = 0.02):
+        self.queue: queue.Queue = queue.Queue(maxsize=max_chunks)
+        self.poll_interval = poll_interval
+        self._buffer = bytearray()
+        self._eof = False
+        # 上传线程已退出，不会再有人读取队列
+        self.abandoned = False
+
+    def read(self, size: int = -1) -> bytes:
+        while not self._eof and (size < 0 or len(self._buffer) < size):
+            item = self.queue.get()
+            if item is self._EOF:
+                self._eof = True
+            elif isinstance(item, BaseException):
+                raise item
+            else:
+                self._buffer += item
+        if size < 0:
+            size = len(self._buffer)
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+    async def put(self, item):
+        """
+        队列满时在事件循环中轮询等待（不占用线程）；上传线程退出后直接返回，不会永久阻塞
+        """
+        while not self.abandoned:
+            try:
+                self.queue.put_nowait(item)
+                return
+            except queue.Full:
+                await asyncio.sleep(self.poll_interval)
+
+    async def close(self, error: Optional[BaseException] = None):
+        await self.put(error if error is not None else self._EOF)
+
+
+async def upload_stream(chunks: AsyncIterator[bytes], object_name: str, content_type: str, max_bytes: int) -> str:
+    """
+    边读边传：将异步数据流以分片方式上传到对象存储，超过 max_bytes 时中止上传
+    :return: 对象访问地址
+    :raises UploadBusy: 进行中的上传数已达到 STORAGE_UPLOAD_WORKERS
+    """
+    if not _upload_slots.acquire(blocking=False):
+        raise UploadBusy()
+    try:
+        client = await asyncio.to_thread(get_storage)
+    except BaseException:
+        _upload_slots.release()
+        raise
+    reader = _ChunkReader()
+    upload = asyncio.get_running_loop().run_in_executor(
+        _get_upload_executor(), _put_object, client, object_name, reader, content_type)
+    upload.add_done_callback(lambda _: setattr(reader, "abandoned", True))
+    size = 0
+    try:
+        async for chunk in chunks:
+            size += len(chunk)
+            if size > max_bytes:
+                raise UploadTooLarge(max_bytes)
+            await reader.put(chunk)
+            if upload.done():
+                # 上传线程提前失败，不再继续读取请求体
+                break
+    except BaseException as e:
+        # 让上传线程抛出异常，SDK 会中止分片上传
+        await reader.close(e)
+        await asyncio.gather(upload, return_exceptions=True)
+        raise
+    await reader.close()
+    await upload
+    return object_url(object_name)
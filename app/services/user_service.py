@@ -1,16 +1,42 @@
-from datetime import datetime
-from typing import Optional
+from typing import Optional, List, Dict, Iterable
 
 from fastapi import Request
+from sqlalchemy import or_, update
 from sqlalchemy.future import select
 
 from app.core.db import async_session
-from app.models.user_model import User, UserLoginLog
-from app.schemas.user_schema import TokenDTO, UserRegisterParams, UserInfo
+from app.core.redis_client import get_redis
+from app.models.user_model import User
+from app.schemas.user_schema import TokenDTO, UserRegisterParams, UserInfo, UserSearchPage
+from app.services.login_log_service import login_audit
+from common.cache import TwoTierCache
 from common.exceptions import ServiceException
 from common.jwt_utils import create_full_token
 from common.passwd import password_helper
 
+SEARCH_DEFAULT_LIMIT = 20
+SEARCH_MAX_LIMIT = 100
+
+
+async def _load_user_infos(user_ids: List[int]) -> Dict[int, UserInfo]:
+    """
+    批量回源：一次查询加载缓存未命中的用户，只查询 UserInfo 需要的列
+    """
+    async with async_session() as session:
+        rows = (await session.execute(
+            select(User.id, User.name, User.email, User.avatar_url).where(User.id.in_(user_ids))
+        )).all()
+    return {r.id: UserInfo(id=r.id, name=r.name, email=r.email, avatar_url=r.avatar_url) for r in rows}
+
+
+user_info_cache: TwoTierCache[int, UserInfo] = TwoTierCache(
+    namespace="user:info",
+    model=UserInfo,
+    loader=_load_user_infos,
+    redis_factory=get_redis,
+    key_type=int,
+)
+
 
 class UserService:
     @staticmethod
@@ -24,7 +50,8 @@ class UserService:
             session.add(user)
             await session.commit()
             await session.refresh(user)
-            return user.id
+        await user_info_cache.invalidate(user.id)
+        return user.id
 
     @staticmethod
     async def login(username: str, password: str, request: Request) -> TokenDTO:
@@ -32,14 +59,13 @@ class UserService:
             user = (await session.execute(select(User).where(User.email == username))).scalar_one_or_none()
             if not user or not password_helper.verify_password(password, user.password):
                 raise ServiceException("账号或密码错误")
-            token = create_full_token({
-                'sub': str(user.id),
-                'email': user.email
-            })
-            login_log = UserLoginLog(user_id=user.id, login_time=datetime.now(), ip_addr=request.client.host)
-            session.add(login_log)
-            await session.commit()
-            return token
+        token = create_full_token({
+            'sub': str(user.id),
+            'email': user.email
+        })
+        # 登录日志异步批量写入，不占用登录请求的事务
+        login_audit.record(user.id, request.client.host if request.client else None)
+        return token
 
     @staticmethod
     async def create_user(name: str, email: str, password: Optional[str] = None):
@@ -48,30 +74,80 @@ class UserService:
             session.add(user)
             await session.commit()
             await session.refresh(user)
-            return user
+        await user_info_cache.invalidate(user.id)
+        return user
 
     @staticmethod
-    async def get_user(user_id: int) -> Optional[UserInfo]:
+    async def update_avatar(user_id: int, avatar_url: str):
         async with async_session() as session:
-            result = await session.execute(select(User).where(User.id == user_id))
-            user = result.scalar_one_or_none()
-            if not user:
-                return None
-            return UserInfo(
-                id=user.id,
-                name=user.name,
-                email=user.email,
-                avatar_url=user.avatar_url
-            )
+            await session.execute(update(User).where(User.id == user_id).values(avatar_url=avatar_url))
+            await session.commit()
+        await user_info_cache.invalidate(user_id)
 
     @staticmethod
-    async def list_users():
+    async def get_user(user_id: int) -> Optional[UserInfo]:
+        return await user_info_cache.get(user_id)
+
+    @staticmethod
+    async def get_users(user_ids: Iterable[int]) -> Dict[int, UserInfo]:
+        """
+        批量获取用户信息，只回源缓存未命中的用户
+        :return: {user_id: UserInfo}，不存在的用户不返回
+        """
+        return await user_info_cache.get_many(user_ids)
+
+    @staticmethod
+    async def search_users(keyword: Optional[str] = None, cursor: Optional[int] = None,
+                           limit: int = SEARCH_DEFAULT_LIMIT) -> UserSearchPage:
+        """
+        搜索用户：name/email 前缀或子串匹配（pg_trgm GIN 索引），按 id 做 keyset 分页
+        :param keyword: 关键字，为空时列出全部用户
+        :param cursor: 上一页返回的 next_cursor
+        :param limit: 每页数量，最大 SEARCH_MAX_LIMIT
+        """
+        limit = max(1, min(limit, SEARCH_MAX_LIMIT))
+        # 只查询 UserInfo 需要的列，不加载密码哈希
+        stmt = select(User.id, User.name, User.email, User.avatar_url)
+        keyword = (keyword or "").strip()
+        if keyword:
+            pattern = _escape_like(keyword)
+            if len(keyword) < 3:
+                # 过短的关键字只做前缀匹配
+                stmt = stmt.where(or_(
+                    User.name.ilike(f"{pattern}%", escape="\\"),
+                    User.email.ilike(f"{pattern}%", escape="\\"),
+                ))
+            else:
+                # 子串匹配 + trigram 相似度（容错），均可走 gin_trgm_ops 索引
+                stmt = stmt.where(or_(
+                    User.name.ilike(f"%{pattern}%", escape="\\"),
+                    User.email.ilike(f"%{pattern}%", escape="\\"),
+                    User.name.op("%")(keyword),
+                ))
+        if cursor is not None:
+            stmt = stmt.where(User.id > cursor)
+        stmt = stmt.order_by(User.id).limit(limit + 1)
+
         async with async_session() as session:
-            result = await session.execute(select(User))
-            return result.scalars().all()
+            rows = (await session.execute(stmt)).all()
+        items = [UserInfo(id=r.id, name=r.name, email=r.email, avatar_url=r.avatar_url) for r in rows[:limit]]
+        next_cursor = items[-1].id if len(rows) > limit else None
+        return UserSearchPage(items=items, next_cursor=next_cursor)
+
+    @staticmethod
+    async def list_users(limit: int = SEARCH_DEFAULT_LIMIT) -> List[UserInfo]:
+        return (await UserService.search_users(limit=limit)).items
+
+
+def _escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
 
 register = UserService.register
 login = UserService.login
 list_users = UserService.list_users
+search_users = UserService.search_users
 get_user = UserService.get_user
+get_users = UserService.get_users
+update_avatar = UserService.update_avatar
 create_user = UserService.create_user
\ No newline at end of file
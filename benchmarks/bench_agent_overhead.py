@@ -0,0 +1,159 @@
+"""
+Agent 自身开销：用离线脚本模型（app.agents.fake_llm）代替真实模型，测量每轮对话中
+图调度、中间件、checkpoint 读写以及 get_messages 聚合的耗时，不需要网络
+
+    python -m benchmarks.bench_agent_overhead --threads 20 --turns 10 --tool-calls 2
+    python -m benchmarks.bench_agent_overhead --mode async --concurrency 50 --latency-ms 200
+    python -m benchmarks.bench_agent_overhead --conn-str "host=localhost dbname=bot_agent user=postgres password=postgres"
+
+每轮对话：模型依次发起 --tool-calls 次业务工具调用，最后返回 ModelOutput。
+overhead = 单轮总耗时 - 模型耗时 - 工具耗时，即框架、中间件与 checkpoint 在关键路径上的开销；
+checkpoint 为读写耗时的累计值，LangGraph 在后台写入 checkpoint，这部分可能与其他阶段重叠。
+--conn-str 为空时使用内存 checkpointer；PostgresSaver 只支持同步调用
+"""
+import argparse
+import asyncio
+import contextlib
+import os
+import statistics
+import tempfile
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+from app.agents.bot_agent import GenericAgentBot
+from app.agents.checkpoint_store import open_postgres_saver
+from app.agents.fake_llm import final_reply, save_script
+from app.agents.scheduler import LLMScheduler, ProviderLimits
+from app.agents.tracing import AgentTrace
+from app.schemas.agent_schema import ModelContext
+
+SYSTEM_PROMPT = "You are a helpful assistant. Be concise and accurate."
+
+
+def query_weather(city: str) -> str:
+    """
+    查询天气
+    @param city: 城市
+    """
+    return f"{city} -> 晴朗，24摄氏度"
+
+
+def build_script(tool_calls: int) -> List[List[dict]]:
+    steps = [{"tool_calls": [{"name": "query_weather", "args": {"city": "西安"}}]} for _ in range(tool_calls)]
+    return [steps + [final_reply("西安今天天气晴朗，气温24摄氏度，适合外出。", ["查询未来三天天气"])]]
+
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    samples = sorted(samples)
+    return {
+        "p50_ms": round(statistics.median(samples), 3),
+        "p99_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.99))], 3),
+        "mean_ms": round(statistics.fmean(samples), 3),
+    }
+
+
+def record(samples: Dict[str, List[float]], trace: AgentTrace):
+    total = trace.spans[0].duration_ms
+    summary = trace.summary()
+    samples["total"].append(total)
+    for key in ("model", "tool", "checkpoint"):
+        samples[key].append(summary[f"{key}_ms"])
+    samples["overhead"].append(total - summary["model_ms"] - summary["tool_ms"])
+
+
+def run_sync(bot: GenericAgentBot, thread_ids: List[str], turns: int, concurrency: int) -> Dict[str, List[float]]:
+    samples: Dict[str, List[float]] = {k: [] for k in ("total", "model", "tool", "checkpoint", "overhead")}
+
+    def conversation(index: int):
+        for turn in range(turns):
+            graph_input, config, context = bot._build_input(f"第 {turn} 轮：西安天气怎么样？",
+                                                            ModelContext(user_id=index), thread_ids[index])
+            trace = AgentTrace(thread_ids[index], index)
+            config["callbacks"] = [trace]
+            with trace:
+                bot.graph.invoke(graph_input, config=config, context=context)
+            record(samples, trace)
+
+    with ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(conversation, range(len(thread_ids))))
+    return samples
+
+
+async def run_async(bot: GenericAgentBot, thread_ids: List[str], turns: int,
+                    concurrency: int) -> Dict[str, List[float]]:
+    samples: Dict[str, List[float]] = {k: [] for k in ("total", "model", "tool", "checkpoint", "overhead")}
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def conversation(index: int):
+        async with semaphore:
+            for turn in range(turns):
+                graph_input, config, context = bot._build_input(f"第 {turn} 轮：西安天气怎么样？",
+                                                                ModelContext(user_id=index), thread_ids[index])
+                trace = AgentTrace(thread_ids[index], index)
+                config["callbacks"] = [trace]
+                with trace:
+                    await bot.graph.ainvoke(graph_input, config=config, context=context)
+                record(samples, trace)
+
+    await asyncio.gather(*(conversation(i) for i in range(len(thread_ids))))
+    return samples
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--threads", type=int, default=20, help="会话数")
+    parser.add_argument("--turns", type=int, default=10, help="每个会话的对话轮数")
+    parser.add_argument("--concurrency", type=int, default=8, help="同时进行的会话数")
+    parser.add_argument("--mode", choices=["sync", "async"], default="sync")
+    parser.add_argument("--tool-calls", type=int, default=1, help="每轮的业务工具调用次数")
+    parser.add_argument("--script", help="模型脚本（JSON），为空时按 --tool-calls 生成")
+    parser.add_argument("--latency-ms", type=int, default=0, help="模拟的模型首 token 延迟")
+    parser.add_argument("--conn-str", help="PostgreSQL 连接串，为空时使用内存 checkpointer")
+    parser.add_argument("--repeat", type=int, default=5, help="get_messages 的测量次数")
+    args = parser.parse_args()
+    if args.mode == "async" and args.conn_str:
+        parser.error("PostgresSaver 只支持同步调用，--conn-str 只能与 --mode sync 一起使用")
+
+    run_id = uuid.uuid4().hex[:8]
+    script = args.script
+    if script is None:
+        script = os.path.join(tempfile.gettempdir(), f"bench-agent-script-{run_id}.json")
+        save_script(build_script(args.tool_calls), script)
+    thread_ids = [f"bench-{run_id}-{i}" for i in range(args.threads)]
+
+    with contextlib.ExitStack() as stack:
+        checkpointer = None
+        if args.conn_str:
+            checkpointer = stack.enter_context(open_postgres_saver(args.conn_str))
+            checkpointer.setup()
+        # 离线脚本模型不应成为瓶颈，使用独立的调度器，不占用生产 provider 的并发限制
+        scheduler = LLMScheduler({"fake": ProviderLimits(max_concurrency=max(64, args.concurrency))})
+        bot = GenericAgentBot(SYSTEM_PROMPT, script, "fake", tools=[query_weather], checkpointer=checkpointer,
+                              scheduler=scheduler)
+        bot.llm.latency_ms = args.latency_ms
+
+        start = time.perf_counter()
+        if args.mode == "sync":
+            samples = run_sync(bot, thread_ids, args.turns, args.concurrency)
+        else:
+            samples = asyncio.run(run_async(bot, thread_ids, args.turns, args.concurrency))
+        elapsed = time.perf_counter() - start
+
+        get_messages = []
+        for _ in range(args.repeat):
+            for thread_id in thread_ids:
+                began = time.perf_counter()
+                bot.get_messages(thread_id)
+                get_messages.append((time.perf_counter() - began) * 1000)
+
+    if args.script is None:
+        os.remove(script)
+
+    print(f"mode={args.mode} threads={args.threads} turns={args.turns} concurrency={args.concurrency} "
+          f"tool_calls={args.tool_calls} checkpointer={'postgres' if args.conn_str else 'memory'}")
+    print(f"throughput      {len(samples['total']) / elapsed:.1f} turns/s")
+    for key in ("total", "model", "tool", "checkpoint", "overhead"):
+        print(f"{key:<15} {summarize(samples[key])}")
+    print(f"{'get_messages':<15} {summarize(get_messages)}")
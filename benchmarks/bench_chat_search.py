@@ -0,0 +1,165 @@
+"""
+/chat/search 基准：批量生成会话与消息后测量 search_messages 延迟
+
+    python -m benchmarks.bench_chat_search --messages 10000000 --repeat 20
+    python -m benchmarks.bench_chat_search --messages 10000000 --backend trgm
+
+使用 DATABASE_URL 指向的数据库（需已执行 alembic upgrade head），生成的数据以 bench_ 前缀区分，
+结束时可用 --cleanup 删除。消息写入时由触发器计算 search_vector，生成阶段的写入速度即包含分词开销。
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from dotenv import load_dotenv
+from sqlalchemy import text
+
+from app.core.db import async_session
+from app.services.chat_search_service import search_messages
+
+WORDS = [
+    "今晚", "七点", "会议室", "周会", "接口", "联调", "测试环境", "部署", "移动端", "图片", "上传", "失败", "弱网",
+    "超时", "日志", "同步", "群里", "需求", "评审", "上线", "回滚", "告警", "数据库", "慢查询", "缓存", "命中率",
+    "客户", "反馈", "版本", "发布", "周五", "排期", "延期", "确认", "收到", "好的", "谢谢", "辛苦", "，", "。",
+    " latency ", " deploy ", " rollback ", " p99 ", " redis ", " postgres ", " kafka ", " review ",
+]
+# 罕见词只出现在约万分之一的消息中
+RARE_WORD = "灰度开关"
+
+SEED_USERS = """
+    INSERT INTO t_user (name, email, password)
+    SELECT 'bench_chat_' || g, 'bench_chat_' || g || '@example.com', NULL
+    FROM generate_series(1, CAST(:users AS INT)) AS g
+"""
+# 每个会话 3 个成员，每个用户约在 3 * conversations / users 个会话中
+SEED_CONVERSATIONS = """
+    WITH c AS (
+        INSERT INTO chat_conversation (name, user_id)
+        SELECT 'bench_' || g, (SELECT min(id) FROM t_user WHERE name LIKE 'bench\\_chat\\_%') + g % :users
+        FROM generate_series(1, CAST(:conversations AS INT)) AS g
+        RETURNING id
+    ), u AS (
+        SELECT min(id) AS base FROM t_user WHERE name LIKE 'bench\\_chat\\_%'
+    )
+    INSERT INTO chat_conversation_member (conversation_id, user_id, features)
+    SELECT c.id, u.base + (c.id * k + k - 1) % :users, '{}'
+    FROM c, u, (VALUES (1), (7), (13)) AS m(k)
+"""
+# 大范围用户：加入四分之一的会话，搜索时走全文索引
+SEED_HEAVY_USER = """
+    WITH u AS (
+        INSERT INTO t_user (name, email, password) VALUES ('bench_chat_heavy', 'bench_chat_heavy@example.com', NULL)
+        RETURNING id
+    )
+    INSERT INTO chat_conversation_member (conversation_id, user_id, features)
+    SELECT c.id, u.id, '{}' FROM chat_conversation c, u WHERE c.name LIKE 'bench\\_%' AND c.id % 4 = 0
+"""
+SEED_MESSAGES = """
+    INSERT INTO chat_message (conversation_id, user_id, content, msg_id, kind)
+    SELECT c.ids[1 + g % array_length(c.ids, 1)],
+           c.user_base + g % :users,
+           (SELECT string_agg((CAST(:words AS TEXT[]))[1 + floor(random() * CAST(:word_count AS INT))::int], '')
+            FROM generate_series(1, 4 + g % 12))
+           || CASE WHEN g % 10000 = 0 THEN :rare ELSE '' END,
+           'bench_' || g,
+           'text'
+    FROM generate_series(CAST(:start AS BIGINT), CAST(:stop AS BIGINT)) AS g,
+         (SELECT array_agg(id) AS ids, (SELECT min(id) FROM t_user WHERE name LIKE 'bench\\_chat\\_%') AS user_base
+          FROM chat_conversation WHERE name LIKE 'bench\\_%') AS c
+"""
+
+KEYWORDS = ["会议室", "测试环境 部署", "灰度开关", "慢", "latency", "roll", "p99 回滚", "不存在的词"]
+
+
+async def seed(total: int, users: int, conversations: int, batch: int = 100_000):
+    async with async_session() as session:
+        existing_users = (await session.execute(
+            text("SELECT count(*) FROM t_user WHERE name LIKE 'bench\\_chat\\_%'"))).scalar()
+        if not existing_users:
+            await session.execute(text(SEED_USERS), {"users": users})
+            await session.execute(text(SEED_CONVERSATIONS), {"users": users, "conversations": conversations})
+            await session.execute(text(SEED_HEAVY_USER))
+            await session.commit()
+        existing = (await session.execute(
+            text("SELECT count(*) FROM chat_message WHERE msg_id LIKE 'bench\\_%'"))).scalar()
+        for start in range(existing + 1, total + 1, batch):
+            stop = min(start + batch - 1, total)
+            began = time.perf_counter()
+            await session.execute(text(SEED_MESSAGES), {"start": start, "stop": stop, "users": users,
+                                                        "words": WORDS, "word_count": len(WORDS),
+                                                        "rare": RARE_WORD})
+            await session.commit()
+            print(f"seeded {stop}/{total}（{(stop - start + 1) / (time.perf_counter() - began):.0f} 条/秒，含触发器分词）")
+        await session.execute(text("ANALYZE chat_message"))
+        await session.execute(text("ANALYZE chat_conversation_member"))
+        await session.commit()
+
+
+async def bench_users() -> dict:
+    async with async_session() as session:
+        normal = (await session.execute(text("""
+            SELECT m.user_id FROM chat_conversation_member m JOIN t_user u ON u.id = m.user_id
+            WHERE u.name LIKE 'bench\\_chat\\_%' AND u.name <> 'bench_chat_heavy'
+            GROUP BY m.user_id ORDER BY count(*) DESC, m.user_id LIMIT 1
+        """))).scalar()
+        heavy = (await session.execute(text("SELECT id FROM t_user WHERE name = 'bench_chat_heavy'"))).scalar()
+    return {"普通用户": normal, "大范围用户": heavy}
+
+
+async def bench(repeat: int, limit: int, backend: str):
+    for name, user_id in (await bench_users()).items():
+        if user_id is not None:
+            print(f"== {name}（user_id={user_id}）")
+            await bench_user(user_id, repeat, limit, backend)
+
+
+async def bench_user(user_id: int, repeat: int, limit: int, backend: str):
+    for keyword in KEYWORDS:
+        samples = []
+        page = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            page = await search_messages(user_id, keyword, limit=limit, backend=backend)
+            samples.append((time.perf_counter() - start) * 1000)
+        # 翻到第二页，验证 keyset 分页的开销
+        second = None
+        if page.next_cursor:
+            start = time.perf_counter()
+            await search_messages(user_id, keyword, cursor=page.next_cursor, limit=limit, backend=backend)
+            second = round((time.perf_counter() - start) * 1000, 3)
+        samples.sort()
+        print(f"{keyword!r:16} hits={len(page.items):3} p50={statistics.median(samples):8.3f}ms "
+              f"p99={samples[min(len(samples) - 1, int(len(samples) * 0.99))]:8.3f}ms page2={second}ms")
+
+
+async def cleanup():
+    async with async_session() as session:
+        await session.execute(text("DELETE FROM chat_message WHERE msg_id LIKE 'bench\\_%'"))
+        await session.execute(text("""
+            DELETE FROM chat_conversation_member WHERE conversation_id IN (
+                SELECT id FROM chat_conversation WHERE name LIKE 'bench\\_%')
+        """))
+        await session.execute(text("DELETE FROM chat_conversation WHERE name LIKE 'bench\\_%'"))
+        await session.execute(text("DELETE FROM t_user WHERE name LIKE 'bench\\_chat\\_%'"))
+        await session.commit()
+
+
+async def main(args):
+    await seed(args.messages, args.users, args.conversations)
+    await bench(args.repeat, args.limit, args.backend)
+    if args.cleanup:
+        await cleanup()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=10_000_000)
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--conversations", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--backend", default="bigram", choices=["bigram", "trgm"])
+    parser.add_argument("--cleanup", action="store_true")
+    load_dotenv()
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,98 @@
+"""
+checkpoint 清理前后 get_state 延迟对比
+
+    python -m benchmarks.bench_checkpoint_prune "host=localhost dbname=bot_agent user=postgres password=postgres" \
+        --threads 20 --turns 50 --keep 5
+
+每个线程模拟 ReAct 工具循环（每轮 4 次状态更新），不依赖真实模型。
+"""
+import argparse
+import statistics
+import time
+import uuid
+
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langgraph.graph import START, END, MessagesState, StateGraph
+
+from app.agents.checkpoint_store import CheckpointRetention, open_postgres_saver
+
+
+def build_graph(checkpointer):
+    def model(state: MessagesState):
+        last = state["messages"][-1]
+        if isinstance(last, ToolMessage):
+            return {"messages": [AIMessage(content="西安今天天气晴朗，气温24摄氏度，适合外出。" * 5)]}
+        return {"messages": [AIMessage(content="", tool_calls=[
+            {"name": "query_weather", "args": {"city": "西安"}, "id": uuid.uuid4().hex}
+        ])]}
+
+    def tools(state: MessagesState):
+        tc = state["messages"][-1].tool_calls[0]
+        return {"messages": [ToolMessage(content="晴朗，24摄氏度" * 20, tool_call_id=tc["id"])]}
+
+    def route(state: MessagesState):
+        return "tools" if state["messages"][-1].tool_calls else END
+
+    builder = StateGraph(MessagesState)
+    builder.add_node("model", model)
+    builder.add_node("tools", tools)
+    builder.add_edge(START, "model")
+    builder.add_conditional_edges("model", route, ["tools", END])
+    builder.add_edge("tools", "model")
+    return builder.compile(checkpointer=checkpointer)
+
+
+def measure_get_state(graph, thread_ids, repeat: int):
+    samples = []
+    for _ in range(repeat):
+        for thread_id in thread_ids:
+            start = time.perf_counter()
+            graph.get_state({"configurable": {"thread_id": thread_id}})
+            samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {
+        "p50_ms": round(statistics.median(samples), 3),
+        "p99_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.99))], 3),
+    }
+
+
+def storage_kb(retention, thread_ids):
+    return round(sum(s.total_bytes for t in thread_ids for s in retention.thread_storage(t)) / 1024, 1)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("conn_str")
+    parser.add_argument("--threads", type=int, default=20)
+    parser.add_argument("--turns", type=int, default=50)
+    parser.add_argument("--keep", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    run_id = uuid.uuid4().hex[:8]
+    thread_ids = [f"bench-{run_id}-{i}" for i in range(args.threads)]
+
+    with open_postgres_saver(args.conn_str) as saver:
+        saver.setup()
+        graph = build_graph(saver)
+        for thread_id in thread_ids:
+            for turn in range(args.turns):
+                graph.invoke({"messages": [HumanMessage(content=f"第 {turn} 轮：西安天气怎么样？")]},
+                             {"configurable": {"thread_id": thread_id}})
+
+        retention = CheckpointRetention.for_saver(saver, keep=args.keep)
+        before = measure_get_state(graph, thread_ids, args.repeat)
+        before_kb = storage_kb(retention, thread_ids)
+
+        start = time.perf_counter()
+        pruned = [retention.prune_thread(t) for t in thread_ids]
+        prune_seconds = time.perf_counter() - start
+
+        after = measure_get_state(graph, thread_ids, args.repeat)
+        after_kb = storage_kb(retention, thread_ids)
+
+    print(f"threads={args.threads} turns={args.turns} keep={args.keep}")
+    print(f"before: get_state {before} storage={before_kb}KB")
+    print(f"after:  get_state {after} storage={after_kb}KB")
+    print(f"pruned checkpoints={sum(p.checkpoints for p in pruned)} blobs={sum(p.blobs for p in pruned)} "
+          f"in {prune_seconds:.2f}s")
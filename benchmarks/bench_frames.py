@@ -0,0 +1,71 @@
+"""
+WebSocket 帧解析耗时：json.loads（不校验）、orjson.loads + 校验、pydantic-core 直接解析 JSON 并校验
+
+    python -m benchmarks.bench_frames --number 100000
+
+每种帧分别测量单次解析的平均耗时；非法帧只统计拒绝所需的时间。
+"""
+import argparse
+import json
+import timeit
+
+import orjson
+
+from app.schemas.chat_schema import MAX_FRAME_BYTES, FrameError, _client_frame, decode_frame
+
+FRAMES = {
+    "send text": {"type": "send", "v": 1, "message": {
+        "conversationId": "1024", "clientMessageId": "0f8fad5b-d9cb-469f-a165-70867728950e", "kind": "text",
+        "payload": {"text": "今晚七点开会，记得带上周报" * 4}, "metadata": {"replyTo": 998}, "timestamp": 1760860000000}},
+    "send image": {"type": "send", "message": {
+        "conversationId": 1024, "clientMessageId": "7c9e6679-7425-40de-944b-e07fc1f90ae7", "kind": "image",
+        "payload": {"image": {"url": "https://cdn.example.com/a/b/c.webp", "width": 1280, "height": 720,
+                              "sizeBytes": 183204}, "caption": "截图"}, "timestamp": 1760860000000}},
+    "typing": {"type": "typing", "conversationId": 1024},
+    "read": {"type": "read", "conversationId": 1024, "messageId": 88123},
+    "ping": {"type": "ping", "ts": 1760860000000},
+}
+INVALID = {
+    "not json": "{type: send",
+    "unknown type": '{"type": "shout", "conversationId": 1}',
+    "missing field": '{"type": "send", "message": {"conversationId": 1, "kind": "text"}}',
+    "oversized": '{"type": "ping", "pad": "' + "x" * MAX_FRAME_BYTES + '"}',
+}
+
+
+def json_untyped(data: str):
+    msg = json.loads(data)
+    return msg.get("type"), msg.get("message")
+
+
+def orjson_validate(data: str):
+    if len(data) > MAX_FRAME_BYTES:
+        raise FrameError("frame too large")
+    try:
+        return _client_frame.validate_python(orjson.loads(data))
+    except Exception as e:
+        raise FrameError(str(e))
+
+
+def measure(function, data: str, number: int) -> float:
+    def call():
+        try:
+            function(data)
+        except Exception:
+            pass
+
+    return min(timeit.repeat(call, number=number, repeat=3)) / number * 1_000_000
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--number", type=int, default=100_000)
+    args = parser.parse_args()
+
+    decoders = [("json.loads(不校验)", json_untyped), ("orjson+validate", orjson_validate),
+                ("validate_json", decode_frame)]
+    print(f"{'帧':<16}" + "".join(f"{name:>20}" for name, _ in decoders))
+    cases = [(name, orjson.dumps(frame).decode()) for name, frame in FRAMES.items()] + list(INVALID.items())
+    for name, data in cases:
+        number = args.number if len(data) < 4096 else max(1, args.number // 100)
+        print(f"{name:<16}" + "".join(f"{measure(f, data, number):>18.2f}us" for _, f in decoders))
@@ -0,0 +1,91 @@
+"""
+事件循环线程上单次日志调用的耗时：同步 StreamHandler 与 QueueHandler 对比
+
+    python -m benchmarks.bench_logging --calls 50000 --sink-latency-us 200
+
+日志写入临时文件；--sink-latency-us 为每次写入额外增加的阻塞时间，模拟 stdout 管道被日志采集端
+阻塞等慢速输出。每种配置都测量调用方耗时（均值与 p99），以及 DEBUG 日志按 1% 采样时的调用耗时。
+"""
+import argparse
+import asyncio
+import logging
+import statistics
+import tempfile
+import time
+
+from common.logging_config import JsonFormatter, create_queue_logging, request_id_ctx
+
+TEXT_FORMAT = "{asctime} {levelname} {name}[{lineno:d}] {process:d} {thread:d}: {message}"
+
+
+class SlowFileHandler(logging.FileHandler):
+    def __init__(self, path: str, latency: float):
+        super().__init__(path, encoding="utf-8")
+        self.latency = latency
+
+    def emit(self, record: logging.LogRecord):
+        super().emit(record)
+        if self.latency:
+            time.sleep(self.latency)
+
+
+def file_handler(path: str, json: bool, latency: float) -> logging.Handler:
+    handler = SlowFileHandler(path, latency)
+    handler.setFormatter(JsonFormatter() if json else logging.Formatter(TEXT_FORMAT, style="{"))
+    return handler
+
+
+async def measure(logger: logging.Logger, calls: int, level: int) -> dict:
+    request_id_ctx.set("bench-request")
+    samples = []
+    for i in range(calls):
+        start = time.perf_counter_ns()
+        logger.log(level, "上传头像: %s (%s)", f"avatar_{i}.png", "image/png")
+        samples.append(time.perf_counter_ns() - start)
+        if i % 1000 == 0:
+            # 让出事件循环，模拟请求之间的调度
+            await asyncio.sleep(0)
+    samples.sort()
+    return {
+        "mean_us": round(statistics.fmean(samples) / 1000, 2),
+        "p99_us": round(samples[int(len(samples) * 0.99)] / 1000, 2),
+    }
+
+
+def run_case(name: str, calls: int, json: bool, use_queue: bool, latency: float, level: int = logging.INFO,
+             sample_rate: float = 1.0):
+    with tempfile.NamedTemporaryFile(suffix=".log") as f:
+        logger = logging.getLogger(f"bench.{name}")
+        logger.propagate = False
+        logger.setLevel(logging.DEBUG)
+        target = file_handler(f.name, json, latency)
+        listener = None
+        if use_queue:
+            handler, listener = create_queue_logging(target, sample_rate)
+            listener.start()
+        else:
+            handler = target
+        logger.addHandler(handler)
+        try:
+            result = asyncio.run(measure(logger, calls, level))
+        finally:
+            logger.removeHandler(handler)
+            if listener is not None:
+                listener.stop()
+            target.close()
+    print(f"{name:<28} mean={result['mean_us']:>7}us  p99={result['p99_us']:>7}us")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=50_000)
+    parser.add_argument("--sink-latency-us", type=float, default=0)
+    args = parser.parse_args()
+    latency = args.sink_latency_us / 1_000_000
+
+    run_case("sync text", args.calls, json=False, use_queue=False, latency=latency)
+    run_case("sync json", args.calls, json=True, use_queue=False, latency=latency)
+    run_case("queue text", args.calls, json=False, use_queue=True, latency=latency)
+    run_case("queue json", args.calls, json=True, use_queue=True, latency=latency)
+    run_case("queue debug sampled 1%", args.calls, json=True, use_queue=True, latency=latency,
+             level=logging.DEBUG, sample_rate=0.01)
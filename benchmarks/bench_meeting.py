@@ -0,0 +1,118 @@
+"""
+会议信令压测：R 个房间 × P 个成员同时在线，每个成员周期性发送 signal，统计转发延迟
+
+    python -m benchmarks.bench_meeting --url ws://127.0.0.1:8000 --rooms 1000 --participants 4
+    python -m benchmarks.bench_meeting --url ws://127.0.0.1:8000 --rooms 200 --participants 8 --rate 2 --duration 30
+
+压测连接不携带 token，以访客身份加入，被测服务需设置 MEET_ALLOW_GUEST=true。
+多进程部署（serve.py --workers N）时同一房间的成员会落在不同 worker 上，转发延迟包含 Redis 跨进程转发。
+单个压测进程能打开的连接数受 ulimit -n 限制，需要更多连接时启动多个压测进程（--room-prefix 区分房间）。
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+
+import orjson
+import websockets
+
+# 模拟一条 ICE candidate 的大小
+CANDIDATE = "candidate:842163049 1 udp 1677729535 203.0.113.7 50315 typ srflx raddr 10.0.0.2 rport 50315 " \
+            "generation 0 ufrag 7Kf3 network-cost 999"
+
+
+class Stats:
+    def __init__(self):
+        self.connected = 0
+        self.failed = 0
+        self.sent = 0
+        self.received = 0
+        self.latencies = []
+
+
+async def participant(url: str, room: str, stats: Stats, start: asyncio.Event, stop: asyncio.Event,
+                      rate: float, semaphore: asyncio.Semaphore):
+    # 限制同时握手的连接数
+    async with semaphore:
+        try:
+            ws = await websockets.connect(f"{url}/ws/meet/{room}", max_size=None, open_timeout=30)
+            await ws.send(orjson.dumps({"type": "join", "meetingId": room}).decode())
+            state = orjson.loads(await ws.recv())
+        except Exception:
+            stats.failed += 1
+            return
+    if state["type"] != "meeting_state":
+        stats.failed += 1
+        await ws.close()
+        return
+    stats.connected += 1
+    try:
+        # 全部连接建立后再开始发送
+        await start.wait()
+
+        async def receive():
+            async for text in ws:
+                event = orjson.loads(text)
+                if event["type"] == "signal":
+                    stats.received += 1
+                    stats.latencies.append(time.perf_counter() - event["data"]["ts"])
+
+        receiver = asyncio.create_task(receive())
+        # 错开各连接的发送时间
+        await asyncio.sleep(random.random() / rate)
+        while not stop.is_set():
+            await ws.send(orjson.dumps({"type": "signal", "data": {"candidate": CANDIDATE,
+                                                                   "ts": time.perf_counter()}}).decode())
+            stats.sent += 1
+            try:
+                await asyncio.wait_for(stop.wait(), 1 / rate)
+            except asyncio.TimeoutError:
+                pass
+        # 等待最后一批消息到达
+        await asyncio.sleep(0.5)
+        receiver.cancel()
+    except websockets.ConnectionClosed:
+        pass
+    finally:
+        await ws.close()
+
+
+async def main(args):
+    stats = Stats()
+    start, stop = asyncio.Event(), asyncio.Event()
+    semaphore = asyncio.Semaphore(args.connect_concurrency)
+    rooms = [f"{args.room_prefix}{i}" for i in range(args.rooms)]
+
+    begin = time.perf_counter()
+    tasks = [asyncio.create_task(participant(args.url, room, stats, start, stop, args.rate, semaphore))
+             for _ in range(args.participants) for room in rooms]
+    while stats.connected + stats.failed < len(tasks):
+        await asyncio.sleep(0.1)
+    print(f"连接：成功 {stats.connected}，失败 {stats.failed}，耗时 {time.perf_counter() - begin:.1f}s")
+
+    start.set()
+    await asyncio.sleep(args.duration)
+    stop.set()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+    expected = stats.sent * (args.participants - 1)
+    print(f"发送 {stats.sent} 条 signal，收到 {stats.received} 条（期望 {expected}）")
+    if stats.latencies:
+        latencies = sorted(stats.latencies)
+        print(f"转发延迟 mean={statistics.fmean(latencies) * 1000:.2f}ms "
+              f"p50={latencies[len(latencies) // 2] * 1000:.2f}ms "
+              f"p99={latencies[int(len(latencies) * 0.99)] * 1000:.2f}ms "
+              f"max={latencies[-1] * 1000:.2f}ms")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="ws://127.0.0.1:8000")
+    parser.add_argument("--rooms", type=int, default=100)
+    parser.add_argument("--participants", type=int, default=4, help="每个房间的成员数")
+    parser.add_argument("--rate", type=float, default=1.0, help="每个成员每秒发送的 signal 数")
+    parser.add_argument("--duration", type=float, default=10.0, help="全部连接建立后持续发送的时间（秒）")
+    parser.add_argument("--connect-concurrency", type=int, default=100, help="同时进行握手的连接数")
+    parser.add_argument("--room-prefix", default="bench-")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,105 @@
+"""
+启动耗时基准：import main 的 -X importtime 分解 + 启动 uvicorn 到首个 200 响应的时间
+
+    python -m benchmarks.bench_startup --runs 5 --top 15
+    python -m benchmarks.bench_startup --max-import-ms 1500 --max-ready-ms 3000   # 超过阈值时退出码为 1
+
+不需要数据库与 Redis：启动阶段只创建客户端对象，不建立连接。
+"""
+import argparse
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from collections import defaultdict
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def import_breakdown():
+    """
+    :return: (import main 总耗时 ms, {顶层包: 自身导入耗时 ms})
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"],
+                            cwd=ROOT, capture_output=True, text=True, check=True)
+    total = 0.0
+    packages = defaultdict(float)
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = (part.strip() for part in line[len("import time:"):].split("|"))
+        packages[name.split(".")[0]] += int(self_us) / 1000
+        if name == "main":
+            total = int(cumulative_us) / 1000
+    return total, packages
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def time_to_first_200(timeout: float = 60.0) -> float:
+    """
+    启动 uvicorn 进程，轮询 GET / 直到返回 200
+    :return: 耗时 ms
+    """
+    port = _free_port()
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, "-m", "uvicorn", "main:app", "--port", str(port),
+                                "--log-level", "warning"], cwd=ROOT)
+    try:
+        while time.perf_counter() - start < timeout:
+            if process.poll() is not None:
+                raise RuntimeError(f"uvicorn 进程退出，返回码 {process.returncode}")
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/", timeout=1) as response:
+                    if response.status == 200:
+                        return (time.perf_counter() - start) * 1000
+            except (urllib.error.URLError, ConnectionError):
+                time.sleep(0.01)
+        raise TimeoutError(f"{timeout}s 内未返回 200")
+    finally:
+        process.terminate()
+        process.wait()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--max-import-ms", type=float, default=None)
+    parser.add_argument("--max-ready-ms", type=float, default=None)
+    args = parser.parse_args()
+
+    import_totals = []
+    packages = defaultdict(list)
+    for _ in range(args.runs):
+        total, breakdown = import_breakdown()
+        import_totals.append(total)
+        for name, ms in breakdown.items():
+            packages[name].append(ms)
+    import_ms = statistics.median(import_totals)
+
+    print(f"import main: p50={import_ms:.1f}ms (runs={args.runs})")
+    ranked = sorted(((statistics.median(v), k) for k, v in packages.items()), reverse=True)
+    for ms, name in ranked[:args.top]:
+        print(f"  {name:<32} {ms:8.1f}ms")
+
+    ready = [time_to_first_200() for _ in range(args.runs)]
+    ready_ms = statistics.median(ready)
+    print(f"time to first 200: p50={ready_ms:.1f}ms max={max(ready):.1f}ms")
+
+    failed = []
+    if args.max_import_ms is not None and import_ms > args.max_import_ms:
+        failed.append(f"import main {import_ms:.1f}ms > {args.max_import_ms}ms")
+    if args.max_ready_ms is not None and ready_ms > args.max_ready_ms:
+        failed.append(f"time to first 200 {ready_ms:.1f}ms > {args.max_ready_ms}ms")
+    if failed:
+        print("启动耗时回归: " + "; ".join(failed))
+        sys.exit(1)
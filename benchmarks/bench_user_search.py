@@ -0,0 +1,81 @@
+"""
+/users/search 基准：在 t_user 中批量生成用户后测量 UserService.search_users 延迟
+
+    python -m benchmarks.bench_user_search --users 1000000 --repeat 20
+
+使用 DATABASE_URL 指向的数据库（需已执行 alembic upgrade head），生成的数据以 bench_ 前缀区分，
+结束时可用 --cleanup 删除。
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from dotenv import load_dotenv
+from sqlalchemy import text
+
+from app.core.db import async_session
+from app.services.user_service import UserService
+
+SEED_SQL = """
+    INSERT INTO t_user (name, email, password)
+    SELECT 'bench_' || substr(md5(g::text), 1, 10),
+           'bench_' || g || '_' || substr(md5(g::text), 11, 6) || '@example.com',
+           NULL
+    FROM generate_series(:start, :stop) AS g
+"""
+
+KEYWORDS = ["be", "bench_a", "bench_3f", "example", "bench_1234", "0f3a", "nomatch_zzz"]
+
+
+async def seed(total: int, batch: int = 100_000):
+    async with async_session() as session:
+        existing = (await session.execute(text("SELECT count(*) FROM t_user WHERE name LIKE 'bench\\_%'"))).scalar()
+        for start in range(existing + 1, total + 1, batch):
+            await session.execute(text(SEED_SQL), {"start": start, "stop": min(start + batch - 1, total)})
+            await session.commit()
+            print(f"seeded {min(start + batch - 1, total)}/{total}")
+        await session.execute(text("ANALYZE t_user"))
+        await session.commit()
+
+
+async def bench(repeat: int, limit: int):
+    for keyword in KEYWORDS:
+        samples = []
+        page = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            page = await UserService.search_users(keyword, limit=limit)
+            samples.append((time.perf_counter() - start) * 1000)
+        # 翻到第二页，验证 keyset 分页的开销
+        second = None
+        if page and page.next_cursor:
+            start = time.perf_counter()
+            await UserService.search_users(keyword, cursor=page.next_cursor, limit=limit)
+            second = round((time.perf_counter() - start) * 1000, 3)
+        samples.sort()
+        print(f"{keyword!r:16} hits={len(page.items):3} p50={statistics.median(samples):8.3f}ms "
+              f"p99={samples[min(len(samples) - 1, int(len(samples) * 0.99))]:8.3f}ms page2={second}ms")
+
+
+async def cleanup():
+    async with async_session() as session:
+        await session.execute(text("DELETE FROM t_user WHERE name LIKE 'bench\\_%'"))
+        await session.commit()
+
+
+async def main(args):
+    await seed(args.users)
+    await bench(args.repeat, args.limit)
+    if args.cleanup:
+        await cleanup()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--cleanup", action="store_true")
+    load_dotenv()
+    asyncio.run(main(parser.parse_args()))
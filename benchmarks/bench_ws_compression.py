@@ -0,0 +1,93 @@
+"""
+WebSocket 压缩对比：线上字节数与每条消息的 CPU 耗时
+
+    python -m benchmarks.bench_ws_compression --messages 5000
+
+直接调用 permessage-deflate 扩展编码服务端发出的帧（不经过网络），并用客户端解码校验结果。
+负载为三类典型消息：聊天消息（中文、字段名重复）、正在输入/已读等小帧、智能体流式输出的增量片段。
+"""
+import argparse
+import random
+import time
+
+from websockets import frames
+from websockets.extensions.permessage_deflate import PerMessageDeflate
+
+from app.schemas.chat_schema import MessageFrame, TextMessageEnvelope, TypingEventFrame, encode_frame
+from common.ws_compression import ThresholdPerMessageDeflate
+
+SENTENCES = [
+    "今晚七点在三楼会议室开周会，请大家提前准备好本周的工作进展。",
+    "收到，我这边的接口联调已经完成，测试环境明天可以部署。",
+    "用户反馈移动端图片上传偶尔失败，初步怀疑是弱网下超时时间太短。",
+    "好的，我先看一下日志，有结论了再同步到群里。",
+    "The p99 latency regression came from the new serializer, rollback is in progress.",
+]
+
+
+def chat_payloads(count: int):
+    rng = random.Random(42)
+    for i in range(count):
+        kind = rng.random()
+        if kind < 0.5:
+            envelope = TextMessageEnvelope(conversation_id=1024, client_message_id=f"{rng.getrandbits(128):032x}",
+                                           kind="text", payload={"text": rng.choice(SENTENCES)},
+                                           timestamp=1760860000000 + i)
+            yield "chat", encode_frame(MessageFrame(id=880000 + i, sender_id=rng.randint(1, 50), message=envelope))
+        elif kind < 0.8:
+            yield "typing", encode_frame(TypingEventFrame(conversation_id=1024, user_ids=[rng.randint(1, 50)]))
+        else:
+            # 智能体流式输出：每帧几个字
+            text = rng.choice(SENTENCES)
+            start = rng.randint(0, len(text) - 4)
+            yield "agent", ('{"type":"agent_delta","runId":"run_7f3a","conversationId":1024,"delta":"'
+                            + text[start:start + 4] + '"}')
+
+
+def header_size(length: int) -> int:
+    # 服务端发出的帧不加掩码
+    return 2 if length < 126 else 4 if length < 65536 else 10
+
+
+def run(name: str, extension, payloads):
+    decoder = PerMessageDeflate(False, False, 15, 15) if extension is not None else None
+    raw = wire = 0
+    encode_ns = 0
+    by_kind = {}
+    for kind, text in payloads:
+        frame = frames.Frame(frames.Opcode.TEXT, text.encode())
+        start = time.perf_counter_ns()
+        encoded = extension.encode(frame) if extension is not None else frame
+        encode_ns += time.perf_counter_ns() - start
+        if decoder is not None:
+            assert decoder.decode(encoded).data == frame.data
+        size = len(encoded.data) + header_size(len(encoded.data))
+        raw += len(frame.data) + header_size(len(frame.data))
+        wire += size
+        stat = by_kind.setdefault(kind, [0, 0])
+        stat[0] += 1
+        stat[1] += size
+    count = sum(s[0] for s in by_kind.values())
+    detail = "  ".join(f"{k}={s[1] / s[0]:.0f}B" for k, s in sorted(by_kind.items()))
+    print(f"{name:<34} 线上 {wire / 1024:>8.1f}KB（{wire / raw:>5.1%}）"
+          f"  {encode_ns / count / 1000:>6.2f}us/条  {detail}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=5000)
+    args = parser.parse_args()
+    payloads = list(chat_payloads(args.messages))
+
+    def deflate(window_bits=12, mem_level=5, level=6, threshold=0, no_context=False):
+        return ThresholdPerMessageDeflate(no_context, no_context, window_bits, window_bits,
+                                          {"memLevel": mem_level, "level": level}, threshold=threshold)
+
+    run("不压缩", None, payloads)
+    run("deflate 12/5（uvicorn 默认）", deflate(), payloads)
+    run("deflate 12/5 阈值 32B", deflate(threshold=32), payloads)
+    run("deflate 12/5 阈值 256B", deflate(threshold=256), payloads)
+    run("deflate 12/5 level 1", deflate(level=1), payloads)
+    run("deflate 15/8", deflate(window_bits=15, mem_level=8), payloads)
+    run("deflate 12/5 无上下文", deflate(no_context=True), payloads)
+    run("deflate 12/5 无上下文 阈值 256B", deflate(no_context=True, threshold=256), payloads)
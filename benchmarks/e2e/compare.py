@@ -0,0 +1,72 @@
+"""
+对比两次端到端压测的报告，吞吐下降或延迟上升超过阈值时以非零状态码退出，可用于 CI
+
+    python -m benchmarks.e2e.compare benchmarks/e2e/results/base.json benchmarks/e2e/results/new.json --threshold 10
+"""
+import argparse
+import sys
+from typing import Iterator, Tuple
+
+import orjson
+
+# 吞吐越高越好，其余（延迟、错误数）越低越好
+HIGHER_IS_BETTER = {"throughput_rps", "throughput_msgs"}
+COMPARED = {"throughput_rps", "throughput_msgs", "errors"}
+COMPARED_LATENCY = {"latency_ms", "ack_latency_ms", "delivery_lag_ms"}
+PERCENTILES = ("p50", "p99")
+
+
+def metrics(results: dict) -> Iterator[Tuple[str, float]]:
+    for phase, result in results.items():
+        for key, value in result.items():
+            if key in COMPARED:
+                yield f"{phase}.{key}", value
+            elif key in COMPARED_LATENCY and value:
+                for p in PERCENTILES:
+                    yield f"{phase}.{key}.{p}", value[p]
+
+
+def load(path: str) -> dict:
+    with open(path, "rb") as f:
+        return orjson.loads(f.read())
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("base")
+    parser.add_argument("new")
+    parser.add_argument("--threshold", type=float, default=10, help="允许的退化百分比")
+    args = parser.parse_args()
+
+    base, new = load(args.base), load(args.new)
+    if base["params"] != new["params"]:
+        print("警告：两次压测的参数不同，结果可能不可比")
+    print(f"base: {base['git_commit']} @ {base['created_at']}")
+    print(f"new:  {new['git_commit']} @ {new['created_at']}")
+    print(f"{'metric':<44}{'base':>12}{'new':>12}{'change':>10}")
+
+    base_metrics = dict(metrics(base["results"]))
+    regressions = []
+    for name, value in metrics(new["results"]):
+        if name not in base_metrics:
+            continue
+        old = base_metrics[name]
+        if old:
+            change = (value - old) / old * 100
+        else:
+            change = 0.0 if not value else float("inf")
+        # 错误数从 0 变为非 0 时 change 为 inf，总是视为退化
+        worse = -change if name.rsplit(".", 1)[-1] in HIGHER_IS_BETTER else change
+        regressed = worse > args.threshold
+        if regressed:
+            regressions.append(name)
+        print(f"{name:<44}{old:>12}{value:>12}{change:>+9.1f}%{'  <-- 退化' if regressed else ''}")
+
+    if regressions:
+        print(f"{len(regressions)} 项指标退化超过 {args.threshold}%")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
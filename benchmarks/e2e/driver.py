@@ -0,0 +1,314 @@
+"""
+端到端压测驱动：通过 HTTP / WebSocket 访问运行中的服务，结果写入 JSON 报告
+
+    python -m benchmarks.e2e.driver --base-url http://127.0.0.1:18000 --users 200 --duration 20
+    python -m benchmarks.e2e.driver --base-url http://127.0.0.1:18000 --phases websocket --clients 1000 --rate 2
+
+依次执行以下阶段（--phases 可选择其中几个），每个阶段持续 --duration 秒：
+    login                 POST /users/login（Argon2 校验密码）
+    users_me              GET /users/me
+    conversations_create  POST /chat/conversations
+    conversations_list    GET /chat/conversations
+    websocket             --clients 个连接两两组成会话，每个连接每秒发送 --rate 条消息，
+                          统计 ack 延迟（发送 -> 收到 ack）与投递延迟（发送 -> 会话中另一方收到 message 帧）
+
+压测账号以 --user-prefix 区分，已注册时直接复用。报告格式见 build_report，可用 benchmarks.e2e.compare 对比两次结果
+"""
+import argparse
+import asyncio
+import datetime
+import itertools
+import os
+import subprocess
+import time
+import uuid
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import httpx
+import orjson
+import websockets
+
+REPORT_VERSION = 1
+PHASES = ["login", "users_me", "conversations_create", "conversations_list", "websocket"]
+PASSWORD = "bench123"
+MESSAGE_TEXT = "今晚七点在三楼会议室开周会，请大家提前准备好本周的工作进展。"
+
+
+def summarize(samples: List[float]) -> Optional[Dict[str, float]]:
+    """
+    :param samples: 耗时（秒）
+    :return: 毫秒为单位的分位数
+    """
+    if not samples:
+        return None
+    samples = sorted(samples)
+
+    def percentile(q: float) -> float:
+        return round(samples[min(len(samples) - 1, int(len(samples) * q))] * 1000, 3)
+
+    return {"p50": percentile(0.5), "p90": percentile(0.9), "p99": percentile(0.99),
+            "max": round(samples[-1] * 1000, 3), "mean": round(sum(samples) / len(samples) * 1000, 3)}
+
+
+class Recorder:
+    """
+    单个阶段的请求耗时与错误
+    """
+
+    def __init__(self):
+        self.latencies: List[float] = []
+        self.errors = 0
+        self.error_samples: List[str] = []
+        self.started = self.finished = 0.0
+
+    def error(self, e: BaseException):
+        self.errors += 1
+        message = f"{type(e).__name__}: {e}"[:200]
+        if len(self.error_samples) < 5 and message not in self.error_samples:
+            self.error_samples.append(message)
+
+    def summary(self) -> dict:
+        elapsed = max(self.finished - self.started, 1e-9)
+        return {"count": len(self.latencies), "errors": self.errors, "error_samples": self.error_samples,
+                "duration_s": round(elapsed, 3), "throughput_rps": round(len(self.latencies) / elapsed, 1),
+                "latency_ms": summarize(self.latencies)}
+
+
+async def run_phase(request: Callable[[int], Awaitable[None]], concurrency: int, duration: float) -> dict:
+    """
+    concurrency 个协程在 duration 秒内循环调用 request(n)，n 为全局递增的请求序号
+    """
+    recorder = Recorder()
+    counter = itertools.count()
+    recorder.started = time.perf_counter()
+    deadline = recorder.started + duration
+
+    async def worker():
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                await request(next(counter))
+                recorder.latencies.append(time.perf_counter() - start)
+            except Exception as e:
+                recorder.error(e)
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    recorder.finished = time.perf_counter()
+    return recorder.summary()
+
+
+class Account:
+    def __init__(self, email: str):
+        self.email = email
+        self.user_id: Optional[int] = None
+        self.token: Optional[str] = None
+
+    @property
+    def headers(self) -> dict:
+        return {"Authorization": f"Bearer {self.token}"}
+
+
+async def prepare_accounts(client: httpx.AsyncClient, count: int, prefix: str, concurrency: int) -> List[Account]:
+    """
+    注册（已注册时跳过）并登录压测账号
+    """
+    accounts = [Account(f"{prefix}_{i}@example.com") for i in range(count)]
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def prepare(i: int, account: Account):
+        async with semaphore:
+            await client.post("/users/register", json={"name": f"e2e{i}", "email": account.email,
+                                                       "password": PASSWORD})
+            response = await client.post("/users/login", json={"username": account.email, "password": PASSWORD})
+            response.raise_for_status()
+            account.token = response.json()["access_token"]
+            response = await client.get("/users/me", headers=account.headers)
+            response.raise_for_status()
+            account.user_id = response.json()["id"]
+
+    await asyncio.gather(*(prepare(i, a) for i, a in enumerate(accounts)))
+    return accounts
+
+
+async def websocket_phase(ws_url: str, accounts: List[Account], conversations: List[int], clients: int,
+                          rate: float, duration: float, connect_concurrency: int) -> dict:
+    """
+    第 2k、2k+1 个连接属于同一个会话（accounts[2k] 与 accounts[2k+1] 的会话），互相发送消息
+    """
+    sent_at: Dict[str, float] = {}
+    ack_latencies: List[float] = []
+    delivery_lags: List[float] = []
+    recorder = Recorder()
+    stats = {"connected": 0, "connect_failed": 0, "sent": 0, "acked": 0, "delivered": 0}
+    semaphore = asyncio.Semaphore(connect_concurrency)
+    start = asyncio.Event()
+    stop = asyncio.Event()
+    ready = 0
+    all_connected = asyncio.Event()
+
+    async def client(index: int):
+        nonlocal ready
+        account = accounts[index % len(accounts)]
+        conversation_id = conversations[(index // 2) % len(conversations)]
+        ws = None
+        try:
+            async with semaphore:
+                ws = await websockets.connect(f"{ws_url}/websocket/chat?token={account.token}", max_size=None,
+                                              open_timeout=30)
+            stats["connected"] += 1
+        except Exception as e:
+            stats["connect_failed"] += 1
+            recorder.error(e)
+        finally:
+            ready += 1
+            if ready == clients:
+                all_connected.set()
+        if ws is None:
+            return
+
+        async def receive():
+            async for text in ws:
+                frame = orjson.loads(text)
+                now = time.perf_counter()
+                if frame["type"] == "ack":
+                    sent = sent_at.get(frame["clientMessageId"])
+                    if sent is not None:
+                        stats["acked"] += 1
+                        ack_latencies.append(now - sent)
+                elif frame["type"] == "message" and frame["senderId"] != account.user_id:
+                    sent = sent_at.get(frame["message"]["clientMessageId"])
+                    if sent is not None:
+                        stats["delivered"] += 1
+                        delivery_lags.append(now - sent)
+                elif frame["type"] == "error":
+                    recorder.error(RuntimeError(frame["message"]))
+
+        receiver = asyncio.create_task(receive())
+        try:
+            await start.wait()
+            interval = 1 / rate
+            # 错开各连接的发送时间
+            await asyncio.sleep(interval * (index % 97) / 97)
+            while not stop.is_set():
+                client_message_id = uuid.uuid4().hex
+                sent_at[client_message_id] = time.perf_counter()
+                await ws.send(orjson.dumps({"type": "send", "message": {
+                    "conversationId": conversation_id, "clientMessageId": client_message_id, "kind": "text",
+                    "payload": {"text": MESSAGE_TEXT}, "timestamp": int(time.time() * 1000)}}).decode())
+                stats["sent"] += 1
+                await asyncio.sleep(interval)
+            # 等待在途消息的 ack 与投递
+            await asyncio.sleep(2)
+        except Exception as e:
+            recorder.error(e)
+        finally:
+            receiver.cancel()
+            await ws.close()
+
+    tasks = [asyncio.create_task(client(i)) for i in range(clients)]
+    await all_connected.wait()
+    began = time.perf_counter()
+    start.set()
+    await asyncio.sleep(duration)
+    stop.set()
+    elapsed = time.perf_counter() - began
+    await asyncio.gather(*tasks)
+    # 每条消息应投递给会话中的另一方（该成员有多个连接时每个连接各收到一次）
+    return {**stats, "errors": recorder.errors, "error_samples": recorder.error_samples,
+            "duration_s": round(elapsed, 3), "throughput_msgs": round(stats["acked"] / elapsed, 1),
+            "ack_latency_ms": summarize(ack_latencies), "delivery_lag_ms": summarize(delivery_lags)}
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def build_report(args, results: dict) -> dict:
+    return {
+        "version": REPORT_VERSION,
+        "created_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "git_commit": git_commit(),
+        "params": {k: v for k, v in vars(args).items() if k != "out"},
+        "results": results,
+    }
+
+
+async def main(args) -> dict:
+    phases = args.phases.split(",")
+    results = {}
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.base_url, limits=limits, timeout=60) as client:
+        accounts = await prepare_accounts(client, args.users, args.user_prefix, args.concurrency)
+        print(f"已准备 {len(accounts)} 个账号")
+
+        async def login(n: int):
+            account = accounts[n % len(accounts)]
+            response = await client.post("/users/login", json={"username": account.email, "password": PASSWORD})
+            response.raise_for_status()
+
+        async def users_me(n: int):
+            response = await client.get("/users/me", headers=accounts[n % len(accounts)].headers)
+            response.raise_for_status()
+
+        async def conversations_create(n: int):
+            account = accounts[n % len(accounts)]
+            other = accounts[(n + 1) % len(accounts)]
+            response = await client.post("/chat/conversations", json=[other.user_id], headers=account.headers)
+            response.raise_for_status()
+
+        async def conversations_list(n: int):
+            response = await client.get("/chat/conversations", headers=accounts[n % len(accounts)].headers)
+            response.raise_for_status()
+
+        for name, request in (("login", login), ("users_me", users_me),
+                              ("conversations_create", conversations_create),
+                              ("conversations_list", conversations_list)):
+            if name in phases:
+                results[name] = await run_phase(request, args.concurrency, args.duration)
+                print(f"{name:<22} {results[name]['throughput_rps']:>9.1f} req/s  "
+                      f"latency={results[name]['latency_ms']}  errors={results[name]['errors']}")
+
+        if "websocket" in phases:
+            # accounts[2k] 创建与 accounts[2k+1] 的会话
+            conversations = []
+            for i in range(0, len(accounts) - 1, 2):
+                response = await client.post("/chat/conversations", json=[accounts[i + 1].user_id],
+                                             headers=accounts[i].headers)
+                response.raise_for_status()
+                conversations.append(response.json())
+            ws_url = "ws" + args.base_url[len("http"):]
+            results["websocket"] = await websocket_phase(ws_url, accounts[:len(conversations) * 2], conversations,
+                                                         args.clients, args.rate, args.duration,
+                                                         args.concurrency)
+            ws = results["websocket"]
+            print(f"{'websocket':<22} {ws['throughput_msgs']:>9.1f} msg/s  ack={ws['ack_latency_ms']}  "
+                  f"delivery={ws['delivery_lag_ms']}  connected={ws['connected']}  errors={ws['errors']}")
+
+    report = build_report(args, results)
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    with open(args.out, "wb") as f:
+        f.write(orjson.dumps(report, option=orjson.OPT_INDENT_2))
+    print(f"报告已写入 {args.out}")
+    return report
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--base-url", default="http://127.0.0.1:18000")
+    parser.add_argument("--phases", default=",".join(PHASES), help=f"逗号分隔，可选 {', '.join(PHASES)}")
+    parser.add_argument("--users", type=int, default=100, help="压测账号数")
+    parser.add_argument("--user-prefix", default="e2e_bench")
+    parser.add_argument("--concurrency", type=int, default=50, help="HTTP 并发数，也是同时握手的 WebSocket 连接数")
+    parser.add_argument("--duration", type=float, default=15, help="每个阶段的持续时间（秒）")
+    parser.add_argument("--clients", type=int, default=100, help="WebSocket 连接数")
+    parser.add_argument("--rate", type=float, default=1, help="每个连接每秒发送的消息数")
+    parser.add_argument("--out", default=f"benchmarks/e2e/results/{datetime.datetime.now():%Y%m%d-%H%M%S}.json")
+    return parser
+
+
+if __name__ == '__main__':
+    asyncio.run(main(build_parser().parse_args()))
@@ -0,0 +1,72 @@
+"""
+OpenAI 兼容的大模型桩服务：固定回复、可配置的首字延迟与输出速度，压测时代替真实的模型服务
+
+    uvicorn benchmarks.e2e.fake_openai:app --host 0.0.0.0 --port 9000
+
+应用通过 DEEPSEEK_API_BASE / OPENAI_BASE_URL 指向 http://<host>:9000/v1
+
+环境变量：
+FAKE_LLM_LATENCY_MS: 首个 token 之前的延迟（毫秒），默认 200
+FAKE_LLM_TOKENS_PER_SECOND: 流式输出速度，默认 50
+FAKE_LLM_REPLY: 回复内容，默认一段固定的中文
+"""
+import asyncio
+import os
+import time
+import uuid
+
+import orjson
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+FAKE_LLM_LATENCY_MS = int(os.getenv("FAKE_LLM_LATENCY_MS", 200))
+FAKE_LLM_TOKENS_PER_SECOND = float(os.getenv("FAKE_LLM_TOKENS_PER_SECOND", 50))
+FAKE_LLM_REPLY = os.getenv("FAKE_LLM_REPLY", "好的，这是压测桩服务返回的固定回复，用于衡量服务端自身的开销。")
+
+app = FastAPI()
+
+
+def _tokens(text: str):
+    # 每两个字符作为一个 token
+    return [text[i:i + 2] for i in range(0, len(text), 2)]
+
+
+@app.get("/v1/models")
+async def models():
+    return {"object": "list", "data": [{"id": "fake-chat", "object": "model", "owned_by": "e2e"}]}
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    model = body.get("model", "fake-chat")
+    completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+    created = int(time.time())
+    tokens = _tokens(FAKE_LLM_REPLY)
+    usage = {"prompt_tokens": sum(len(str(m.get("content", ""))) for m in body.get("messages", [])) // 2,
+             "completion_tokens": len(tokens)}
+    usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+    await asyncio.sleep(FAKE_LLM_LATENCY_MS / 1000)
+
+    if not body.get("stream"):
+        return JSONResponse({
+            "id": completion_id, "object": "chat.completion", "created": created, "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": FAKE_LLM_REPLY},
+                         "finish_reason": "stop"}],
+            "usage": usage,
+        })
+
+    async def events():
+        def chunk(delta: dict, finish_reason=None, **extra) -> bytes:
+            data = {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                    "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}], **extra}
+            return b"data: " + orjson.dumps(data) + b"\n\n"
+
+        yield chunk({"role": "assistant", "content": ""})
+        for token in tokens:
+            await asyncio.sleep(1 / FAKE_LLM_TOKENS_PER_SECOND)
+            yield chunk({"content": token})
+        yield chunk({}, "stop", usage=usage)
+        yield b"data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
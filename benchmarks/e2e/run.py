@@ -0,0 +1,39 @@
+"""
+启动端到端压测环境（docker compose：应用、PostgreSQL、Redis、大模型桩服务），执行压测后销毁
+
+    python -m benchmarks.e2e.run --users 200 --clients 1000 --rate 2
+    python -m benchmarks.e2e.run --keep --phases websocket     # 保留环境，便于反复压测或排查
+
+除 --keep、--no-build 外的参数原样传给 benchmarks.e2e.driver；应用的进程数由 E2E_WEB_CONCURRENCY 控制（默认 2）
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+COMPOSE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "docker-compose.yaml")
+PROJECT = "fastapi-e2e"
+
+
+def compose(*args: str):
+    subprocess.run(["docker", "compose", "-f", COMPOSE_FILE, "-p", PROJECT, *args], check=True)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--keep", action="store_true", help="压测结束后不销毁环境")
+    parser.add_argument("--no-build", action="store_true", help="复用已构建的镜像")
+    args, driver_args = parser.parse_known_args()
+
+    compose("up", "-d", "--wait", *([] if args.no_build else ["--build"]))
+    try:
+        port = os.getenv("E2E_WEB_PORT", "18000")
+        return subprocess.run([sys.executable, "-m", "benchmarks.e2e.driver",
+                               "--base-url", f"http://127.0.0.1:{port}", *driver_args]).returncode
+    finally:
+        if not args.keep:
+            compose("down", "-v")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,64 @@
+"""
+HTTP / WebSocket 请求指标 ASGI 中间件
+
+按路由模板（例如 /users/{user_id}）而不是原始路径记录，避免 label 基数失控；
+label 组合对应的指标对象在首次出现时创建并缓存，之后每个请求只做一次字典查找。
+"""
+import time
+from typing import Dict, Tuple
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from common.metrics import REGISTRY, Registry
+
+# 未匹配到路由（404、被限流等在路由之前返回的请求）
+UNMATCHED = "<unmatched>"
+
+
+class MetricsMiddleware:
+    def __init__(self, app: ASGIApp, registry: Registry = REGISTRY):
+        self.app = app
+        self._requests = registry.counter("http_requests_total", "HTTP 请求数", ["method", "route", "status"])
+        self._latency = registry.histogram("http_request_duration_seconds", "HTTP 请求耗时（秒）",
+                                           ["method", "route"])
+        self._in_progress = registry.gauge("http_requests_in_progress", "处理中的 HTTP 请求数")
+        self._websockets = registry.gauge("websocket_connections", "当前 WebSocket 连接数")
+        self._children: Dict[Tuple[str, str, int], tuple] = {}
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] == "http":
+            await self._http(scope, receive, send)
+        elif scope["type"] == "websocket":
+            self._websockets.inc()
+            try:
+                await self.app(scope, receive, send)
+            finally:
+                self._websockets.dec()
+        else:
+            await self.app(scope, receive, send)
+
+    async def _http(self, scope: Scope, receive: Receive, send: Send):
+        status = 500
+
+        async def send_wrapper(message: Message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        self._in_progress.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            self._in_progress.dec()
+            # 路由匹配后 starlette 会把 route 写入 scope
+            route = scope.get("route")
+            key = (scope["method"], route.path if route is not None else UNMATCHED, status)
+            children = self._children.get(key)
+            if children is None:
+                children = self._children[key] = (self._requests.labels(*key),
+                                                   self._latency.labels(key[0], key[1]))
+            children[0].inc()
+            children[1].observe(elapsed)
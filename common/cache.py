@@ -0,0 +1,251 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Generic, Hashable, Iterable, List, Optional, Set, Type, TypeVar
+
+import orjson
+from pydantic import BaseModel
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+_logger = logging.getLogger(__name__)
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V", bound=BaseModel)
+
+
+class LRUCache(Generic[K, V]):
+    """
+    进程内 LRU 缓存，带过期时间
+    """
+
+    def __init__(self, maxsize: int = 10000, ttl: float = 60.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict[K, tuple] = OrderedDict()
+
+    def get(self, key: K) -> Optional[V]:
+        item = self._data.get(key)
+        if item is None:
+            return None
+        value, expire_at = item
+        if expire_at < time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: K, value: V):
+        self._data[key] = (value, time.monotonic() + self.ttl)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def delete(self, key: K):
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+
+class TwoTierCache(Generic[K, V]):
+    """
+    两级读穿缓存：进程内 LRU + Redis
+
+    - 未命中时通过 loader 批量回源，一次查询只加载缺失的 key
+    - 同一个 key 的并发回源只执行一次（single-flight）
+    - 写操作调用 invalidate，通过 Redis pub/sub 通知所有进程清理本地缓存
+    - 每个 key 在 Redis 中有一个版本号，invalidate 时递增；回源前记录版本号，回写时版本号已变化
+      （回源期间发生了失效）则不回写，避免把更新前的数据写回缓存
+    - Redis 不可用时降级为本地缓存 + 直接回源
+    """
+
+    # 版本号未变化时才写入：KEYS = [数据 key, 版本 key]，ARGV = [数据, 过期秒数, 回源前的版本号]
+    _SET_IF_VERSION = """
+    if (redis.call('get', KEYS[2]) or '') == ARGV[3] then
+        redis.call('set', KEYS[1], ARGV[1], 'EX', ARGV[2])
+        return 1
+    end
+    return 0
+    """
+
+    def __init__(
+            self,
+            namespace: str,
+            model: Type[V],
+            loader: Callable[[List[K]], Awaitable[Dict[K, V]]],
+            redis_factory: Callable[[], Redis],
+            local_maxsize: int = 10000,
+            local_ttl: float = 60.0,
+            redis_ttl: int = 3600,
+            key_type: Callable[[str], K] = str,
+    ):
+        """
+        :param namespace: Redis key 前缀，例如 user:info
+        :param model: 缓存值的 pydantic 模型
+        :param loader: 批量回源函数，返回 {key: value}，不存在的 key 不返回
+        :param redis_factory: 获取 Redis 客户端
+        :param key_type: 失效消息中 key 的解析函数，例如 int
+        """
+        self.namespace = namespace
+        self.model = model
+        self.loader = loader
+        self.redis_factory = redis_factory
+        self.local: LRUCache[K, V] = LRUCache(local_maxsize, local_ttl)
+        self.redis_ttl = redis_ttl
+        self.key_type = key_type
+        self.channel = f"{namespace}:invalidate"
+        self._inflight: Dict[K, asyncio.Future] = {}
+        # 回源期间被失效的 key，回源结果不写入本地缓存
+        self._stale: Set[K] = set()
+        self._listener: Optional[asyncio.Task] = None
+        self._listener_retry_at = 0.0
+
+    def _key(self, key: K) -> str:
+        return f"{self.namespace}:{key}"
+
+    def _version_key(self, key: K) -> str:
+        return f"{self.namespace}:{key}:v"
+
+    async def get(self, key: K) -> Optional[V]:
+        return (await self.get_many([key])).get(key)
+
+    async def get_many(self, keys: Iterable[K]) -> Dict[K, V]:
+        self._ensure_listener()
+        result: Dict[K, V] = {}
+        waiting: Dict[K, asyncio.Future] = {}
+        misses: List[K] = []
+        for key in dict.fromkeys(keys):
+            value = self.local.get(key)
+            if value is not None:
+                result[key] = value
+            elif key in self._inflight:
+                waiting[key] = self._inflight[key]
+            else:
+                misses.append(key)
+
+        if misses:
+            loop = asyncio.get_running_loop()
+            futures = {key: loop.create_future() for key in misses}
+            self._inflight.update(futures)
+            try:
+                loaded = await self._load(misses)
+                for key, future in futures.items():
+                    future.set_result(loaded.get(key))
+                result.update(loaded)
+            except BaseException as e:
+                for future in futures.values():
+                    if isinstance(e, Exception):
+                        future.set_exception(e)
+                        future.exception()
+                    else:
+                        future.cancel()
+                raise
+            finally:
+                for key in misses:
+                    self._inflight.pop(key, None)
+                    self._stale.discard(key)
+
+        for key, future in waiting.items():
+            value = await asyncio.shield(future)
+            if value is not None:
+                result[key] = value
+        return result
+
+    async def _load(self, keys: List[K]) -> Dict[K, V]:
+        found: Dict[K, V] = {}
+        versions: Dict[K, bytes] = {}
+        redis = self.redis_factory()
+        try:
+            raw = await redis.mget([self._key(k) for k in keys] + [self._version_key(k) for k in keys])
+            for key, data, version in zip(keys, raw, raw[len(keys):]):
+                if data is not None:
+                    found[key] = self.model.model_validate(orjson.loads(data))
+                else:
+                    versions[key] = version or b""
+        except RedisError as e:
+            _logger.warning("Redis 读取缓存失败，直接回源: %s", e)
+            redis = None
+
+        db_keys = [k for k in keys if k not in found]
+        if db_keys:
+            loaded = await self.loader(db_keys)
+            found.update(loaded)
+            if redis is not None and loaded:
+                try:
+                    set_if_version = redis.register_script(self._SET_IF_VERSION)
+                    async with redis.pipeline(transaction=False) as pipe:
+                        for key, value in loaded.items():
+                            await set_if_version(
+                                keys=[self._key(key), self._version_key(key)],
+                                args=[orjson.dumps(value.model_dump(mode="json")), self.redis_ttl, versions[key]],
+                                client=pipe)
+                        written = await pipe.execute()
+                    self._stale.update(key for key, ok in zip(loaded, written) if not ok)
+                except RedisError as e:
+                    _logger.warning("Redis 写入缓存失败: %s", e)
+
+        for key, value in found.items():
+            if key not in self._stale:
+                self.local.set(key, value)
+        return found
+
+    async def invalidate(self, key: K):
+        """
+        删除缓存并通知其他进程
+        """
+        self._mark_invalid(key)
+        try:
+            redis = self.redis_factory()
+            async with redis.pipeline(transaction=True) as pipe:
+                pipe.incr(self._version_key(key))
+                pipe.expire(self._version_key(key), self.redis_ttl)
+                pipe.delete(self._key(key))
+                await pipe.execute()
+            await redis.publish(self.channel, str(key))
+        except RedisError as e:
+            _logger.warning("Redis 缓存失效通知失败: %s", e)
+
+    def _ensure_listener(self):
+        if self._listener is not None and not self._listener.done():
+            return
+        if time.monotonic() < self._listener_retry_at:
+            return
+        self._listener = asyncio.get_running_loop().create_task(self._listen())
+
+    async def _listen(self):
+        pubsub = self.redis_factory().pubsub()
+        try:
+            await pubsub.subscribe(self.channel)
+            async for message in pubsub.listen():
+                if message["type"] == "message":
+                    self._evict_local(message["data"])
+        except RedisError as e:
+            # 订阅断开期间可能漏掉失效通知，清空本地缓存，5 秒后再重新订阅
+            _logger.warning("缓存失效订阅中断: %s", e)
+            self.local.clear()
+            self._stale.update(self._inflight)
+            self._listener_retry_at = time.monotonic() + 5
+        finally:
+            await pubsub.aclose()
+
+    def _mark_invalid(self, key: K):
+        self.local.delete(key)
+        if key in self._inflight:
+            self._stale.add(key)
+
+    def _evict_local(self, raw_key):
+        if isinstance(raw_key, bytes):
+            raw_key = raw_key.decode()
+        try:
+            self._mark_invalid(self.key_type(raw_key))
+        except ValueError:
+            _logger.warning("无法解析缓存失效 key: %s", raw_key)
+
+    async def close(self):
+        if self._listener is not None:
+            self._listener.cancel()
+            # 等待订阅任务退出，由 _listen 关闭 pub/sub 连接
+            await asyncio.gather(self._listener, return_exceptions=True)
+            self._listener = None
@@ -1,36 +1,130 @@
+import atexit
+import copy
 import logging
-import logging.config
+import logging.handlers
 import os
+import queue
+import random
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Optional
+
+import orjson
+
+# 请求上下文，由 RequestContextMiddleware 与 get_current_user 设置，输出到每条日志
+request_id_ctx: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+user_id_ctx: ContextVar[Optional[int]] = ContextVar("user_id", default=None)
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class ContextFilter(logging.Filter):
+    """
+    在调用方线程读取 contextvars，写入日志记录
+    """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_ctx.get()
+        record.user_id = user_id_ctx.get()
+        return True
+
+
+class DebugSamplingFilter(logging.Filter):
+    """
+    按比例采样 DEBUG 日志，INFO 及以上全部保留
+    """
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno > logging.DEBUG or self.rate >= 1 or random.random() < self.rate
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "request_id": getattr(record, "request_id", None),
+            "user_id": getattr(record, "user_id", None),
+            "process": record.process,
+            "thread": record.thread,
+            "lineno": record.lineno,
+        }
+        if record.exc_info:
+            data["exc_info"] = self.formatException(record.exc_info)
+        return orjson.dumps(data).decode()
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """
+    只在调用方合并 msg 与 args（避免参数对象之后被修改），
+    时间格式化、JSON 序列化、异常堆栈格式化都放到后台线程
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
 
 
 def init_logging():
-    LOGGING_CONFIG = {
-        "version": 1,
-        "disable_existing_loggers": False,
-        "formatters": {
-            "verbose": {
-                "format": "{asctime} {levelname} {name}[{lineno:d}] {process:d} {thread:d}: {message}",
-                "style": "{",
-            }
-        },
-        "handlers": {
-            "console": {
-                "class": "logging.StreamHandler",
-                "formatter": "verbose",
-            },
-        },
-        "root": {
-            "handlers": ["console"],
-            "level": os.getenv("APP_LOG_LEVEL", "INFO"),
-            'formatter': 'verbose'
-        },
-        "loggers": {
-            "django": {
-                "handlers": ["console"],
-                "level": os.getenv("APP_LOG_LEVEL", "INFO"),
-                "propagate": False,
-                "formatter": "verbose"
-            },
-        },
-    }
-    logging.config.dictConfig(LOGGING_CONFIG)
+    """
+    日志写入内存队列，由后台线程格式化并输出，事件循环线程上不做 I/O
+
+    环境变量：
+    APP_LOG_LEVEL: 日志级别，默认 INFO
+    APP_LOG_FORMAT: text / json，默认 text
+    APP_LOG_DEBUG_SAMPLE_RATE: DEBUG 日志采样比例，默认 1（全部保留）
+    """
+    global _listener
+    if os.getenv("APP_LOG_FORMAT", "text") == "json":
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter("{asctime} {levelname} {name}[{lineno:d}] {process:d} {thread:d}: {message}",
+                                      style="{")
+    console = logging.StreamHandler()
+    console.setFormatter(formatter)
+
+    stop_logging()
+    handler, _listener = create_queue_logging(console, float(os.getenv("APP_LOG_DEBUG_SAMPLE_RATE", 1)))
+    logging.root.handlers = [handler]
+    logging.root.setLevel(os.getenv("APP_LOG_LEVEL", "INFO"))
+    _listener.start()
+    atexit.register(stop_logging)
+
+
+def create_queue_logging(target: logging.Handler, debug_sample_rate: float = 1.0):
+    """
+    :param target: 实际输出日志的 handler，在后台线程中执行
+    :return: (挂到 logger 上的 QueueHandler, 未启动的 QueueListener)
+    """
+    log_queue = queue.SimpleQueue()
+    handler = _QueueHandler(log_queue)
+    handler.addFilter(DebugSamplingFilter(debug_sample_rate))
+    handler.addFilter(ContextFilter())
+    return handler, logging.handlers.QueueListener(log_queue, target, respect_handler_level=True)
+
+
+def flush_logging():
+    """
+    等待后台线程输出队列中已有的日志，之后继续正常工作
+    """
+    if _listener is not None:
+        _listener.stop()
+        _listener.start()
+
+
+def stop_logging():
+    """
+    停止后台线程，输出队列中剩余的日志
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
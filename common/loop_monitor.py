@@ -0,0 +1,111 @@
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Deque, List, Optional
+
+from common.metrics import REGISTRY
+
+_logger = logging.getLogger(__name__)
+
+_LAG = REGISTRY.histogram("event_loop_lag_seconds", "事件循环调度延迟（秒）",
+                          buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0))
+_LAG_LAST = REGISTRY.gauge("event_loop_lag_last_seconds", "最近一次测得的事件循环调度延迟（秒）")
+_STALLS = REGISTRY.counter("event_loop_stalls_total", "看门狗检测到的事件循环阻塞次数")
+
+# 记录的阻塞栈最多保留的帧数（最内层）
+STALL_STACK_LIMIT = 40
+
+
+class LoopLagMonitor:
+    """
+    周期性 sleep(interval)，实际唤醒时间与预期时间之差即事件循环被阻塞的时长
+
+    另有一个看门狗线程检查心跳：事件循环超过 warn_threshold 没有按时唤醒时，在阻塞仍在发生时
+    抓取事件循环线程的调用栈（sys._current_frames），直接定位阻塞事件循环的同步代码，
+    每次阻塞只记录一次，最近的记录可通过 recent_stalls() 查看
+    """
+
+    def __init__(self, interval: float = 0.5, warn_threshold: float = 0.2, capture_stacks: bool = True,
+                 history: int = 20):
+        """
+        :param interval: 采样间隔（秒）
+        :param warn_threshold: 延迟超过该值时输出告警日志
+        :param capture_stacks: 是否启动看门狗线程抓取阻塞时的调用栈
+        :param history: 保留最近多少次阻塞记录
+        """
+        self.interval = interval
+        self.warn_threshold = warn_threshold
+        self.capture_stacks = capture_stacks
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+        self._loop_thread_id: Optional[int] = None
+        # 下一次心跳的预期时间；由事件循环线程写、看门狗线程读，单个 float 的赋值不需要加锁
+        self._expected = 0.0
+        self._stalls: Deque[dict] = deque(maxlen=history)
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._loop_thread_id = threading.get_ident()
+            self._expected = time.perf_counter() + self.interval
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        if self.capture_stacks and (self._watchdog is None or not self._watchdog.is_alive()):
+            self._stopped.clear()
+            self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+            self._watchdog.start()
+
+    async def _run(self):
+        while True:
+            self._expected = expected = time.perf_counter() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, time.perf_counter() - expected)
+            _LAG.observe(lag)
+            _LAG_LAST.set(lag)
+            if lag > self.warn_threshold:
+                _logger.warning("事件循环阻塞 %.0fms", lag * 1000)
+
+    def _watch(self):
+        reported = 0.0
+        # 检查间隔越小，发现阻塞时记录到的栈越接近阻塞开始时的位置
+        while not self._stopped.wait(self.warn_threshold / 4):
+            expected = self._expected
+            overdue = time.perf_counter() - expected
+            if overdue <= self.warn_threshold or expected == reported:
+                continue
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            reported = expected
+            stack = traceback.format_stack(frame, limit=STALL_STACK_LIMIT)
+            del frame
+            _STALLS.inc()
+            self._stalls.append({"time": time.time(), "blocked_ms": round(overdue * 1000, 1), "stack": stack})
+            _logger.warning("事件循环已阻塞 %.0fms，事件循环线程的调用栈：\n%s", overdue * 1000, "".join(stack))
+
+    def recent_stalls(self) -> List[dict]:
+        """
+        最近的阻塞记录（从新到旧）：time、看门狗发现时已阻塞的毫秒数 blocked_ms、调用栈 stack
+        """
+        return list(reversed(self._stalls))
+
+    async def stop(self):
+        self._stopped.set()
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._watchdog is not None:
+            await asyncio.to_thread(self._watchdog.join)
+            self._watchdog = None
+
+
+# LOOP_LAG_WARN_MS: 告警与抓取调用栈的阈值（毫秒）；LOOP_STALL_STACKS=false 时不启动看门狗线程
+loop_monitor = LoopLagMonitor(
+    warn_threshold=int(os.getenv("LOOP_LAG_WARN_MS", 200)) / 1000,
+    capture_stacks=os.getenv("LOOP_STALL_STACKS", "true") == "true",
+)
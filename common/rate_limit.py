@@ -0,0 +1,169 @@
+"""
+限流：进程内令牌桶快速路径 + Redis GCRA（通用信元速率算法）
+
+进程内令牌桶只统计本进程的请求，它拒绝时全局请求数必然也已超限，因此可以直接拒绝，
+不访问 Redis；放行后再由 Redis 脚本做跨进程的精确判断。Redis 不可用时降级为只用本地令牌桶。
+"""
+import logging
+import math
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional, Tuple
+
+import orjson
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from common.exceptions import ServiceException
+from common.metrics import REGISTRY
+
+_logger = logging.getLogger(__name__)
+
+_REJECTED = REGISTRY.counter("rate_limit_rejected_total", "被限流拒绝的请求数", ["limiter", "tier"])
+
+# KEYS[1]: 限流 key；ARGV[1]: 发放间隔（毫秒）；ARGV[2]: 突发容量
+# 返回 {是否放行, 需要等待的毫秒数}
+_GCRA_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local interval = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local tat = tonumber(redis.call('GET', KEYS[1]) or now)
+if tat < now then
+    tat = now
+end
+local new_tat = tat + interval
+local allow_at = new_tat - interval * burst
+if now < allow_at then
+    return {0, allow_at - now}
+end
+redis.call('SET', KEYS[1], new_tat, 'PX', new_tat - now)
+return {1, 0}
+"""
+
+
+@dataclass
+class RateLimitDecision:
+    allowed: bool
+    retry_after: float = 0.0
+
+
+class RateLimitExceeded(ServiceException):
+    def __init__(self, retry_after: float):
+        super().__init__("请求过于频繁，请稍后再试", 429)
+        self.headers = {"Retry-After": str(max(1, math.ceil(retry_after)))}
+
+
+class _LocalTokenBucket:
+    """
+    按 key 划分的进程内令牌桶，key 数量超过 maxsize 时淘汰最久未使用的
+    """
+
+    def __init__(self, rate: float, burst: int, maxsize: int = 100_000):
+        self.rate = rate
+        self.burst = burst
+        self.maxsize = maxsize
+        self._buckets: OrderedDict[str, Tuple[float, float]] = OrderedDict()
+
+    def acquire(self, key: str) -> RateLimitDecision:
+        now = time.monotonic()
+        tokens, updated = self._buckets.get(key, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated) * self.rate)
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+        self._buckets[key] = (tokens, now)
+        self._buckets.move_to_end(key)
+        while len(self._buckets) > self.maxsize:
+            self._buckets.popitem(last=False)
+        return RateLimitDecision(allowed, 0.0 if allowed else (1 - tokens) / self.rate)
+
+
+class RateLimiter:
+    """
+    每个 key 在 period 秒内最多 limit 次请求，允许 limit 次突发
+    """
+
+    def __init__(self, name: str, limit: int, period: float, redis_factory: Optional[Callable[[], Redis]] = None):
+        """
+        :param name: 限流器名称，用于 Redis key 与指标
+        :param redis_factory: 获取 Redis 客户端，为空时只使用进程内令牌桶
+        """
+        self.name = name
+        self.limit = limit
+        self.period = period
+        self.redis_factory = redis_factory
+        self._interval_ms = max(1, int(period * 1000 / limit))
+        self._local = _LocalTokenBucket(limit / period, limit)
+        self._script = None
+
+    async def hit(self, key: str) -> RateLimitDecision:
+        decision = self._local.acquire(key)
+        if not decision.allowed:
+            _REJECTED.labels(self.name, "local").inc()
+            return decision
+        if self.redis_factory is None:
+            return decision
+        try:
+            redis = self.redis_factory()
+            if self._script is None:
+                self._script = redis.register_script(_GCRA_SCRIPT)
+            allowed, wait_ms = await self._script(keys=[f"ratelimit:{self.name}:{key}"],
+                                                  args=[self._interval_ms, self.limit], client=redis)
+        except RedisError as e:
+            _logger.warning("Redis 限流不可用，使用本地令牌桶: %s", e)
+            return decision
+        if not allowed:
+            _REJECTED.labels(self.name, "redis").inc()
+            return RateLimitDecision(False, int(wait_ms) / 1000)
+        return decision
+
+    async def check(self, key: str):
+        """
+        超限时抛出 RateLimitExceeded（429，带 Retry-After）
+        """
+        decision = await self.hit(key)
+        if not decision.allowed:
+            raise RateLimitExceeded(decision.retry_after)
+
+
+class RateLimitMiddleware:
+    """
+    按客户端 IP 限流的 ASGI 中间件，在路由、请求体解析之前拒绝请求
+
+    需要放在 ProxyHeadersMiddleware 内层，以使用解析后的真实客户端 IP
+    """
+
+    def __init__(self, app: ASGIApp, rules: Dict[Tuple[str, str], RateLimiter]):
+        """
+        :param rules: {(method, path): limiter}
+        """
+        self.app = app
+        self.rules = rules
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] == "http":
+            limiter = self.rules.get((scope["method"], scope["path"]))
+            if limiter is not None:
+                client = scope.get("client")
+                decision = await limiter.hit(client[0] if client else "unknown")
+                if not decision.allowed:
+                    await self._reject(send, decision.retry_after)
+                    return
+        await self.app(scope, receive, send)
+
+    @staticmethod
+    async def _reject(send: Send, retry_after: float):
+        body = orjson.dumps({"detail": "请求过于频繁，请稍后再试"})
+        await send({
+            "type": "http.response.start",
+            "status": 429,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(max(1, math.ceil(retry_after))).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
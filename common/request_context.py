@@ -0,0 +1,45 @@
+import re
+import uuid
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from common.logging_config import request_id_ctx
+
+_VALID_REQUEST_ID = re.compile(r"^[\w\-.:]{1,64}$")
+
+
+class RequestContextMiddleware:
+    """
+    为每个请求设置 request_id（优先使用上游传入的 X-Request-ID），写入日志上下文并在响应头中返回
+    """
+
+    def __init__(self, app: ASGIApp, header: str = "x-request-id"):
+        self.app = app
+        self.header = header.lower().encode()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+
+        request_id = None
+        for name, value in scope["headers"]:
+            if name == self.header:
+                value = value.decode("latin-1")
+                # 拒绝异常值，防止日志注入
+                if _VALID_REQUEST_ID.match(value):
+                    request_id = value
+                break
+        request_id = request_id or uuid.uuid4().hex
+        raw_request_id = request_id.encode()
+
+        async def send_wrapper(message: Message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [(self.header, raw_request_id)]
+            await send(message)
+
+        token = request_id_ctx.set(request_id)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            request_id_ctx.reset(token)
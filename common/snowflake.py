@@ -0,0 +1,218 @@
+"""
+Snowflake 风格的分布式 ID：进程内分配，不需要访问数据库序列
+
+    | 41 位毫秒时间戳（自 EPOCH 起，约 69 年） | 7 位 worker id | 5 位毫秒内序号 |
+
+- 总长 53 位，存入 BIGINT；JSON 中作为数字传给浏览器时不会丢失精度（Number.MAX_SAFE_INTEGER = 2^53 - 1）
+- 同一进程内严格递增，不同进程之间按毫秒时间排序，可直接用于 keyset 分页
+- 只在事件循环线程中调用，生成过程中没有 await，不需要加锁
+- 同一毫秒内的序号用完、或系统时钟回拨时，借用下一毫秒继续分配而不是等待，ID 仍然单调递增
+
+worker id 由 WorkerIdLease 通过 Redis 租约分配，保证同一时刻不会有两个进程使用同一个 worker id
+"""
+import asyncio
+import logging
+import os
+import random
+import socket
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Callable, Optional
+
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+from common.exceptions import ServiceException
+from common.metrics import REGISTRY
+
+_logger = logging.getLogger(__name__)
+
+# 2026-01-01T00:00:00Z
+EPOCH_MS = 1767225600000
+WORKER_ID_BITS = 7
+SEQUENCE_BITS = 5
+MAX_WORKER_ID = (1 << WORKER_ID_BITS) - 1
+MAX_SEQUENCE = (1 << SEQUENCE_BITS) - 1
+TIMESTAMP_SHIFT = WORKER_ID_BITS + SEQUENCE_BITS
+# 借用的毫秒数超过该值时输出告警（持续超出每毫秒的分配能力，或时钟回拨）
+DRIFT_WARN_MS = 1000
+
+_BORROWED = REGISTRY.counter("snowflake_borrowed_ms_total", "序号用完或时钟回拨时借用的毫秒数")
+
+# 续期 / 释放租约：只处理自己持有的 key
+_RENEW = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('pexpire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+_RELEASE = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+def _now_ms() -> int:
+    return time.time_ns() // 1_000_000 - EPOCH_MS
+
+
+class SnowflakeGenerator:
+    def __init__(self, worker_id: Optional[int] = None):
+        """
+        :param worker_id: 固定的 worker id；为空时需要先通过 WorkerIdLease 分配
+        """
+        self._worker_id: Optional[int] = None
+        self._last_ms = -1
+        self._sequence = 0
+        if worker_id is not None:
+            self.worker_id = worker_id
+
+    @property
+    def worker_id(self) -> Optional[int]:
+        return self._worker_id
+
+    @worker_id.setter
+    def worker_id(self, worker_id: Optional[int]):
+        if worker_id is not None and not 0 <= worker_id <= MAX_WORKER_ID:
+            raise ValueError(f"worker id 超出范围 0~{MAX_WORKER_ID}: {worker_id}")
+        self._worker_id = worker_id
+
+    def next_id(self) -> int:
+        """
+        :raises ServiceException: 尚未分配 worker id（或租约已失效）
+        """
+        if self._worker_id is None:
+            raise ServiceException("ID 生成器未就绪", 503)
+        now = _now_ms()
+        if now > self._last_ms:
+            self._last_ms = now
+            self._sequence = 0
+        elif self._sequence < MAX_SEQUENCE:
+            self._sequence += 1
+        else:
+            self._last_ms += 1
+            self._sequence = 0
+            _BORROWED.inc()
+            if self._last_ms - now == DRIFT_WARN_MS:
+                _logger.warning("ID 生成器的时间领先系统时钟 %dms", DRIFT_WARN_MS)
+        return (self._last_ms << TIMESTAMP_SHIFT) | (self._worker_id << SEQUENCE_BITS) | self._sequence
+
+    @staticmethod
+    def timestamp(snowflake_id: int) -> datetime:
+        """
+        ID 中的分配时间（毫秒精度，UTC）
+        """
+        return datetime.fromtimestamp(((snowflake_id >> TIMESTAMP_SHIFT) + EPOCH_MS) / 1000, timezone.utc)
+
+    @staticmethod
+    def min_id(moment: datetime) -> int:
+        """
+        不早于 moment 分配的 ID 都大于等于该值，可用于按时间范围过滤
+        """
+        return (int(moment.timestamp() * 1000) - EPOCH_MS) << TIMESTAMP_SHIFT
+
+
+class WorkerIdLease:
+    """
+    通过 Redis 租约分配 worker id：SET NX PX 抢占 {prefix}{worker_id}，每 ttl/3 续期一次。
+    续期失败且租约可能已过期时停止分配 ID（next_id 抛出 503），直到重新获得租约，
+    避免 Redis 恢复后另一个进程拿到同一个 worker id
+    """
+
+    def __init__(self, generator: SnowflakeGenerator, redis_factory: Callable[[], Redis], ttl: float = 30.0,
+                 key_prefix: str = "snowflake:worker:"):
+        """
+        :param generator: 由租约设置 worker id 的生成器
+        :param redis_factory: 返回 Redis 客户端
+        :param ttl: 租约有效期（秒）
+        :param key_prefix: Redis key 前缀
+        """
+        self.generator = generator
+        self.redis_factory = redis_factory
+        self.ttl = ttl
+        self.key_prefix = key_prefix
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._worker_id: Optional[int] = None
+        self._expires_at = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    async def acquire(self) -> bool:
+        """
+        从随机位置开始依次尝试抢占空闲的 worker id
+        :return: 是否获得租约
+        """
+        redis = self.redis_factory()
+        start = random.randrange(MAX_WORKER_ID + 1)
+        for i in range(MAX_WORKER_ID + 1):
+            worker_id = (start + i) % (MAX_WORKER_ID + 1)
+            began = time.monotonic()
+            if await redis.set(f"{self.key_prefix}{worker_id}", self.owner, nx=True, px=int(self.ttl * 1000)):
+                self._worker_id = worker_id
+                self._expires_at = began + self.ttl
+                self.generator.worker_id = worker_id
+                _logger.info("已获得 worker id 租约: %d", worker_id)
+                return True
+        _logger.error("没有空闲的 worker id（共 %d 个）", MAX_WORKER_ID + 1)
+        return False
+
+    async def renew(self) -> bool:
+        """
+        :return: 租约是否仍然有效
+        """
+        began = time.monotonic()
+        renewed = await self.redis_factory().eval(_RENEW, 1, f"{self.key_prefix}{self._worker_id}", self.owner,
+                                                  int(self.ttl * 1000))
+        if renewed:
+            self._expires_at = began + self.ttl
+        return bool(renewed)
+
+    async def start(self):
+        """
+        获得租约并启动后台续期；Redis 不可用时在后台重试，期间 next_id 不可用
+        """
+        try:
+            # Redis 地址不可达时连接可能长时间挂起，不能阻塞应用启动
+            await asyncio.wait_for(self.acquire(), self.ttl / 3)
+        except (RedisError, asyncio.TimeoutError) as e:
+            _logger.warning("获取 worker id 租约失败: %r", e)
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self):
+        interval = self.ttl / 3
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                if self._worker_id is None or not await self.renew():
+                    if self._worker_id is not None:
+                        _logger.warning("worker id %d 的租约已失效，重新申请", self._worker_id)
+                    self._lose()
+                    await self.acquire()
+            except RedisError as e:
+                _logger.warning("续期 worker id 租约失败: %s", e)
+            # 下次续期之前租约可能过期时停止分配
+            if self._worker_id is not None and time.monotonic() + interval >= self._expires_at:
+                _logger.error("worker id %d 的租约即将过期，暂停分配 ID", self._worker_id)
+                self._lose()
+
+    def _lose(self):
+        self._worker_id = None
+        self.generator.worker_id = None
+
+    async def close(self):
+        """
+        停止续期并释放租约
+        """
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._worker_id is not None:
+            try:
+                await self.redis_factory().eval(_RELEASE, 1, f"{self.key_prefix}{self._worker_id}", self.owner)
+            except RedisError as e:
+                _logger.warning("释放 worker id 租约失败: %s", e)
+            self._lose()
@@ -0,0 +1,93 @@
+"""
+WebSocket permessage-deflate：可配置窗口大小与压缩阈值
+
+- 每个连接保留一个压缩上下文（context takeover），重复出现的 JSON 字段名、中文文本在后续消息中只需引用
+- 小于阈值的消息不压缩（RFC 7692 允许逐条消息选择是否压缩，RSV1 置 0 即为未压缩）；
+  共享上下文时几十字节的 typing 帧也能压缩到约 1/6，阈值调大只节省 CPU，会明显增加流量
+  （见 benchmarks/bench_ws_compression.py）
+- 压缩上下文内存约为 2^(window_bits+2) + 2^(mem_level+9) 字节，默认 12 / 5 时每个连接约 32KB
+
+环境变量：
+WS_DEFLATE: 是否启用，默认 true
+WS_DEFLATE_WINDOW_BITS: 服务端与客户端的最大窗口（8~15），默认 12
+WS_DEFLATE_MEM_LEVEL: zlib memLevel（1~9），默认 5
+WS_DEFLATE_LEVEL: zlib 压缩级别（1~9），默认 6
+WS_DEFLATE_THRESHOLD: 小于该字节数的消息不压缩，默认 32
+WS_MAX_FRAME_BYTES: 收发消息的最大字节数，默认 1MB
+"""
+import os
+
+from uvicorn.protocols.websockets.websockets_sansio_impl import WebSocketsSansIOProtocol
+from websockets import frames
+from websockets.extensions.permessage_deflate import PerMessageDeflate, ServerPerMessageDeflateFactory
+
+WS_DEFLATE = os.getenv("WS_DEFLATE", "true") == "true"
+WS_DEFLATE_WINDOW_BITS = int(os.getenv("WS_DEFLATE_WINDOW_BITS", 12))
+WS_DEFLATE_MEM_LEVEL = int(os.getenv("WS_DEFLATE_MEM_LEVEL", 5))
+WS_DEFLATE_LEVEL = int(os.getenv("WS_DEFLATE_LEVEL", 6))
+WS_DEFLATE_THRESHOLD = int(os.getenv("WS_DEFLATE_THRESHOLD", 32))
+WS_MAX_FRAME_BYTES = int(os.getenv("WS_MAX_FRAME_BYTES", 1024 * 1024))
+
+
+class ThresholdPerMessageDeflate(PerMessageDeflate):
+    """
+    小于 threshold 字节的消息原样发送，不经过压缩上下文
+    """
+
+    def __init__(self, *args, threshold: int = WS_DEFLATE_THRESHOLD, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.threshold = threshold
+        # 分片消息的首帧未压缩时，后续分片也不压缩
+        self.skip_cont_data = False
+
+    def encode(self, frame: frames.Frame) -> frames.Frame:
+        if frame.opcode in frames.CTRL_OPCODES:
+            return frame
+        if frame.opcode is frames.Opcode.CONT:
+            if self.skip_cont_data:
+                self.skip_cont_data = not frame.fin
+                return frame
+        elif len(frame.data) < self.threshold:
+            self.skip_cont_data = not frame.fin
+            return frame
+        return super().encode(frame)
+
+
+class ThresholdPerMessageDeflateFactory(ServerPerMessageDeflateFactory):
+    def __init__(self, threshold: int = WS_DEFLATE_THRESHOLD, **kwargs):
+        super().__init__(**kwargs)
+        self.threshold = threshold
+
+    def process_request_params(self, params, accepted_extensions):
+        response_params, extension = super().process_request_params(params, accepted_extensions)
+        return response_params, ThresholdPerMessageDeflate(
+            extension.remote_no_context_takeover,
+            extension.local_no_context_takeover,
+            extension.remote_max_window_bits,
+            extension.local_max_window_bits,
+            extension.compress_settings,
+            threshold=self.threshold,
+        )
+
+
+def deflate_factory(window_bits: int = WS_DEFLATE_WINDOW_BITS, mem_level: int = WS_DEFLATE_MEM_LEVEL,
+                    level: int = WS_DEFLATE_LEVEL,
+                    threshold: int = WS_DEFLATE_THRESHOLD) -> ThresholdPerMessageDeflateFactory:
+    return ThresholdPerMessageDeflateFactory(
+        threshold=threshold,
+        server_max_window_bits=window_bits,
+        client_max_window_bits=window_bits,
+        compress_settings={"memLevel": mem_level, "level": level},
+    )
+
+
+class CompressedWebSocketProtocol(WebSocketsSansIOProtocol):
+    """
+    uvicorn WebSocket 协议：使用上面的 permessage-deflate 配置（uvicorn 自带的配置不可调整）
+
+        uvicorn.Config(app, ws=CompressedWebSocketProtocol, ws_max_size=WS_MAX_FRAME_BYTES)
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.conn.available_extensions = [deflate_factory()] if WS_DEFLATE else []
@@ -1,4 +1,5 @@
 import logging
+import os
 
 from dotenv import load_dotenv
 from fastapi import FastAPI
@@ -6,27 +7,44 @@ from fastapi.middleware.cors import CORSMiddleware
 from starlette.requests import Request
 from uvicorn.middleware.proxy_headers import ProxyHeadersMiddleware
 
+from common.asgi_metrics import MetricsMiddleware
 from common.encoder import CustomJSONResponse
 from common.logging_config import init_logging
+from common.rate_limit import RateLimitMiddleware
+from common.request_context import RequestContextMiddleware
 
 load_dotenv()
 init_logging()
 
 _logger = logging.getLogger(__name__)
 
-app = FastAPI(default_response_class=CustomJSONResponse)
+from app.core.lifespan import lifespan
+
+app = FastAPI(default_response_class=CustomJSONResponse, lifespan=lifespan)
 from app.routers.chat_router import router as chat_router
+from app.routers.meet_router import router as meet_router
+from app.routers.metrics_router import router as metrics_router
 from app.routers.user_router import router as user_router
+from app.core.rate_limits import IP_RATE_LIMIT_RULES
 
 app.include_router(chat_router)
+app.include_router(meet_router)
 app.include_router(user_router)
-app.add_middleware(ProxyHeadersMiddleware, trusted_hosts="*")
+app.include_router(metrics_router)
+# 限流需要使用 ProxyHeadersMiddleware 解析后的客户端 IP，因此放在其内层（先添加）
+app.add_middleware(RateLimitMiddleware, rules=IP_RATE_LIMIT_RULES)
+# 只信任来自这些地址的 X-Forwarded-For（逗号分隔，与 uvicorn 的 FORWARDED_ALLOW_IPS 一致），
+# 否则客户端可以伪造 IP 绕过按 IP 限流
+app.add_middleware(ProxyHeadersMiddleware, trusted_hosts=os.getenv("FORWARDED_ALLOW_IPS", "127.0.0.1"))
+app.add_middleware(RequestContextMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# 最外层，被限流拒绝、CORS 预检的请求也会被统计
+app.add_middleware(MetricsMiddleware)
 
 
 @app.get("/")
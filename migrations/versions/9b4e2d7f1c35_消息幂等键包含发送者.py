@@ -0,0 +1,46 @@
+"""消息幂等键包含发送者
+
+Revision ID: 9b4e2d7f1c35
+Revises: d6f1a3b9c702
+Create Date: 2026-10-19 21:05:12.447190
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9b4e2d7f1c35'
+down_revision: Union[str, Sequence[str], None] = 'd6f1a3b9c702'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # clientMessageId 只在同一发送者内唯一，幂等键改为 (conversation_id, user_id, msg_id)
+    op.add_column('chat_message_key', sa.Column('user_id', sa.BigInteger(), nullable=True))
+    op.execute("""
+        UPDATE chat_message_key k SET user_id = m.user_id
+        FROM chat_message m
+        WHERE m.id = k.message_id AND m.created_at = k.created_at
+    """)
+    # 消息已归档的幂等键无法确定发送者，删除后同一 clientMessageId 重发会写入新消息
+    op.execute("DELETE FROM chat_message_key WHERE user_id IS NULL")
+    op.alter_column('chat_message_key', 'user_id', nullable=False)
+    op.drop_constraint('chat_message_key_pkey', 'chat_message_key', type_='primary')
+    op.create_primary_key('chat_message_key_pkey', 'chat_message_key', ['conversation_id', 'user_id', 'msg_id'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # 不同发送者使用了相同 clientMessageId 时只保留最早的一条
+    op.execute("""
+        DELETE FROM chat_message_key a USING chat_message_key b
+        WHERE a.conversation_id = b.conversation_id AND a.msg_id = b.msg_id AND a.message_id > b.message_id
+    """)
+    op.drop_constraint('chat_message_key_pkey', 'chat_message_key', type_='primary')
+    op.create_primary_key('chat_message_key_pkey', 'chat_message_key', ['conversation_id', 'msg_id'])
+    op.drop_column('chat_message_key', 'user_id')
@@ -0,0 +1,33 @@
+"""用户搜索索引
+
+Revision ID: b3e1c07f9a21
+Revises: 0c8e0469842d
+Create Date: 2026-10-19 10:12:41.218350
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b3e1c07f9a21'
+down_revision: Union[str, Sequence[str], None] = '0c8e0469842d'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    op.create_index('ix_t_user_name_trgm', 't_user', ['name'], unique=False, postgresql_using='gin',
+                    postgresql_ops={'name': 'gin_trgm_ops'})
+    op.create_index('ix_t_user_email_trgm', 't_user', ['email'], unique=False, postgresql_using='gin',
+                    postgresql_ops={'email': 'gin_trgm_ops'})
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_t_user_email_trgm', table_name='t_user', postgresql_using='gin')
+    op.drop_index('ix_t_user_name_trgm', table_name='t_user', postgresql_using='gin')
@@ -0,0 +1,96 @@
+"""登录日志按月分区
+
+Revision ID: c4d2a8e61f37
+Revises: b3e1c07f9a21
+Create Date: 2026-10-19 14:05:22.537904
+
+"""
+from datetime import date
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c4d2a8e61f37'
+down_revision: Union[str, Sequence[str], None] = 'b3e1c07f9a21'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# 预先创建的未来分区月数
+MONTHS_AHEAD = 3
+
+
+def _add_months(day: date, months: int) -> date:
+    month = day.month - 1 + months
+    return date(day.year + month // 12, month % 12 + 1, 1)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute("ALTER TABLE user_login_log RENAME TO user_login_log_old")
+    op.execute("ALTER TABLE user_login_log_old RENAME CONSTRAINT user_login_log_pkey TO user_login_log_old_pkey")
+    # 复用原有序列，删除旧表时不能级联删除
+    op.execute("ALTER SEQUENCE user_login_log_id_seq OWNED BY NONE")
+    op.execute("""
+        CREATE TABLE user_login_log (
+            user_id BIGINT REFERENCES t_user (id),
+            ip_addr VARCHAR(39),
+            login_time TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT now(),
+            id BIGINT NOT NULL DEFAULT nextval('user_login_log_id_seq'),
+            created_at TIMESTAMP WITH TIME ZONE DEFAULT now(),
+            updated_at TIMESTAMP WITH TIME ZONE,
+            CONSTRAINT user_login_log_pkey PRIMARY KEY (id, login_time)
+        ) PARTITION BY RANGE (login_time)
+    """)
+    op.execute("ALTER SEQUENCE user_login_log_id_seq OWNED BY user_login_log.id")
+
+    # 为历史数据所在月份到未来 MONTHS_AHEAD 个月创建分区
+    first = op.get_bind().execute(sa.text(
+        "SELECT min(coalesce(login_time, created_at::timestamp)) FROM user_login_log_old"
+    )).scalar()
+    current = date.today().replace(day=1)
+    month = min(first.date().replace(day=1), current) if first else current
+    while month <= _add_months(current, MONTHS_AHEAD):
+        upper = _add_months(month, 1)
+        op.execute(f"CREATE TABLE user_login_log_p{month:%Y%m} PARTITION OF user_login_log "
+                   f"FOR VALUES FROM ('{month.isoformat()}') TO ('{upper.isoformat()}')")
+        month = upper
+    # 兜底分区：分区维护任务未及时创建时写入这里，不会导致登录日志写入失败
+    op.execute("CREATE TABLE user_login_log_default PARTITION OF user_login_log DEFAULT")
+    op.create_index('ix_user_login_log_user_time', 'user_login_log', ['user_id', 'login_time'], unique=False)
+
+    op.execute("""
+        INSERT INTO user_login_log (user_id, ip_addr, login_time, id, created_at, updated_at)
+        SELECT user_id, ip_addr, coalesce(login_time, created_at::timestamp, now()), id, created_at, updated_at
+        FROM user_login_log_old
+    """)
+    op.drop_table('user_login_log_old')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("ALTER TABLE user_login_log RENAME TO user_login_log_partitioned")
+    op.execute("ALTER TABLE user_login_log_partitioned "
+               "RENAME CONSTRAINT user_login_log_pkey TO user_login_log_partitioned_pkey")
+    op.execute("ALTER INDEX ix_user_login_log_user_time RENAME TO ix_user_login_log_partitioned_user_time")
+    op.execute("ALTER SEQUENCE user_login_log_id_seq OWNED BY NONE")
+    op.execute("""
+        CREATE TABLE user_login_log (
+            user_id BIGINT REFERENCES t_user (id),
+            ip_addr VARCHAR(39),
+            login_time TIMESTAMP WITHOUT TIME ZONE DEFAULT now(),
+            id BIGINT NOT NULL DEFAULT nextval('user_login_log_id_seq'),
+            created_at TIMESTAMP WITH TIME ZONE DEFAULT now(),
+            updated_at TIMESTAMP WITH TIME ZONE,
+            CONSTRAINT user_login_log_pkey PRIMARY KEY (id)
+        )
+    """)
+    op.execute("ALTER SEQUENCE user_login_log_id_seq OWNED BY user_login_log.id")
+    op.execute("""
+        INSERT INTO user_login_log (user_id, ip_addr, login_time, id, created_at, updated_at)
+        SELECT user_id, ip_addr, login_time, id, created_at, updated_at FROM user_login_log_partitioned
+    """)
+    # 删除分区表会同时删除全部分区
+    op.drop_table('user_login_log_partitioned')
@@ -0,0 +1,169 @@
+"""消息按月分区与归档
+
+Revision ID: d6f1a3b9c702
+Revises: a5c9e2f71b48
+Create Date: 2026-10-19 20:13:47.902315
+
+"""
+from datetime import date, datetime, timezone
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd6f1a3b9c702'
+down_revision: Union[str, Sequence[str], None] = 'a5c9e2f71b48'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# 预先创建的未来分区月数
+MONTHS_AHEAD = 3
+
+
+def _add_months(day: date, months: int) -> date:
+    month = day.month - 1 + months
+    return date(day.year + month // 12, month % 12 + 1, 1)
+
+
+def _create_search_indexes_and_trigger():
+    op.create_index('ix_chat_message_search_vector', 'chat_message', ['search_vector'], unique=False,
+                    postgresql_using='gin')
+    op.create_index('ix_chat_message_content_trgm', 'chat_message', ['content'], unique=False,
+                    postgresql_using='gin', postgresql_ops={'content': 'gin_trgm_ops'})
+    op.execute("""
+        CREATE TRIGGER chat_message_search_vector_trigger
+        BEFORE INSERT OR UPDATE OF content, kind ON chat_message
+        FOR EACH ROW EXECUTE FUNCTION chat_message_search_vector_update()
+    """)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute("ALTER TABLE chat_message RENAME TO chat_message_old")
+    op.execute("ALTER TABLE chat_message_old RENAME CONSTRAINT chat_message_pkey TO chat_message_old_pkey")
+    op.execute("DROP TRIGGER chat_message_search_vector_trigger ON chat_message_old")
+    op.drop_index('ix_chat_message_content_trgm', table_name='chat_message_old', postgresql_using='gin')
+    op.drop_index('ix_chat_message_search_vector', table_name='chat_message_old', postgresql_using='gin')
+    # 复用原有序列，删除旧表时不能级联删除
+    op.execute("ALTER SEQUENCE chat_message_id_seq OWNED BY NONE")
+    op.execute("""
+        CREATE TABLE chat_message (
+            conversation_id BIGINT,
+            user_id BIGINT,
+            content VARCHAR NOT NULL,
+            msg_id VARCHAR NOT NULL,
+            kind VARCHAR(16) NOT NULL DEFAULT 'text',
+            search_vector TSVECTOR,
+            id BIGINT NOT NULL DEFAULT nextval('chat_message_id_seq'),
+            created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+            updated_at TIMESTAMP WITH TIME ZONE,
+            CONSTRAINT chat_message_pkey PRIMARY KEY (id, created_at),
+            -- 旧表（或各个分区）上仍有同名外键，不显式命名时会自动加上数字后缀
+            CONSTRAINT chat_message_conversation_id_fkey
+                FOREIGN KEY (conversation_id) REFERENCES chat_conversation (id),
+            CONSTRAINT chat_message_user_id_fkey FOREIGN KEY (user_id) REFERENCES t_user (id)
+        ) PARTITION BY RANGE (created_at)
+    """)
+    op.execute("ALTER SEQUENCE chat_message_id_seq OWNED BY chat_message.id")
+
+    # 为历史数据所在月份到未来 MONTHS_AHEAD 个月创建分区，边界为 UTC 月初
+    first = op.get_bind().execute(sa.text("SELECT min(created_at) FROM chat_message_old")).scalar()
+    current = datetime.now(timezone.utc).date().replace(day=1)
+    month = min(first.astimezone(timezone.utc).date().replace(day=1), current) if first else current
+    while month <= _add_months(current, MONTHS_AHEAD):
+        upper = _add_months(month, 1)
+        op.execute(f"CREATE TABLE chat_message_p{month:%Y%m} PARTITION OF chat_message "
+                   f"FOR VALUES FROM ('{month.isoformat()} 00:00:00+00') TO ('{upper.isoformat()} 00:00:00+00')")
+        month = upper
+    # 兜底分区：分区维护任务未及时创建时写入这里，不会导致消息写入失败
+    op.execute("CREATE TABLE chat_message_default PARTITION OF chat_message DEFAULT")
+    # 历史消息按会话、时间倒序分页
+    op.create_index('ix_chat_message_conversation_time', 'chat_message', ['conversation_id', 'created_at', 'id'],
+                    unique=False)
+    _create_search_indexes_and_trigger()
+
+    # 分区表上的唯一索引必须包含分区键，(conversation_id, msg_id) 幂等键改为单独的表
+    op.create_table('chat_message_key',
+                    sa.Column('conversation_id', sa.BigInteger(), nullable=False),
+                    sa.Column('msg_id', sa.String(), nullable=False),
+                    sa.Column('message_id', sa.BigInteger(), nullable=False),
+                    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'),
+                              nullable=False),
+                    sa.PrimaryKeyConstraint('conversation_id', 'msg_id')
+                    )
+    op.create_index('ix_chat_message_key_created_at', 'chat_message_key', ['created_at'], unique=False)
+    # 已导出为 Parquet 并从分区表中移除的分区
+    op.create_table('chat_message_archive',
+                    sa.Column('partition_name', sa.String(), nullable=False),
+                    sa.Column('range_start', sa.DateTime(timezone=True), nullable=False),
+                    sa.Column('range_end', sa.DateTime(timezone=True), nullable=False),
+                    sa.Column('location', sa.String(), nullable=False),
+                    sa.Column('row_count', sa.BigInteger(), nullable=False),
+                    sa.Column('size_bytes', sa.BigInteger(), nullable=False),
+                    sa.Column('id', sa.BigInteger(), autoincrement=True, nullable=False),
+                    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'),
+                              nullable=True),
+                    sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True),
+                    sa.PrimaryKeyConstraint('id'),
+                    sa.UniqueConstraint('partition_name')
+                    )
+
+    # search_vector 由触发器重新计算
+    op.execute("""
+        INSERT INTO chat_message (conversation_id, user_id, content, msg_id, kind, id, created_at, updated_at)
+        SELECT conversation_id, user_id, content, msg_id, kind, id, coalesce(created_at, now()), updated_at
+        FROM chat_message_old
+    """)
+    op.execute("""
+        INSERT INTO chat_message_key (conversation_id, msg_id, message_id, created_at)
+        SELECT conversation_id, msg_id, id, coalesce(created_at, now()) FROM chat_message_old
+        WHERE conversation_id IS NOT NULL
+    """)
+    op.drop_table('chat_message_old')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # 已归档的消息只存在于 Parquet 文件中，不会写回
+    op.execute("ALTER TABLE chat_message RENAME TO chat_message_partitioned")
+    op.execute("ALTER TABLE chat_message_partitioned "
+               "RENAME CONSTRAINT chat_message_pkey TO chat_message_partitioned_pkey")
+    op.execute("DROP TRIGGER chat_message_search_vector_trigger ON chat_message_partitioned")
+    op.drop_index('ix_chat_message_content_trgm', table_name='chat_message_partitioned', postgresql_using='gin')
+    op.drop_index('ix_chat_message_search_vector', table_name='chat_message_partitioned', postgresql_using='gin')
+    op.execute("ALTER INDEX ix_chat_message_conversation_time RENAME TO ix_chat_message_partitioned_conversation_time")
+    op.execute("ALTER SEQUENCE chat_message_id_seq OWNED BY NONE")
+    op.execute("""
+        CREATE TABLE chat_message (
+            conversation_id BIGINT,
+            user_id BIGINT,
+            content VARCHAR NOT NULL,
+            msg_id VARCHAR NOT NULL,
+            kind VARCHAR(16) NOT NULL DEFAULT 'text',
+            search_vector TSVECTOR,
+            id BIGINT NOT NULL DEFAULT nextval('chat_message_id_seq'),
+            created_at TIMESTAMP WITH TIME ZONE DEFAULT now(),
+            updated_at TIMESTAMP WITH TIME ZONE,
+            CONSTRAINT chat_message_pkey PRIMARY KEY (id),
+            -- 旧表（或各个分区）上仍有同名外键，不显式命名时会自动加上数字后缀
+            CONSTRAINT chat_message_conversation_id_fkey
+                FOREIGN KEY (conversation_id) REFERENCES chat_conversation (id),
+            CONSTRAINT chat_message_user_id_fkey FOREIGN KEY (user_id) REFERENCES t_user (id)
+        )
+    """)
+    op.execute("ALTER SEQUENCE chat_message_id_seq OWNED BY chat_message.id")
+    op.execute("""
+        INSERT INTO chat_message (conversation_id, user_id, content, msg_id, kind, search_vector, id, created_at,
+                                  updated_at)
+        SELECT conversation_id, user_id, content, msg_id, kind, search_vector, id, created_at, updated_at
+        FROM chat_message_partitioned
+    """)
+    op.create_index('uq_chat_message_conversation_msg', 'chat_message', ['conversation_id', 'msg_id'], unique=True)
+    _create_search_indexes_and_trigger()
+    op.drop_table('chat_message_archive')
+    op.drop_index('ix_chat_message_key_created_at', table_name='chat_message_key')
+    op.drop_table('chat_message_key')
+    # 删除分区表会同时删除全部分区
+    op.drop_table('chat_message_partitioned')
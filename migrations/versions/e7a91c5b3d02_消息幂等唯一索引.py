@@ -0,0 +1,35 @@
+"""消息幂等唯一索引
+
+Revision ID: e7a91c5b3d02
+Revises: c4d2a8e61f37
+Create Date: 2026-10-19 15:42:10.318204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e7a91c5b3d02'
+down_revision: Union[str, Sequence[str], None] = 'c4d2a8e61f37'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('chat_message', sa.Column('kind', sa.String(length=16), server_default='text', nullable=False))
+    # 已有的重复消息只保留最早的一条
+    op.execute(
+        "DELETE FROM chat_message a USING chat_message b "
+        "WHERE a.conversation_id = b.conversation_id AND a.msg_id = b.msg_id AND a.id > b.id"
+    )
+    op.create_index('uq_chat_message_conversation_msg', 'chat_message', ['conversation_id', 'msg_id'], unique=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('uq_chat_message_conversation_msg', table_name='chat_message')
+    op.drop_column('chat_message', 'kind')
@@ -0,0 +1,32 @@
+"""会话成员已读位置
+
+Revision ID: f3b8d20c6a14
+Revises: e7a91c5b3d02
+Create Date: 2026-10-19 16:20:37.904126
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f3b8d20c6a14'
+down_revision: Union[str, Sequence[str], None] = 'e7a91c5b3d02'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('chat_conversation_member', sa.Column('last_read_message_id', sa.BigInteger(), nullable=True))
+    # 批量更新已读位置时按 (conversation_id, user_id) 定位成员
+    op.create_index('ix_chat_conversation_member_conversation_user', 'chat_conversation_member',
+                    ['conversation_id', 'user_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_chat_conversation_member_conversation_user', table_name='chat_conversation_member')
+    op.drop_column('chat_conversation_member', 'last_read_message_id')
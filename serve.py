@@ -0,0 +1,202 @@
+"""
+生产环境启动入口：多进程 uvicorn，优雅退出
+
+    python serve.py --host 0.0.0.0 --port 8000
+    python serve.py --workers 4 --reuse-port
+
+- 进程数默认等于容器 CPU 配额（cgroup），可通过 --workers 或 WEB_CONCURRENCY 指定
+- 安装了 uvloop / httptools 时自动使用
+- WebSocket 启用 permessage-deflate，小消息不压缩（WS_DEFLATE_* 环境变量）
+- --reuse-port：每个进程各自绑定端口（SO_REUSEPORT），由内核分配连接，否则共享主进程的监听 socket
+- --metrics-port：指标保存在各 worker 进程内，应用端口上的 /metrics 会落到任意 worker；
+  设置后第 i 个 worker 在 metrics-port + i 上提供 /metrics，指标带 worker="i" label，Prometheus 逐个抓取
+- SIGTERM：停止接受新连接 -> 以 1012 关闭 WebSocket -> 等待存量请求（GRACEFUL_TIMEOUT 秒）
+  -> lifespan 关闭（写入待落库队列、释放 Redis 与数据库连接池）
+"""
+import argparse
+import asyncio
+import importlib.util
+import logging
+import math
+import multiprocessing
+import os
+import signal
+import socket
+import time
+from typing import List, Optional
+
+import uvicorn
+
+from common.ws_compression import CompressedWebSocketProtocol, WS_MAX_FRAME_BYTES
+
+_logger = logging.getLogger("serve")
+
+GRACEFUL_TIMEOUT = int(os.getenv("GRACEFUL_TIMEOUT", 30))
+
+
+def cpu_quota() -> int:
+    """
+    容器 CPU 配额（向上取整），未限制时为可用 CPU 数
+    """
+    available = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+    quota = None
+    try:
+        # cgroup v2: "max 100000" 或 "200000 100000"
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            limit, period = f.read().split()
+            if limit != "max":
+                quota = int(limit) / int(period)
+    except (OSError, ValueError):
+        try:
+            # cgroup v1
+            with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as f:
+                limit = int(f.read())
+            with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as f:
+                period = int(f.read())
+            if limit > 0:
+                quota = limit / period
+        except (OSError, ValueError):
+            pass
+    if quota is None:
+        return available
+    return max(1, min(available, math.ceil(quota)))
+
+
+def bind_socket(host: str, port: int, reuse_port: bool) -> socket.socket:
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuse_port:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    sock.set_inheritable(True)
+    return sock
+
+
+class DrainingServer(uvicorn.Server):
+    """
+    在 uvicorn 等待存量连接结束之前，先由应用主动关闭 WebSocket
+    """
+
+    async def shutdown(self, sockets: Optional[List[socket.socket]] = None):
+        for server in self.servers:
+            server.close()
+        for sock in sockets or []:
+            sock.close()
+        from app.core.lifespan import drain
+        from common.logging_config import flush_logging
+
+        try:
+            await asyncio.wait_for(drain(), timeout=self.config.timeout_graceful_shutdown)
+        except Exception:
+            _logger.exception("drain 失败")
+        await super().shutdown(sockets)
+        # uvicorn 退出时会重新抛出捕获的 SIGTERM，进程直接结束而不执行 atexit，这里先输出队列中的日志
+        flush_logging()
+
+
+def build_config(args) -> uvicorn.Config:
+    return uvicorn.Config(
+        "main:app",
+        loop="uvloop" if importlib.util.find_spec("uvloop") else "asyncio",
+        http="httptools" if importlib.util.find_spec("httptools") else "h11",
+        # permessage-deflate 窗口与压缩阈值见 common/ws_compression.py
+        ws=CompressedWebSocketProtocol,
+        ws_max_size=WS_MAX_FRAME_BYTES,
+        lifespan="on",
+        access_log=args.access_log,
+        timeout_graceful_shutdown=GRACEFUL_TIMEOUT,
+        timeout_keep_alive=args.keep_alive,
+        backlog=args.backlog,
+    )
+
+
+def run_worker(args, sock: Optional[socket.socket], index: int = 0):
+    # 在 worker 进程中设置，由 lifespan 读取（worker 重启后沿用原序号，指标端口不变）
+    os.environ["WORKER_INDEX"] = str(index)
+    if args.metrics_port:
+        os.environ["WORKER_METRICS_PORT"] = str(args.metrics_port + index)
+        os.environ.setdefault("METRICS_HOST", args.host)
+    if sock is None:
+        sock = bind_socket(args.host, args.port, reuse_port=True)
+    config = build_config(args)
+    DrainingServer(config).run(sockets=[sock])
+
+
+class Supervisor:
+    """
+    主进程：启动 worker，异常退出时重启；收到 SIGTERM/SIGINT 后通知 worker 优雅退出，超时强制结束
+    """
+
+    def __init__(self, args):
+        self.args = args
+        self.context = multiprocessing.get_context("spawn")
+        self.sock = None if args.reuse_port else bind_socket(args.host, args.port, reuse_port=False)
+        self.processes: List[multiprocessing.Process] = []
+        self.should_exit = False
+        self.exit_signal: Optional[int] = None
+
+    def _spawn(self, index: int) -> multiprocessing.Process:
+        process = self.context.Process(target=run_worker, args=(self.args, self.sock, index), daemon=False)
+        process.start()
+        return process
+
+    def _handle_signal(self, signum, _frame):
+        _logger.info("收到信号 %s，开始优雅退出", signal.Signals(signum).name)
+        self.should_exit = True
+        self.exit_signal = signum
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self._handle_signal)
+        signal.signal(signal.SIGINT, self._handle_signal)
+        _logger.info("启动 %d 个 worker，监听 %s:%d（reuse_port=%s）", self.args.workers, self.args.host,
+                     self.args.port, self.args.reuse_port)
+        self.processes = [self._spawn(i) for i in range(self.args.workers)]
+
+        while not self.should_exit:
+            time.sleep(0.5)
+            for i, process in enumerate(self.processes):
+                if not process.is_alive() and not self.should_exit:
+                    _logger.warning("worker %s 退出（exitcode=%s），重新启动", process.pid, process.exitcode)
+                    self.processes[i] = self._spawn(i)
+
+        # 终端 Ctrl+C 的 SIGINT 会同时发给整个进程组，worker 已自行开始退出；
+        # 再次发送信号会让 uvicorn 跳过优雅退出
+        if self.exit_signal != signal.SIGINT:
+            for process in self.processes:
+                if process.is_alive():
+                    os.kill(process.pid, signal.SIGTERM)
+        deadline = time.monotonic() + GRACEFUL_TIMEOUT + 5
+        for process in self.processes:
+            process.join(max(0.0, deadline - time.monotonic()))
+            if process.is_alive():
+                _logger.error("worker %s 未在超时时间内退出，强制结束", process.pid)
+                process.kill()
+                process.join()
+        if self.sock is not None:
+            self.sock.close()
+        _logger.info("已退出")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", 8000)))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", 0)) or cpu_quota())
+    parser.add_argument("--reuse-port", action="store_true", default=os.getenv("REUSE_PORT", "false") == "true")
+    parser.add_argument("--access-log", action="store_true", default=os.getenv("ACCESS_LOG", "false") == "true")
+    parser.add_argument("--keep-alive", type=int, default=int(os.getenv("KEEP_ALIVE", 5)))
+    parser.add_argument("--backlog", type=int, default=int(os.getenv("BACKLOG", 2048)))
+    parser.add_argument("--metrics-port", type=int, default=int(os.getenv("METRICS_PORT", 0)),
+                        help="每个 worker 的指标端口起点（worker i 使用 metrics-port + i），0 表示不单独提供")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s %(process)d: %(message)s")
+    if args.workers == 1:
+        run_worker(args, bind_socket(args.host, args.port, args.reuse_port))
+    else:
+        Supervisor(args).run()
+
+
+if __name__ == '__main__':
+    main()